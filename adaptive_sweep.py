@@ -0,0 +1,50 @@
+'''
+This file plans adaptive sweeps: a coarse linear pass over the whole range, then a dense list sweep
+only where the figures of merit are decided.
+
+Most points of a uniform sweep land on the flat part of the curve below the knee and carry no
+information. After the coarse pass the dense levels are placed
+    around the MPP   to pin down the top of the P-V curve for the parabolic fit
+    around Voc       where the current crosses zero
+    at 0 V           so Isc is measured rather than interpolated
+and the two passes are merged into one curve for analysis (iv_analysis.py).
+
+Authors: Jason Whitney, Amr Mohamed, Prachya Chowdhury
+'''
+
+import numpy as np
+
+ADAPTIVE_COARSE_POINTS = 12
+ADAPTIVE_DENSE_POINTS = 7  # Per refined region
+ADAPTIVE_WINDOW_STEPS = 0.5  # Half-width of a refined region in coarse steps
+
+
+def refinement_levels(coarse_voltage, figures, dense_points=ADAPTIVE_DENSE_POINTS, window_steps=ADAPTIVE_WINDOW_STEPS):
+    # Source levels for the dense pass, sorted in the direction of the coarse sweep and without the
+    # levels the coarse pass already measured. figures holds the coarse pass's mpp_voltage and voc.
+    coarse_voltage = np.asarray(coarse_voltage, dtype=float)
+    low, high = coarse_voltage.min(), coarse_voltage.max()
+    step = (high - low) / max(len(coarse_voltage) - 1, 1)
+    half_width = window_steps * step
+
+    levels = []
+    for centre in (figures.get('mpp_voltage'), figures.get('voc')):
+        if centre is not None and np.isfinite(centre):
+            levels.append(np.linspace(centre - half_width, centre + half_width, dense_points))
+    if low <= 0 <= high:
+        levels.append([0.0])
+    if not levels:
+        return np.empty(0)
+
+    levels = np.unique(np.round(np.clip(np.concatenate(levels), low, high), 6))
+    already_measured = np.isclose(levels[:, None], coarse_voltage[None, :], atol=step * 1e-3).any(axis=1)
+    levels = levels[~already_measured]
+    return levels if coarse_voltage[0] <= coarse_voltage[-1] else levels[::-1]
+
+
+def merge_sweeps(voltage, current, dense_voltage, dense_current):
+    # One curve sorted by voltage; where both passes measured the same level the dense pass wins
+    voltage = np.concatenate([dense_voltage, voltage])
+    current = np.concatenate([dense_current, current])
+    voltage, index = np.unique(voltage, return_index=True)
+    return voltage, current[index]
@@ -0,0 +1,83 @@
+'''
+This file decides when a full-auto run takes a baseline (reference) measurement and normalizes
+pixel results against the most recent one.
+
+A baseline is taken at the start of the run and then whenever one of the configured triggers fires:
+    every_n_pixels   after this many pixels (0 means once per run, 1 is a baseline before every pixel)
+    max_age_s        when the cached baseline is older than this many seconds
+    drift_threshold  when two consecutive baselines differ in Isc (which tracks the lamp intensity) by
+                     more than this fraction, a baseline is taken before every pixel until the lamp is
+                     stable again
+
+The decision is made when a measurement is scheduled (pixel_scheduled/baseline_scheduled), while
+record_baseline and normalize run when its data is processed, which in a pipelined run can be a
+step later.
+
+Authors: Jason Whitney, Amr Mohamed, Prachya Chowdhury
+'''
+
+import time
+
+
+class BaselinePolicy:
+    def __init__(self, every_n_pixels=1, max_age_s=None, drift_threshold=None):
+        self.every_n_pixels = every_n_pixels
+        self.max_age_s = max_age_s
+        self.drift_threshold = drift_threshold
+        self.start_run()
+
+    def start_run(self):
+        self.current = None  # Cached baseline: label, figures and timestamp
+        self.baselines = []
+        self.pixels_since_baseline = 0  # Pixels scheduled since the last scheduled baseline
+        self.last_scheduled = None  # Time the last baseline was scheduled
+        self.drifting = False
+
+    def end_run(self):
+        # The cached baseline belongs to the run, nothing is normalized against it afterwards
+        self.current = None
+
+    def needs_baseline(self, now=None):
+        now = time.time() if now is None else now
+        if self.last_scheduled is None or self.drifting:
+            return True
+        if self.every_n_pixels and self.pixels_since_baseline >= self.every_n_pixels:
+            return True
+        if self.max_age_s is not None and now - self.last_scheduled >= self.max_age_s:
+            return True
+        return False
+
+    def baseline_scheduled(self, now=None):
+        self.last_scheduled = time.time() if now is None else now
+        self.pixels_since_baseline = 0
+
+    def pixel_scheduled(self):
+        self.pixels_since_baseline += 1
+
+    def record_baseline(self, label, figures, timestamp=None):
+        timestamp = time.time() if timestamp is None else timestamp
+        if self.drift_threshold is not None and self.current is not None:
+            previous_isc = self.current['figures'].get('isc')
+            if previous_isc:
+                drift = abs(figures['isc'] - previous_isc) / abs(previous_isc)
+                self.drifting = drift > self.drift_threshold
+                if self.drifting:
+                    print(f"Baseline drifted by {drift * 100:.1f}%, taking a baseline before every pixel")
+        self.current = {'label': label, 'figures': dict(figures), 'timestamp': timestamp}
+        self.baselines.append(self.current)
+
+    def restore(self, label, figures, timestamp, pixels_since_baseline=0):
+        # Continues a resumed run with the baseline it had cached, without taking a new one
+        self.current = {'label': label, 'figures': dict(figures), 'timestamp': timestamp}
+        self.last_scheduled = timestamp
+        self.pixels_since_baseline = pixels_since_baseline
+
+    def normalize(self, figures):
+        # Adds the cached baseline's label and the pixel's power relative to it to figures
+        if self.current is None:
+            return figures
+        figures['baseline_label'] = self.current['label']
+        baseline_power = self.current['figures'].get('max_power')
+        if baseline_power:
+            figures['normalized_power'] = figures['max_power'] / baseline_power
+        return figures
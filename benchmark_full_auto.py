@@ -0,0 +1,126 @@
+'''
+End-to-end throughput benchmark of full-auto runs against simulated hardware: the simulated
+Keithley 2450 (simulated_instrument.py), AxiDraw and pixel switch (simulated_hardware.py), driven
+through the device layer, FullAutoRun and RunScheduler exactly like syp_program_control.py. The
+switch is driven over a pseudo-terminal with the framed protocol of switch_protocol.py.
+
+Reports pixels/hour, per-stage latency and memory for a pipelined run and for a sequential one.
+time_scale shrinks the simulated instrument and robot delays but not the host-side processing,
+so runs with a small time scale over-state the gain from pipelining.
+
+Usage: python benchmark_full_auto.py [--grid 4x4 --pitch 2.5 | --layout plate.json] [--steps 25] [--adaptive] [--baseline-every 1]
+                                     [--time-scale 1.0] [--mode both] [--tracemalloc]
+'''
+
+import argparse
+import serial
+import resource
+import tempfile
+import time
+import tracemalloc
+import numpy as np
+from measurement_system import MeasurementSystem
+from simulated_instrument import SimulatedSMU
+from simulated_hardware import SimulatedAxiDraw, FakeArduino
+from switch_protocol import PixelSwitch, PROTOCOL_BAUD
+from motion_settle import MotionSettler
+from motion_planner import grid_positions
+from device_layer import DeviceLayer, AxiDrawDriver, PixelSwitchDriver, SmuDriver
+from full_auto_run import FullAutoRun
+from baseline_policy import BaselinePolicy
+from run_scheduler import STAGES
+from pixel_layout import PIXEL_POSITIONS, PIXEL_COMMANDS, PixelLayout
+
+
+def run_full_auto(positions, pipelined, args, save_directory):
+    smu = SimulatedSMU(realtime=True, latency=args.latency, bus_rate=args.bus_rate, time_scale=args.time_scale)
+    mode = 'pipelined' if pipelined else 'sequential'
+    measurement_system = MeasurementSystem(f'SIMULATED::{mode}', ser_port=None, open_resource=lambda address: smu)
+    measurement_system.adaptive = args.adaptive
+    ad = SimulatedAxiDraw(time_scale=args.time_scale)
+    ad.options.speed_penup = args.speed
+    motion = MotionSettler(ad, strategy=args.settle, verbose=False)
+    arduino = FakeArduino(time_scale=args.time_scale)
+    switch = PixelSwitch(serial.Serial(arduino.port, PROTOCOL_BAUD))
+    devices = DeviceLayer(robot=AxiDrawDriver(motion), switch=PixelSwitchDriver(switch),
+                          smu=SmuDriver(measurement_system))
+    full_auto = FullAutoRun(measurement_system, positions, pipelined=pipelined, pixel_commands=PIXEL_COMMANDS)
+    policy = BaselinePolicy(args.baseline_every)
+
+    start = time.monotonic()
+    try:
+        devices.submit(full_auto.job, save_directory, 1.0, 0.0, 0.7, args.steps, policy).result()
+    finally:
+        wall_s = time.monotonic() - start
+        devices.close()
+        measurement_system.close_connections()
+        switch.close()
+        arduino.close()
+    return full_auto.scheduler, wall_s, len(policy.baselines), ad.distance
+
+
+def latency_row(durations):
+    durations = np.asarray(durations) * 1e3
+    if len(durations) == 0:
+        return 0.0, 0.0, 0.0
+    return durations.mean(), np.percentile(durations, 95), durations.max()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--grid', help='ROWSxCOLUMNS grid of pixels instead of the 8-pixel substrate')
+    parser.add_argument('--layout', help='Pixel layout file (see pixel_layout.py) instead of the 8-pixel substrate')
+    parser.add_argument('--pitch', type=float, default=2.5, help='Grid pitch in mm')
+    parser.add_argument('--steps', type=int, default=25, help='Points per sweep')
+    parser.add_argument('--baseline-every', type=int, default=1, help='Baseline every N pixels, 0 = once per run')
+    parser.add_argument('--speed', type=float, default=10, help='AxiDraw speed_penup in percent')
+    parser.add_argument('--settle', choices=['computed', 'query'], default='computed', help='Post-move wait')
+    parser.add_argument('--latency', type=float, default=0.001, help='SMU round-trip time per read in s')
+    parser.add_argument('--bus-rate', type=float, default=1e6, help='SMU link speed in bytes/s')
+    parser.add_argument('--time-scale', type=float, default=1.0, help='Factor applied to every simulated delay')
+    parser.add_argument('--adaptive', action='store_true', help='Coarse plus dense sweeps instead of --steps points')
+    parser.add_argument('--mode', choices=['pipelined', 'sequential', 'both'], default='both')
+    parser.add_argument('--tracemalloc', action='store_true', help='Also report the peak of Python allocations')
+    args = parser.parse_args()
+
+    positions = PIXEL_POSITIONS
+    if args.grid:
+        rows, columns = [int(value) for value in args.grid.lower().split('x')]
+        positions = grid_positions(rows, columns, args.pitch)
+    elif args.layout:
+        positions = PixelLayout.from_file(args.layout).positions
+    modes = [True, False] if args.mode == 'both' else [args.mode == 'pipelined']
+
+    results = []
+    for pipelined in modes:
+        if args.tracemalloc:
+            tracemalloc.start()
+        with tempfile.TemporaryDirectory() as save_directory:
+            scheduler, wall_s, baselines, distance = run_full_auto(positions, pipelined, args, save_directory)
+        peak_mb = None
+        if args.tracemalloc:
+            peak_mb = tracemalloc.get_traced_memory()[1] / 2 ** 20
+            tracemalloc.stop()
+        results.append((pipelined, scheduler, wall_s, baselines, distance, peak_mb))
+
+    sweep = 'adaptive sweeps' if args.adaptive else f'{args.steps} points per sweep'
+    print(f"\n{len(positions)} pixels, {sweep}, baseline every {args.baseline_every}, "
+          f"time scale {args.time_scale}")
+    for pipelined, scheduler, wall_s, baselines, distance, peak_mb in results:
+        pixels_per_hour = len(positions) / wall_s * 3600
+        print(f"\n{'pipelined' if pipelined else 'sequential'}: {wall_s:.1f} s, {pixels_per_hour:.0f} pixels/hour, "
+              f"{baselines} baseline(s), {distance:.0f} mm travelled, {len(scheduler.errors)} error(s)")
+        print(f"  {'stage':<12}{'steps':>6}{'mean (ms)':>12}{'p95 (ms)':>11}{'max (ms)':>11}{'utilization':>13}")
+        summary = scheduler.summary()
+        for stage in STAGES:
+            mean, p95, longest = latency_row(scheduler.durations[stage])
+            print(f"  {stage:<12}{summary[stage]['count']:>6}{mean:>12.1f}{p95:>11.1f}{longest:>11.1f}"
+                  f"{summary[stage]['utilization'] * 100:>12.1f}%")
+        if peak_mb is not None:
+            print(f"  peak Python allocations {peak_mb:.1f} MB")
+    # ru_maxrss is in kB on Linux
+    print(f"\nPeak resident memory of the process: {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.0f} MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+'''
+Compares the time to render and save the I-V and P-V plots with the reusable CurvePlotRenderer
+against creating fresh pyplot figures for every curve.
+
+Usage: python benchmark_plotting.py [--curves 20] [--points 200]
+'''
+
+import argparse
+import os
+import tempfile
+import time
+import numpy as np
+import matplotlib
+matplotlib.use('Agg')
+import matplotlib.pyplot as plt
+from plot_renderer import CurvePlotRenderer, OverlayPlot
+from simulated_instrument import SimulatedSMU
+
+
+def pyplot_render(voltage, current, power, mpp_voltage, max_power, iv_plot_filename, pv_plot_filename):
+    # The per-curve pyplot path plot_and_save used before CurvePlotRenderer
+    plt.figure()
+    plt.plot(voltage, current, label='I-V Curve')
+    plt.xlabel('Voltage (V)')
+    plt.ylabel('Current (A)')
+    plt.title('I-V Characteristics')
+    plt.legend()
+    plt.grid(True)
+    plt.savefig(iv_plot_filename)
+    plt.close()
+
+    plt.figure()
+    plt.plot(voltage, power, label='P-V Curve')
+    plt.scatter(mpp_voltage, max_power, color='red', label='Max Power Point')
+    plt.xlabel('Voltage (V)')
+    plt.ylabel('Power (W)')
+    plt.title('P-V Characteristics')
+    plt.legend()
+    plt.grid(True)
+    plt.savefig(pv_plot_filename)
+    plt.close()
+
+
+def make_curves(count, points):
+    curves = []
+    for index in range(count):
+        smu = SimulatedSMU(isc=0.02 * (1 + 0.05 * index))
+        voltage = np.linspace(0, 0.7, points)
+        current = smu.diode_current(voltage)
+        power = voltage * current
+        mpp_index = np.argmax(power)
+        curves.append((voltage, current, power, voltage[mpp_index], power[mpp_index]))
+    return curves
+
+
+def time_renderer(render, curves, directory):
+    start = time.perf_counter()
+    for index, curve in enumerate(curves):
+        render(*curve, os.path.join(directory, f'IV_{index}.png'), os.path.join(directory, f'PV_{index}.png'))
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--curves', type=int, default=20, help='Number of measurements to plot')
+    parser.add_argument('--points', type=int, default=200, help='Points per curve')
+    args = parser.parse_args()
+
+    curves = make_curves(args.curves, args.points)
+    with tempfile.TemporaryDirectory() as directory:
+        pyplot_time = time_renderer(pyplot_render, curves, directory)
+        renderer_time = time_renderer(CurvePlotRenderer().render, curves, directory)
+
+        overlay = OverlayPlot()
+        for index, (voltage, current, power, _, _) in enumerate(curves):
+            overlay.add(index + 1, voltage, current, power)
+        start = time.perf_counter()
+        overlay.render(os.path.join(directory, 'IV_Overlay.png'), os.path.join(directory, 'PV_Overlay.png'))
+        overlay_time = time.perf_counter() - start
+
+    print(f"{args.curves} curves, {args.points} points each")
+    print(f"pyplot per curve:   {pyplot_time / args.curves * 1e3:8.1f} ms")
+    print(f"renderer per curve: {renderer_time / args.curves * 1e3:8.1f} ms ({pyplot_time / renderer_time:.2f}x)")
+    print(f"run overlay:        {overlay_time * 1e3:8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
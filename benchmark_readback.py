@@ -0,0 +1,56 @@
+'''
+Compares ASCII and binary sweep readback in MeasurementSystem against the simulated SMU.
+
+Usage: python benchmark_readback.py [--points 2000] [--repeats 50] [--bus-rate 1000000] [--chunk-points 1000]
+'''
+
+import argparse
+import time
+import numpy as np
+from measurement_system import MeasurementSystem, READBACK_FORMATS, READBACK_CHUNK_POINTS
+from simulated_instrument import SimulatedSMU
+
+
+def benchmark_format(readback_format, points, repeats, bus_rate, chunk_points):
+    smu = SimulatedSMU(bus_rate=bus_rate)
+    measurement_system = MeasurementSystem(f'SIMULATED::{readback_format}', ser_port=None,
+                                           readback_format=readback_format, chunk_points=chunk_points,
+                                           open_resource=lambda address: smu)
+
+    smu.write(f'SOUR:SWE:VOLT:LIN 0, 0.7, {points}, 0')
+    smu.write(':INIT')
+
+    timings = []
+    for _ in range(repeats):
+        smu.bytes_transferred = 0
+        start = time.perf_counter()
+        with measurement_system.smu:  # Held for the readback, as the measurement code does
+            voltage, current = measurement_system.read_sweep_data()
+        timings.append(time.perf_counter() - start)
+
+    expected = smu.diode_current(voltage)
+    max_error = float(np.max(np.abs(current - expected)))
+    return np.array(timings), smu.bytes_transferred, max_error
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--points', type=int, default=2000, help='Number of sweep points')
+    parser.add_argument('--repeats', type=int, default=50, help='Readbacks per format')
+    parser.add_argument('--bus-rate', type=float, default=None,
+                        help='Simulated link speed in bytes/s (default: no transfer delay, host cost only)')
+    parser.add_argument('--chunk-points', type=int, default=READBACK_CHUNK_POINTS,
+                        help='Points per TRAC:DATA? request for large buffers')
+    args = parser.parse_args()
+
+    print(f"{args.points} points, {args.repeats} repeats")
+    print(f"{'format':<8}{'median (ms)':>14}{'min (ms)':>12}{'bytes':>10}{'max error (A)':>16}")
+    for readback_format in READBACK_FORMATS:
+        timings, transferred, max_error = benchmark_format(readback_format, args.points, args.repeats,
+                                                           args.bus_rate, args.chunk_points)
+        print(f"{readback_format:<8}{np.median(timings) * 1e3:>14.3f}{timings.min() * 1e3:>12.3f}"
+              f"{transferred:>10}{max_error:>16.2e}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+'''
+Throughput benchmark of the SMU pool (smu_pool.py) against simulated Keithley 2450s: the same pixels
+are measured with pools of 1, 2, 4, ... SMUs and the pixels/hour of every pool size are reported.
+
+Usage: python benchmark_smu_pool.py [--pixels 8] [--smus 1 2 4] [--steps 25] [--time-scale 1.0]
+'''
+
+import argparse
+import tempfile
+import time
+import numpy as np
+from smu_pool import SmuPool
+from simulated_instrument import SimulatedSMU
+
+
+def run_pool(smu_count, args, save_directory):
+    addresses = [f'SIMULATED::{smu_count}::{index}' for index in range(smu_count)]
+    instruments = {address: SimulatedSMU(realtime=True, latency=args.latency, time_scale=args.time_scale)
+                   for address in addresses}
+    pool = SmuPool.from_addresses(addresses, range(1, args.pixels + 1), open_resource=instruments.__getitem__)
+    start = time.monotonic()
+    try:
+        results = pool.measure(range(1, args.pixels + 1), save_directory, 1.0, 0.0, 0.7, args.steps, args.step_delay)
+        pool.flush_saves()
+    finally:
+        wall_s = time.monotonic() - start
+        pool.close()
+    return wall_s, results, pool
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--pixels', type=int, default=8, help='Pixels measured per run')
+    parser.add_argument('--smus', type=int, nargs='+', default=[1, 2, 4], help='Pool sizes to compare')
+    parser.add_argument('--steps', type=int, default=25, help='Points per sweep')
+    parser.add_argument('--step-delay', type=float, default=0.1, help='Source delay per point in s')
+    parser.add_argument('--latency', type=float, default=0.001, help='SMU round-trip time per read in s')
+    parser.add_argument('--time-scale', type=float, default=1.0, help='Factor applied to every simulated delay')
+    args = parser.parse_args()
+
+    print(f"{args.pixels} pixels, {args.steps} points per sweep, time scale {args.time_scale}\n")
+    print(f"{'SMUs':>5}{'wall (s)':>10}{'pixels/hour':>13}{'speed-up':>10}{'round (ms)':>12}{'errors':>8}")
+    reference = None
+    for smu_count in args.smus:
+        with tempfile.TemporaryDirectory() as save_directory:
+            wall_s, results, pool = run_pool(smu_count, args, save_directory)
+        reference = reference or wall_s  # Speed-up is relative to the first pool size
+        print(f"{smu_count:>5}{wall_s:>10.2f}{len(results) / wall_s * 3600:>13.0f}{reference / wall_s:>10.2f}"
+              f"{np.mean(pool.round_times) * 1e3:>12.1f}{len(pool.errors):>8}")
+
+
+if __name__ == "__main__":
+    main()
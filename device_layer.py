@@ -0,0 +1,208 @@
+'''
+This file contains the asyncio device layer between the Tk GUIs and the hardware.
+
+Every device (AxiDraw, pixel-select serial port, SMU) gets a driver with its own command queue.
+Commands on one device run strictly one after the other on that device's own thread, so two
+clicks can no longer interleave commands on the same port, while different devices still work
+in parallel.
+
+The event loop runs in a background thread. GUIs do not touch the devices; they submit jobs:
+    async def job(layer, ...):
+        await layer.robot.move_to(x, y)
+        await layer.switch.select('r')
+        return await layer.smu.call(measure, ...)
+    layer.submit(job, ...)
+Jobs run one at a time in submission order, so several pixels can be queued with a few clicks.
+Code that runs in a worker thread rather than in a job (e.g. a RunScheduler stage) can use
+layer.call(coroutine) to wait for a device command.
+
+Authors: Jason Whitney, Amr Mohamed, Prachya Chowdhury
+'''
+
+import asyncio
+import functools
+import threading
+import time
+import traceback
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+
+
+class DeviceDriver:
+    def __init__(self, name):
+        self.name = name
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix=name)
+        self.queue = None
+        self.commands_run = 0
+        self.busy_s = 0.0
+
+    def start(self):
+        # Called on the layer's event loop
+        self.queue = asyncio.Queue()
+        self.task = asyncio.get_running_loop().create_task(self.serve())
+
+    async def call(self, function, *args, **kwargs):
+        # Queue a blocking call on this device and wait for its result
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((functools.partial(function, *args, **kwargs), future))
+        return await future
+
+    async def serve(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            command, future = await self.queue.get()
+            if future.cancelled():
+                continue
+            start = time.monotonic()
+            try:
+                result = await loop.run_in_executor(self.executor, command)
+            except Exception as e:
+                if not future.cancelled():
+                    future.set_exception(e)
+            else:
+                if not future.cancelled():
+                    future.set_result(result)
+            finally:
+                self.commands_run += 1
+                self.busy_s += time.monotonic() - start
+
+    def pending(self):
+        return self.queue.qsize() if self.queue is not None else 0
+
+    def metrics(self):
+        return {'device': self.name, 'commands': self.commands_run, 'busy_s': self.busy_s, 'pending': self.pending()}
+
+    def close(self):
+        # The serve task is cancelled by the layer on its event loop
+        self.executor.shutdown(wait=True)
+
+
+class AxiDrawDriver(DeviceDriver):
+    def __init__(self, motion, name='axidraw'):
+        # motion is the MotionSettler wrapping the connected AxiDraw
+        super().__init__(name)
+        self.motion = motion
+
+    async def move_to(self, x, y):
+        return await self.call(self.motion.move_to, x, y)
+
+    async def home(self):
+        return await self.move_to(0, 0)
+
+
+class PixelSwitchDriver(DeviceDriver):
+    def __init__(self, switch, name='pixel switch'):
+        # switch is a PixelSwitch or LegacyPixelSwitch (switch_protocol.py)
+        super().__init__(name)
+        self.switch = switch
+
+    async def select(self, *codes):
+        # Closes the relays of the given pixel codes, every other relay opens; returns once they settled
+        return await self.call(self.switch.select, *codes)
+
+    async def off(self):
+        return await self.call(self.switch.off)
+
+
+class SmuDriver(DeviceDriver):
+    def __init__(self, measurement_system=None, name='smu'):
+        super().__init__(name)
+        self.measurement_system = measurement_system
+
+    async def measure(self, *args, **kwargs):
+        return await self.call(self.measurement_system.perform_measurement, *args, **kwargs)
+
+    async def acquire_sweep(self, start_voltage=None, stop_voltage=None, steps=None):
+        return await self.call(self.measurement_system.acquire_sweep, start_voltage, stop_voltage, steps)
+
+
+class DeviceLayer:
+    def __init__(self, robot=None, switch=None, smu=None):
+        self.robot = robot
+        self.switch = switch
+        self.smu = smu
+        self.drivers = [driver for driver in (robot, switch, smu) if driver is not None]
+        self.jobs_run = 0
+        self.job_errors = []
+        self.running = None  # Future of the job being run
+
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, name='device layer', daemon=True)
+        self.thread.start()
+        self.call(self.start())
+
+    async def start(self):
+        for driver in self.drivers:
+            driver.start()
+        self.jobs = asyncio.Queue()
+        self.job_task = asyncio.get_running_loop().create_task(self.run_jobs())
+
+    def submit(self, job, *args, description=None):
+        # Thread-safe; returns a concurrent.futures.Future with the job's result
+        future = Future()
+        description = description or getattr(job, '__name__', 'job')
+        self.loop.call_soon_threadsafe(self.jobs.put_nowait, (job, args, description, future))
+        return future
+
+    async def run_jobs(self):
+        while True:
+            job, args, description, future = await self.jobs.get()
+            if not future.set_running_or_notify_cancel():
+                continue  # Cancelled while queued
+            self.running = future
+            try:
+                future.set_result(await job(self, *args))
+            except Exception as e:
+                self.job_errors.append((description, e))
+                print(f"Job {description} failed: {e}")
+                traceback.print_exc()
+                future.set_exception(e)
+            finally:
+                self.jobs_run += 1
+
+    def call(self, coroutine, timeout=None):
+        # Blocking wait for a coroutine from outside the event loop thread
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop).result(timeout)
+
+    def run_in_worker(self, function, *args):
+        # Awaitable that runs a blocking function in a worker thread, for jobs that drive their own threads
+        return self.loop.run_in_executor(None, functools.partial(function, *args))
+
+    def pending_jobs(self):
+        return self.call(self.count_pending())
+
+    async def count_pending(self):
+        return self.jobs.qsize()
+
+    def cancel_pending(self):
+        # Drops queued jobs that have not started; the running job finishes
+        return self.call(self.drop_pending())
+
+    async def drop_pending(self):
+        dropped = 0
+        while not self.jobs.empty():
+            job, args, description, future = self.jobs.get_nowait()
+            future.cancel()
+            dropped += 1
+        return dropped
+
+    def metrics(self):
+        return [driver.metrics() for driver in self.drivers]
+
+    def close(self, timeout=None):
+        # Queued jobs are dropped, a running job is given timeout seconds to finish
+        if not self.loop.is_running():
+            return
+        self.cancel_pending()
+        if self.running is not None:
+            wait([self.running], timeout)
+        self.call(self.stop_tasks())
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        for driver in self.drivers:
+            driver.close()
+        self.loop.close()
+
+    async def stop_tasks(self):
+        self.job_task.cancel()
+        for driver in self.drivers:
+            driver.task.cancel()
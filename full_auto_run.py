@@ -0,0 +1,205 @@
+'''
+This file contains the full-auto run: every pixel of the substrate measured in one go, with
+baselines as the BaselinePolicy asks for them.
+
+It runs as a DeviceLayer job, so the same run can be started from the Tk GUI in
+syp_program_control.py or headless against simulated hardware (benchmark_full_auto.py):
+    devices.submit(FullAutoRun(measurement_system, positions).job, save_directory, input_power,
+                   start_voltage, stop_voltage, steps, policy)
+
+Every step is recorded in the run's journal (run_journal.py). A run that stopped early, after an
+error or an abort, is continued from where it stopped with
+    devices.submit(FullAutoRun(measurement_system, positions).resume, run_directory)
+
+Authors: Jason Whitney, Amr Mohamed, Prachya Chowdhury
+'''
+
+import threading
+from run_store import RunStore
+from run_journal import RunJournal
+from baseline_policy import BaselinePolicy
+from run_scheduler import RunScheduler
+from motion_planner import plan_route
+from pixel_layout import HOME_POSITION, BASELINE_POSITION
+from tracing import TRACER
+
+
+class FullAutoRun:
+    def __init__(self, measurement_system, pixel_positions, baseline_position=BASELINE_POSITION, home=HOME_POSITION,
+                 interlock=None, pipelined=True, pixel_commands=None):
+        self.measurement_system = measurement_system
+        self.pixel_positions = pixel_positions
+        self.baseline_position = baseline_position
+        self.home = home
+        # Shared with manual moves, see run_scheduler.py for what it guards
+        self.interlock = interlock or threading.Lock()
+        self.pipelined = pipelined
+        # Optional Arduino command per pixel, sent to the pixel switch after the robot arrives
+        self.pixel_commands = pixel_commands
+        self.abort_requested = threading.Event()
+        self.scheduler = None
+        self.journal = None
+
+    async def job(self, devices, save_directory, input_power, start_voltage, stop_voltage, steps, policy):
+        store = RunStore(save_directory)
+        journal = RunJournal(store.directory)
+        if journal.events('start'):
+            raise RuntimeError(f"Run directory {store.directory} already holds a run, resume it instead")
+        journal.start({
+            'save_directory': save_directory,
+            'input_power': input_power,
+            'start_voltage': start_voltage,
+            'stop_voltage': stop_voltage,
+            'steps': steps,
+            'pixels': list(self.pixel_positions),
+            'baseline_policy': {'every_n_pixels': policy.every_n_pixels, 'max_age_s': policy.max_age_s,
+                                'drift_threshold': policy.drift_threshold},
+            'instrument_address': self.measurement_system.instrument_address,
+        })
+        return await self.run(devices, store, journal, policy)
+
+    async def resume(self, devices, run_directory):
+        # Continues the run in run_directory with the settings it was started with, skipping every
+        # pixel whose results are already in its run store
+        store = RunStore.open(run_directory)
+        journal = RunJournal(store.directory)
+        if journal.is_finished():
+            print(f"Run {store.run_id} is already finished")
+            return []
+        missing = set(journal.settings['pixels']) - set(self.pixel_positions)
+        if missing:
+            raise ValueError(f"Pixels {sorted(missing)} of run {store.run_id} are not in the current layout")
+        return await self.run(devices, store, journal, BaselinePolicy(**journal.settings['baseline_policy']),
+                              resumed=True)
+
+    async def run(self, devices, store, journal, policy, resumed=False):
+        self.measurement_system.start_run(store, policy)
+        try:
+            return await self.run_steps(devices, store, journal, policy, resumed)
+        finally:
+            # Measurements taken after the run, e.g. single pixels from the GUI, stay out of its store
+            self.measurement_system.end_run()
+
+    async def run_steps(self, devices, store, journal, policy, resumed):
+        settings = journal.settings
+        self.abort_requested.clear()
+        self.journal = journal
+        TRACER.reset()  # The trace written at the end covers this run only
+        pixels = [pixel for pixel in settings['pixels'] if pixel not in journal.completed_pixels()]
+        if resumed:
+            # Carry on with the baseline the run had cached; the policy takes a new one if it is too old
+            last_baseline = journal.last_baseline()
+            if last_baseline is not None:
+                entry, pixels_after = last_baseline
+                policy.restore(entry['identifier'], entry['figures'], entry['time'], pixels_after)
+            await self.restore_hardware(devices)
+            print(f"Resuming run {store.run_id} with {len(pixels)} of {len(settings['pixels'])} pixels left")
+
+        # Visit the pixels in the shortest order found from home, moving straight from one
+        # measurement position to the next and returning home only once at the end. The robot heads
+        # to the next position while the previous sweep is analysed, plotted and saved.
+        # The scheduler runs in a worker thread and reaches the devices through their queues.
+        save_directory, input_power = settings['save_directory'], settings['input_power']
+        sweep = settings['start_voltage'], settings['stop_voltage'], settings['steps']
+        self.scheduler = RunScheduler(
+            move=lambda step: self.move(devices, step),
+            acquire=lambda step: self.acquire(devices, step, sweep, input_power),
+            process=lambda step, raw: self.process(step, raw, save_directory, input_power),
+            interlock=self.interlock, pipelined=self.pipelined)
+        try:
+            await devices.run_in_worker(self.scheduler.run, self.steps(policy, pixels))
+        except Exception as e:
+            journal.interrupted(f"{type(e).__name__}: {e}")
+            raise
+        finally:
+            await devices.robot.move_to(*self.home)
+            journal.homed(self.home)
+        await devices.run_in_worker(self.measurement_system.flush_saves)
+        self.scheduler.print_summary()
+        # Where each pixel's seconds went, and a trace of the run to open in chrome://tracing
+        TRACER.print_summary(f"Timing of run {store.run_id}")
+        TRACER.write_run_trace(store.directory)
+
+        left = set(settings['pixels']) - journal.completed_pixels()
+        if not left:
+            journal.finished()
+        elif self.abort_requested.is_set():
+            journal.interrupted('aborted')
+        else:
+            journal.interrupted(f"{len(left)} pixel(s) failed")
+            print(f"Pixels {sorted(left)} failed, resume the run to measure them again")
+
+        # One combined figure with every curve of this session of the run
+        await devices.run_in_worker(self.measurement_system.save_run_overlay, save_directory)
+        print(f"Full-auto run took {len(policy.baselines)} baseline(s) for {len(pixels)} pixels")
+        return self.scheduler.results
+
+    async def restore_hardware(self, devices):
+        # A resumed run starts from a known state: every relay open, no sweep left running on the SMU,
+        # its settings written again and the robot at home
+        if devices.switch is not None:
+            await devices.switch.off()
+        await devices.smu.call(self.reset_smu)
+        await devices.robot.move_to(*self.home)
+        self.journal.homed(self.home)
+
+    def reset_smu(self):
+        with self.measurement_system.smu:
+            self.measurement_system.abort_sweep()
+        self.measurement_system.config_cache.invalidate()
+
+    def move(self, devices, step):
+        # Runs in the scheduler's thread, the devices are reached through their queues
+        devices.call(devices.robot.move_to(*step['position']))
+        self.journal.move(step['position'])
+        if self.switch_command(step) is not None:
+            devices.call(devices.switch.select(self.switch_command(step)))
+
+    def switch_command(self, step):
+        if self.pixel_commands and not step['baseline']:
+            return self.pixel_commands.get(step['identifier'])
+        return None
+
+    def acquire(self, devices, step, sweep, input_power):
+        # Pixels scheduled while MPP tracking is on get a few points around their last MPP, see mpp_tracking.py
+        if step.get('tracked'):
+            return devices.call(devices.smu.call(self.measurement_system.acquire_tracked, step['identifier'],
+                                                 input_power, *sweep))
+        return devices.call(devices.smu.acquire_sweep(*sweep))
+
+    def process(self, step, raw, save_directory, input_power):
+        if step.get('tracked'):
+            figures = self.measurement_system.process_tracked(*raw, save_directory, input_power, step['identifier'],
+                                                              background=False)
+        else:
+            figures = self.measurement_system.process_sweep(*raw, save_directory, input_power, step['identifier'],
+                                                            step['baseline'], background=False)
+        # Only now are the step's results on disk, so only now may a resume skip it
+        self.journal.step_done(step, figures, {
+            'robot': list(step['position']),
+            'switch': self.switch_command(step),
+            'smu': self.measurement_system.instrument_address,
+        })
+        return figures
+
+    def steps(self, policy, pixels):
+        # Generated lazily so the baseline policy decides with the time the robot actually gets there
+        for pixel_number in plan_route({pixel: self.pixel_positions[pixel] for pixel in pixels}, self.home):
+            if self.abort_requested.is_set():
+                print("Full-auto run aborted")
+                return
+            # Step 1: A baseline measurement at the baseline position when the policy asks for one,
+            # otherwise the pixel is normalized against the cached baseline
+            if policy.needs_baseline():
+                policy.baseline_scheduled()
+                yield {'position': self.baseline_position, 'identifier': f"baseline_before_pixel_{pixel_number}",
+                       'baseline': True}
+
+            # Step 2: The pixel itself
+            policy.pixel_scheduled()
+            yield {'position': self.pixel_positions[pixel_number], 'identifier': pixel_number, 'baseline': False,
+                   'tracked': self.measurement_system.tracking}
+
+    def abort(self):
+        # The run stops after the step in progress
+        self.abort_requested.set()
@@ -7,6 +7,8 @@ Authors: Jason Whitney, Amr Mohamed, Prachya Chowdhury
 
 import sys
 from pyaxidraw import axidraw
+from motion_settle import MotionSettler
+from pixel_layout import load_layout
 
 ad = axidraw.AxiDraw()  # Initialize class
 
@@ -25,32 +27,36 @@ ad.options.speed_penup = 10
 
 ad.update()  # Apply the options commands
 
-pixel_position = [[0, 5], [0, 10], [0, 15], [0, 20], [5, 20], [5, 15], [5, 10], [5, 5]]
+# Wait after each move for as long as the move takes, instead of a fixed 2 seconds
+motion = MotionSettler(ad, strategy='query')
+
+# Pixel positions from pixel_layout.json, or the 8-pixel substrate
+layout = load_layout()
 
 def robot_move_to_pixel(pixel_position):
     x_coord, y_coord = pixel_position
-    ad.moveto(x_coord, y_coord)
-    ad.delay(2000)  # Delay 2 seconds
+    motion.move_to(x_coord, y_coord)
     #perform_measurement()
     print("Moved to pixel: ", pixel_position)
 
 def user_selection():
     mode = input("Enter '1' for single movement or '2' for full auto: ")
     if mode == '1':
-        pixel_number = int(input("Enter the pixel number (1-8): "))
-        if 1 <= pixel_number <= 8:
-            robot_move_to_pixel(pixel_position[pixel_number - 1])
+        pixel_number = int(input(f"Enter the pixel number (1-{len(layout)}): "))
+        if pixel_number in layout.positions:
+            robot_move_to_pixel(layout.positions[pixel_number])
         else:
-            print("Invalid pixel number. Please enter a number between 1 and 8.")
+            print(f"Invalid pixel number. Please enter a pixel of the layout (1-{len(layout)}).")
     elif mode == '2':
-        for pixel in pixel_position:
+        for pixel in layout.positions.values():
             robot_move_to_pixel(pixel)
     else:
         print("Invalid selection. Please enter '1' or '2'.")
 
 user_selection()
 
-ad.moveto(0, 0)  # Return to home position
+motion.move_to(0, 0)  # Return to home position
+print(f"Moves: {motion.summary()}")
 
 # Disconnect from AxiDraw
 ad.disconnect()
@@ -0,0 +1,83 @@
+'''
+This file keeps track of the settings last written to each Keithley 2450 so that repeated
+measurements only send the SCPI commands whose values actually changed.
+
+The 2450 keeps its configuration when a VISA session is closed, so the cache is kept per
+instrument address for the life of the process rather than per session.
+
+Authors: Jason Whitney, Amr Mohamed, Prachya Chowdhury
+'''
+
+import threading
+
+# Static SMU setup for a voltage-sourced solar cell sweep
+SWEEP_SETTINGS = [
+    'SENS:FUNC "CURR"',
+    'SENS:CURR:RANG:AUTO ON',
+    'SENS:CURRent:RSENse OFF',  # 2-wire sensing
+    'SOUR:FUNC VOLT',
+    'SOUR:VOLT:RANG 2',
+    'SOUR:VOLT:ILIM 1',  # 1 A current limit
+]
+
+
+class InstrumentConfigCache:
+    def __init__(self):
+        self.settings = {}  # SCPI header -> full command last written
+        self.writes_sent = 0
+        self.writes_skipped = 0
+
+    @staticmethod
+    def setting_key(command):
+        return command.split(' ', 1)[0].upper()
+
+    def write(self, smu, command):
+        # Send the command only if it differs from what the instrument already has
+        key = self.setting_key(command)
+        if self.settings.get(key) == command:
+            self.writes_skipped += 1
+            return False
+        smu.write(command)
+        self.settings[key] = command
+        self.writes_sent += 1
+        return True
+
+    def remembered(self, key):
+        return self.settings.get(key)
+
+    def remember(self, key, value):
+        # Record state that was set up by other means than a single command, e.g. an uploaded script
+        self.settings[key] = value
+
+    def forget(self, key):
+        # Drop one setting, e.g. when another command replaced what it set up on the instrument
+        self.settings.pop(key, None)
+
+    def write_all(self, smu, commands):
+        return sum(self.write(smu, command) for command in commands)
+
+    def reset(self, smu):
+        # Full *RST/*CLS, after which nothing is known about the instrument state
+        smu.write('*RST')
+        smu.write('*CLS')
+        self.writes_sent += 2
+        self.invalidate()
+        self.settings['*RST'] = '*RST'
+
+    def invalidate(self):
+        # Forget the cached state, e.g. after a reconnect or when the front panel was used
+        self.settings.clear()
+
+    def is_initialized(self):
+        return '*RST' in self.settings
+
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def config_cache_for(instrument_address):
+    with _caches_lock:
+        if instrument_address not in _caches:
+            _caches[instrument_address] = InstrumentConfigCache()
+        return _caches[instrument_address]
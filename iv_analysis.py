@@ -0,0 +1,154 @@
+'''
+This file contains the I-V curve analysis shared by the measurement programs and the archive tools.
+
+Every function works on a stack of sweeps at once, voltage and current as 2-D arrays with one sweep
+per row, and is vectorized over the whole stack, so thousands of archived curves are re-analysed in
+seconds. Sweeps of different lengths are padded with NaN (see stack_curves).
+
+Compared with picking the nearest sample:
+    Isc, Voc      are interpolated linearly at the zero crossing of voltage and current
+    MPP           is the vertex of a parabola through the highest power sample and its neighbours
+    fill factor   Pmax / (Isc * Voc)
+    Rs, Rsh       from the slope of the curve at Voc and at Isc: Rs = -dV/dI at I = 0,
+                  Rsh = -dV/dI at V = 0
+
+The photocurrent is taken as positive; sweeps measured with the opposite sign (as the 2450 reports
+a generating cell) are flipped first, so the results do not depend on the wiring.
+
+Re-analysing a run store:
+    python iv_analysis.py <run_directory> [--input-power 0.1]
+
+Authors: Jason Whitney, Amr Mohamed, Prachya Chowdhury
+'''
+
+import argparse
+import csv
+import os
+import numpy as np
+
+ANALYSIS_COLUMNS = ['isc', 'voc', 'mpp_voltage', 'mpp_current', 'max_power', 'fill_factor', 'series_resistance',
+                    'shunt_resistance', 'efficiency']
+
+
+def stack_curves(curves):
+    # curves is a sequence of (voltage, current) pairs; returns two 2-D arrays padded with NaN
+    curves = list(curves)
+    length = max((len(voltage) for voltage, current in curves), default=0)
+    voltage = np.full((len(curves), length), np.nan)
+    current = np.full((len(curves), length), np.nan)
+    for row, (v, i) in enumerate(curves):
+        voltage[row, :len(v)] = v
+        current[row, :len(i)] = i
+    return voltage, current
+
+
+def zero_crossing(x, y):
+    # For each row, x where y first changes sign (linear interpolation) and the slope dy/dx there.
+    # Rows without a crossing give NaN.
+    y0, y1 = y[:, :-1], y[:, 1:]
+    crosses = ((y0 == 0) | (np.sign(y0) != np.sign(y1))) & np.isfinite(y0) & np.isfinite(y1)
+    found = crosses.any(axis=1)
+    index = np.argmax(crosses, axis=1)
+    rows = np.arange(len(x))
+    xa, xb = x[rows, index], x[rows, index + 1]
+    ya, yb = y[rows, index], y[rows, index + 1]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        slope = (yb - ya) / (xb - xa)
+        crossing = np.where(yb != ya, xa - ya * (xb - xa) / (yb - ya), xa)
+    crossing[~found] = np.nan
+    slope[~found] = np.nan
+    return crossing, slope
+
+
+def parabolic_peak(x, y):
+    # Vertex of the parabola through the largest sample of each row and its two neighbours.
+    # Falls back to the sample itself at the ends of a sweep or where the fit is not a maximum.
+    rows = np.arange(len(x))
+    peak = np.argmax(np.where(np.isfinite(y), y, -np.inf), axis=1)
+    sample_x, sample_y = x[rows, peak], y[rows, peak]
+    middle = np.clip(peak, 1, max(x.shape[1] - 2, 1))
+    if x.shape[1] < 3:
+        return sample_x, sample_y
+    x0, x1, x2 = x[rows, middle - 1], x[rows, middle], x[rows, middle + 1]
+    y0, y1, y2 = y[rows, middle - 1], y[rows, middle], y[rows, middle + 1]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        d1 = (y1 - y0) / (x1 - x0)
+        d2 = (y2 - y1) / (x2 - x1)
+        curvature = (d2 - d1) / (x2 - x0)
+        vertex_x = (x0 + x1) / 2 - d1 / (2 * curvature)
+        vertex_y = y0 + d1 * (vertex_x - x0) + curvature * (vertex_x - x0) * (vertex_x - x1)
+    lower, upper = np.minimum(x0, x2), np.maximum(x0, x2)
+    valid = (peak == middle) & (curvature < 0) & (vertex_x >= lower) & (vertex_x <= upper) & \
+        np.isfinite(vertex_y) & (vertex_y >= sample_y)
+    return np.where(valid, vertex_x, sample_x), np.where(valid, vertex_y, sample_y)
+
+
+def analyse_curves(voltage, current, input_power=None):
+    # voltage and current are (sweeps, points) arrays, or 1-D for a single sweep.
+    # Returns a dict of ANALYSIS_COLUMNS, each an array with one value per sweep.
+    voltage = np.atleast_2d(np.asarray(voltage, dtype=float))
+    current = np.atleast_2d(np.asarray(current, dtype=float))
+
+    # Orient every sweep so its photocurrent is positive, by the current at the sample nearest 0 V like
+    # the TSP routine does, so sweeps that do not reach 0 V (and have no Isc) are oriented as well
+    isc, dv_di_at_isc = zero_crossing(current, voltage)
+    rows = np.arange(len(voltage))
+    nearest_zero = np.argmin(np.where(np.isfinite(voltage), np.abs(voltage), np.inf), axis=1)
+    orientation = np.where(current[rows, nearest_zero] < 0, -1.0, 1.0)
+    current = current * orientation[:, None]
+    isc = isc * orientation
+    dv_di_at_isc = dv_di_at_isc * orientation
+
+    voc, di_dv_at_voc = zero_crossing(voltage, current)
+    mpp_voltage, max_power = parabolic_peak(voltage, voltage * current)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mpp_current = max_power / mpp_voltage
+        fill_factor = max_power / (isc * voc)
+        series_resistance = -1 / di_dv_at_voc
+        shunt_resistance = -dv_di_at_isc
+    if input_power:
+        efficiency = max_power / input_power * 100
+    else:
+        efficiency = np.zeros_like(max_power)
+    return {
+        'isc': isc,
+        'voc': voc,
+        'mpp_voltage': mpp_voltage,
+        'mpp_current': mpp_current,
+        'max_power': max_power,
+        'fill_factor': fill_factor,
+        'series_resistance': series_resistance,
+        'shunt_resistance': shunt_resistance,
+        'efficiency': efficiency,
+    }
+
+
+def analyse_run_store(store, input_power=None, filename=None):
+    # Re-analyses every sweep of a RunStore in one batch and writes analysis.csv next to its index
+    records = [record for record in store.records() if int(record['points']) > 0]
+    voltage, current = stack_curves(store.load_sweep(record) for record in records)
+    results = analyse_curves(voltage, current, input_power) if records else {}
+    filename = filename or os.path.join(store.directory, 'analysis.csv')
+    with open(filename, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['record', 'label'] + ANALYSIS_COLUMNS)
+        for row, record in enumerate(records):
+            writer.writerow([record['record'], record['label']] +
+                            [repr(float(results[name][row])) for name in ANALYSIS_COLUMNS])
+    return filename, results
+
+
+def main():
+    from run_store import RunStore
+
+    parser = argparse.ArgumentParser(description='Re-analyse every sweep of a run store.')
+    parser.add_argument('run_directory', help='run_<id> directory created by RunStore')
+    parser.add_argument('--input-power', type=float, default=None, help='Input power in W for the efficiency')
+    args = parser.parse_args()
+
+    filename, results = analyse_run_store(RunStore.open(args.run_directory), args.input_power)
+    print(f"Analysed {len(results.get('isc', []))} sweeps, wrote {filename}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+'''
+This file contains the pixel map widget of the control GUIs. Its buttons are generated from a
+PixelLayout (pixel_layout.py) instead of being placed by hand, so the same GUI serves the 8-pixel
+substrate and plates with thousands of devices.
+
+Every pixel is drawn at its robot position, scaled so the map fits the widget, and can be
+scrolled when the plate is larger. A click selects the nearest pixel through the layout's spatial
+index, so nothing is created per pixel beyond one canvas rectangle (and a label while there is room).
+
+Authors: Jason Whitney, Amr Mohamed, Prachya Chowdhury
+'''
+
+import tkinter as tk
+
+# Cell of one pixel on screen, in pixels; smaller plates are drawn with larger cells
+MIN_CELL_SIZE = 12
+MAX_CELL_SIZE = 50
+# Labels are only drawn when a cell is at least this large
+LABEL_CELL_SIZE = 24
+
+
+class PixelMap(tk.Frame):
+    def __init__(self, master, layout, command, width=360, height=320, **kwargs):
+        # command(pixel) is called when a pixel is clicked
+        super().__init__(master, **kwargs)
+        self.layout = layout
+        self.command = command
+        self.canvas = tk.Canvas(self, width=width, height=height, background='white', highlightthickness=0)
+        x_scroll = tk.Scrollbar(self, orient=tk.HORIZONTAL, command=self.canvas.xview)
+        y_scroll = tk.Scrollbar(self, orient=tk.VERTICAL, command=self.canvas.yview)
+        self.canvas.configure(xscrollcommand=x_scroll.set, yscrollcommand=y_scroll.set)
+        self.canvas.grid(row=0, column=0, sticky='nsew')
+        y_scroll.grid(row=0, column=1, sticky='ns')
+        x_scroll.grid(row=1, column=0, sticky='ew')
+        self.rowconfigure(0, weight=1)
+        self.columnconfigure(0, weight=1)
+        self.draw(width, height)
+        self.canvas.bind('<Button-1>', self.click)
+
+    def draw(self, width, height):
+        index = self.layout.index
+        points = index.points
+        if not len(points):
+            return
+        self.origin = points.min(axis=0)
+        span = points.max(axis=0) - self.origin
+        # Scale so neighbouring pixels are a cell apart, within the cell size limits
+        pitch = index.nearest_spacing()
+        fit = min((width - MAX_CELL_SIZE) / span[0] if span[0] else MAX_CELL_SIZE,
+                  (height - MAX_CELL_SIZE) / span[1] if span[1] else MAX_CELL_SIZE)
+        self.scale = min(max(fit, MIN_CELL_SIZE / pitch), MAX_CELL_SIZE / pitch)
+        self.cell = min(max(pitch * self.scale * 0.8, MIN_CELL_SIZE * 0.8), MAX_CELL_SIZE)
+        for pixel, point in zip(index.pixels, points):
+            x, y = self.to_screen(point)
+            half = self.cell / 2
+            self.canvas.create_rectangle(x - half, y - half, x + half, y + half, fill='#d9d9d9', outline='#808080')
+            if self.cell >= LABEL_CELL_SIZE:
+                self.canvas.create_text(x, y, text=str(pixel))
+        self.canvas.configure(scrollregion=self.canvas.bbox('all'))
+
+    def to_screen(self, point):
+        return ((point[0] - self.origin[0]) * self.scale + MAX_CELL_SIZE / 2,
+                (point[1] - self.origin[1]) * self.scale + MAX_CELL_SIZE / 2)
+
+    def click(self, event):
+        x = (self.canvas.canvasx(event.x) - MAX_CELL_SIZE / 2) / self.scale + self.origin[0]
+        y = (self.canvas.canvasy(event.y) - MAX_CELL_SIZE / 2) / self.scale + self.origin[1]
+        pixel = self.layout.nearest(x, y, max_distance=self.cell / 2 / self.scale * 1.5)
+        if pixel is not None:
+            self.command(pixel)
+
@@ -5,64 +5,420 @@ Authors: Jason Whitney, Amr Mohamed, Prachya Chowdhury
 '''
 
 import os
-import pyvisa
+import queue
+import threading
+import time
 import numpy as np
-import matplotlib.pyplot as plt
 import serial
+from instrument_config import SWEEP_SETTINGS, config_cache_for
+from visa_sessions import get_session
+from save_pipeline import BackgroundWriter
+from plot_renderer import CurvePlotRenderer, OverlayPlot
+from iv_analysis import analyse_curves
+from mpp_tracking import MppTracker
+from tracing import TRACER
+from adaptive_sweep import refinement_levels, merge_sweeps, ADAPTIVE_COARSE_POINTS, ADAPTIVE_DENSE_POINTS
+
+# Readback formats for TRAC:DATA?, mapped to the FORM:DATA argument and the struct datatype of one value.
+# 'real' and 'sreal' transfer the buffer as an IEEE 488.2 binary block, 'ascii' is the slower text fallback.
+READBACK_FORMATS = {
+    'ascii': ('ASC', None),
+    'real': ('REAL', 'd'),
+    'sreal': ('SREAL', 'f'),
+}
+
+# Buffers larger than this many points are read back in chunks of this size
+READBACK_CHUNK_POINTS = 1000
+
+# SOUR:LIST:VOLT takes at most 100 levels per command, longer lists are appended in pieces
+SOURCE_LIST_CHUNK = 100
+
+class StopAfterVoc:
+    # Early-abort hook for MeasurementSystem.stream_sweep: stops the sweep once the current has changed
+    # sign, i.e. Voc has been crossed, and extra_points further points have been measured.
+    def __init__(self, extra_points=2):
+        self.extra_points = extra_points
+        self.initial_sign = None
+        self.points_past_voc = None
+
+    def __call__(self, voltage, current):
+        if len(current) == 0:
+            return False
+        if self.initial_sign is None:
+            self.initial_sign = np.sign(current[0])
+        if self.points_past_voc is None:
+            crossed = np.nonzero(np.sign(current) != self.initial_sign)[0]
+            if len(crossed) == 0:
+                return False
+            self.points_past_voc = len(current) - crossed[0] - 1
+        else:
+            self.points_past_voc += len(current)
+        return self.points_past_voc >= self.extra_points
 
 class MeasurementSystem:
-    def __init__(self, instrument_address, ser_port='COM7', ser_baud=9600):
+    def __init__(self, instrument_address, ser_port='COM7', ser_baud=9600, readback_format='real',
+                 chunk_points=READBACK_CHUNK_POINTS, open_resource=None, background_save=True, connect=True):
+        if readback_format not in READBACK_FORMATS:
+            raise ValueError(f"Unknown readback format '{readback_format}', expected one of {list(READBACK_FORMATS)}")
         self.instrument_address = instrument_address
         self.ser_port = ser_port
         self.ser_baud = ser_baud
+        self.open_resource = open_resource  # Optional factory used instead of pyvisa, e.g. for a simulated SMU
+        self.readback_format = readback_format
+        self.chunk_points = chunk_points
+        self.sweep = None  # (start_voltage, stop_voltage, steps, step_delay) of the last configured sweep
+        self.expected_points = None  # Points the last configured linear or list sweep stores
+        self.config_cache = config_cache_for(instrument_address)  # Settings last written to the SMU
         self.rm = None
         self.smu = None
         self.ser = None
-        self.initialize_connections()
+        # Plots and files are written by a background thread so the next sweep does not wait for them
+        self.writer = BackgroundWriter() if background_save else None
+        self.renderer = None  # Built with the first plot
+        # With plots cleared, process_sweep keeps the figures of merit and the raw sweep but draws nothing
+        self.plots = True
+        self.run_overlay = OverlayPlot()  # Every curve plotted since the last start_run()
+        self.run_store = None
+        self.baseline_policy = None
+        # With adaptive set, sweeps run a coarse pass plus a dense pass around the MPP and Voc instead of
+        # the uniform step count
+        self.adaptive = False
+        # With tracking set, pixels measured before only get a few points around their last MPP, see mpp_tracking.py
+        self.tracking = False
+        self.mpp_tracker = MppTracker()
+        if connect:
+            self.initialize_connections()
 
     def initialize_connections(self):
-        self.rm = pyvisa.ResourceManager()
-        self.smu = self.rm.open_resource(self.instrument_address)
-        self.ser = serial.Serial(self.ser_port, self.ser_baud)
+        # The SMU session is shared per address and stays open for the life of the process
+        self.smu = get_session(self.instrument_address, self.open_resource)
+        self.smu.ensure_connected()
+        self.rm = self.smu.resource_manager
+        # ser_port=None leaves the pixel-select serial port to the caller
+        if self.ser_port is not None:
+            self.ser = serial.Serial(self.ser_port, self.ser_baud)
 
-    def perform_measurement(self, save_directory, input_power, measurement_identifier=None):
-        self.configure_instrument()
-        voltage, current, power, mpp_voltage, max_power, isc, voc, efficiency = self.fetch_and_process_data(input_power)
-        # Use measurement_identifier in plot_and_save method to differentiate between measurements
-        self.plot_and_save(voltage, current, power, mpp_voltage, max_power, isc, voc, efficiency, save_directory, measurement_identifier)
-
-    def configure_instrument(self, start_voltage, stop_voltage, steps):
-        self.smu.write('*RST')
-        self.smu.write('*CLS')
-        self.smu.write('SENS:FUNC "CURR"')
-        self.smu.write('SENS:CURR:RANG:AUTO ON')
-        self.smu.write('SENS:CURRent:RSENse OFF')
-        self.smu.write('SOUR:FUNC VOLT')
-        self.smu.write('SOUR:VOLT:RANG 2')
-        self.smu.write('SOUR:VOLT:ILIM 1')
-        self.smu.write(f'SOUR:SWE:VOLT:LIN {start_voltage}, {stop_voltage}, {steps}, 0.1')
+    @TRACER.traced('measurement', 'smu')
+    def perform_measurement(self, save_directory, input_power, measurement_identifier=None, start_voltage=None,
+                            stop_voltage=None, steps=None, plots=True, baseline=False):
+        if self.tracking and measurement_identifier is not None:
+            return self.track_mpp(save_directory, input_power, measurement_identifier, start_voltage, stop_voltage,
+                                  steps, baseline)
+        if not plots:
+            # Summary-only mode for screening: only the figures of merit are read back
+            with self.smu:
+                self.configure_sweep(start_voltage, stop_voltage, steps)
+                mpp_voltage, max_power, isc, voc, efficiency = self.fetch_summary(input_power)
+            figures = {'mpp_voltage': mpp_voltage, 'max_power': max_power, 'isc': isc, 'voc': voc,
+                       'efficiency': efficiency}
+            return self.record_measurement(figures, None, None, None, save_directory, measurement_identifier,
+                                           baseline, plots=False)
+        voltage, current = self.acquire_sweep(start_voltage, stop_voltage, steps)
+        return self.process_sweep(voltage, current, save_directory, input_power, measurement_identifier, baseline)
+
+    def track_mpp(self, save_directory, input_power, measurement_identifier, start_voltage=None, stop_voltage=None,
+                  steps=None, baseline=False):
+        # A few points around the pixel's last MPP; a full sweep the first time or when the MPP drifted
+        raw = self.acquire_tracked(measurement_identifier, input_power, start_voltage, stop_voltage, steps)
+        return self.process_tracked(*raw, save_directory, input_power, measurement_identifier, baseline)
+
+    def acquire_tracked(self, measurement_identifier, input_power, start_voltage=None, stop_voltage=None, steps=None):
+        # Instrument half of track_mpp: (voltage, current, figures), where figures are those of the tracked
+        # points, or None when a full sweep was taken instead and still has to be processed
+        levels = self.mpp_tracker.levels(measurement_identifier)
+        if levels is not None:
+            with self.smu:
+                self.configure_list_sweep(levels, self.mpp_tracker.step_delay)
+                voltage, current = self.read_sweep_data()
+            figures = self.mpp_tracker.update(measurement_identifier, voltage, current, input_power)
+            if figures is not None:
+                return voltage, current, figures
+            print(f"MPP of {measurement_identifier} drifted, running a full sweep")
+        voltage, current = self.acquire_sweep(start_voltage, stop_voltage, steps)
+        return voltage, current, None
+
+    def process_tracked(self, voltage, current, figures, save_directory, input_power, measurement_identifier,
+                        baseline=False, background=True):
+        # Host half of track_mpp; a full sweep is processed as usual and seeds the tracker
+        if figures is not None:
+            return self.record_measurement(figures, voltage, current, None, save_directory, measurement_identifier,
+                                           baseline, plots=False, background=background)
+        figures = self.process_sweep(voltage, current, save_directory, input_power, measurement_identifier, baseline,
+                                     background=background)
+        self.mpp_tracker.seed(measurement_identifier, figures)
+        return figures
+
+    def configure_sweep(self, start_voltage=None, stop_voltage=None, steps=None):
+        # Reuse the last sweep geometry unless a new one is given
+        if steps is not None:
+            self.configure_instrument(start_voltage, stop_voltage, steps)
+        elif self.sweep is not None:
+            self.configure_instrument(*self.sweep)
+        else:
+            raise ValueError("No sweep configured, pass start_voltage, stop_voltage and steps")
+
+    @TRACER.traced('acquire', 'smu')
+    def acquire_sweep(self, start_voltage=None, stop_voltage=None, steps=None):
+        # Runs the sweep and reads the raw curve back, the SMU is free again once this returns
+        if self.adaptive and steps is not None:
+            return self.acquire_adaptive_sweep(start_voltage, stop_voltage)
+        # Hold the shared SMU session for the whole sweep so other threads cannot interleave commands
+        with self.smu:
+            self.configure_sweep(start_voltage, stop_voltage, steps)
+            voltage, current = self.read_sweep_data()
+        if len(voltage) == 0:
+            raise RuntimeError("The SMU returned no sweep data")
+        return voltage, current
+
+    def acquire_adaptive_sweep(self, start_voltage, stop_voltage, coarse_points=ADAPTIVE_COARSE_POINTS,
+                               dense_points=ADAPTIVE_DENSE_POINTS, step_delay=0.1):
+        # Coarse linear pass, then a list sweep concentrated around the MPP, Voc and 0 V, see adaptive_sweep.py
+        with self.smu:
+            self.configure_instrument(start_voltage, stop_voltage, coarse_points, step_delay)
+            voltage, current = self.read_sweep_data()
+            if len(voltage) == 0:
+                raise RuntimeError("The SMU returned no sweep data")
+            results = analyse_curves(voltage, current)
+            levels = refinement_levels(voltage, {name: results[name][0] for name in ('mpp_voltage', 'voc')},
+                                       dense_points)
+            if len(levels) == 0:
+                return voltage, current
+            self.configure_list_sweep(levels, step_delay)
+            dense_voltage, dense_current = self.read_sweep_data()
+        return merge_sweeps(voltage, current, dense_voltage, dense_current)
+
+    def configure_list_sweep(self, levels, step_delay=0.1, initiate=True):
+        self.expected_points = len(levels)
+        if not self.config_cache.is_initialized():
+            self.reset_instrument()
+        self.config_cache.write_all(self.smu, SWEEP_SETTINGS)
+        # The list sweep replaces the linear sweep's trigger model, so that has to be sent again next time
+        self.config_cache.forget('SOUR:SWE:VOLT:LIN')
+        levels = [f'{level:.6g}' for level in levels]
+        for first in range(0, len(levels), SOURCE_LIST_CHUNK):
+            command = 'SOUR:LIST:VOLT' if first == 0 else 'SOUR:LIST:VOLT:APP'
+            self.smu.write(f"{command} {','.join(levels[first:first + SOURCE_LIST_CHUNK])}")
+        self.smu.write(f'SOUR:SWE:VOLT:LIST 1, {step_delay}')
+        if initiate:
+            self.smu.write(':INIT')
+            self.smu.write('*WAI')
+
+    def process_sweep(self, voltage, current, save_directory, input_power, measurement_identifier=None,
+                      baseline=False, background=True):
+        # Host-side half of a measurement: figures of merit, run store, plots. Needs no instrument, so a
+        # pipelined run does this while the robot moves to the next pixel (background=False keeps the
+        # rendering in the calling thread).
+        power, figures = self.analyse_sweep(voltage, current, input_power)
+        return self.record_measurement(figures, voltage, current, power, save_directory, measurement_identifier,
+                                       baseline, plots=self.plots, background=background)
+
+    def record_measurement(self, figures, voltage, current, power, save_directory, measurement_identifier=None,
+                           baseline=False, plots=True, background=True):
+        if self.baseline_policy is not None:
+            # Cache baselines and normalize pixels against the current one
+            if baseline:
+                self.baseline_policy.record_baseline(measurement_identifier, figures)
+            else:
+                self.baseline_policy.normalize(figures)
+
+        if self.run_store is not None:
+            pixel = measurement_identifier if isinstance(measurement_identifier, int) else None
+            self.save(self.run_store.append, pixel, voltage, current, figures, measurement_identifier, baseline,
+                      time.time(), description=f'run store {measurement_identifier}', background=background)
+        if plots:
+            # Use measurement_identifier in plot_and_save method to differentiate between measurements
+            self.save(self.plot_and_save, voltage, current, power, figures['mpp_voltage'], figures['max_power'],
+                      figures['isc'], figures['voc'], figures['efficiency'], save_directory, measurement_identifier,
+                      background=background)
+        elif self.run_store is None:
+            self.save(self.save_values, figures['max_power'], figures['isc'], figures['voc'], figures['efficiency'],
+                      save_directory, measurement_identifier, background=background)
+        return figures
+
+    def save(self, function, *args, description=None, background=True):
+        # Hand the results to the background writer, or write them right away if it is disabled
+        if self.writer is None or not background:
+            function(*args)
+        else:
+            self.writer.submit(function, *args, description=description or f'{function.__name__} {args[-1]}')
+
+    def flush_saves(self):
+        if self.writer is None:
+            return []
+        errors = self.writer.flush()
+        for description, error in errors:
+            print(f"Failed to save {description}: {error}")
+        return errors
+
+    def configure_instrument(self, start_voltage, stop_voltage, steps, step_delay=0.1, full_reset=False,
+                             initiate=True):
+        self.sweep = (start_voltage, stop_voltage, steps, step_delay)
+        self.expected_points = steps
+        # Reset only on the first sweep or when asked, afterwards only changed settings go over the bus
+        if full_reset or not self.config_cache.is_initialized():
+            self.reset_instrument()
+        self.config_cache.write_all(self.smu, SWEEP_SETTINGS)
+        # The trigger model built by the sweep command clears defbuffer1 itself, so an unchanged sweep is just re-run
+        self.config_cache.write(self.smu, f'SOUR:SWE:VOLT:LIN {start_voltage}, {stop_voltage}, {steps}, {step_delay}')
+        if initiate:
+            self.smu.write(':INIT')
+            self.smu.write('*WAI')
+
+    def start_sweep(self):
+        # Starts the configured sweep without waiting for it to finish
         self.smu.write(':INIT')
-        self.smu.write('*WAI')
+
+    def abort_sweep(self):
+        self.smu.write(':ABOR')
+
+    def sweep_running(self):
+        state = self.smu.query(':TRIG:STAT?').strip().split(';')[0]
+        return state in ('RUNNING', 'WAITING', 'BUILDING')
+
+    def wait_for_sweep(self, poll_interval=0.05):
+        # Blocks until a sweep started with start_sweep() has finished
+        while self.sweep_running():
+            time.sleep(poll_interval)
+
+    def stream_sweep(self, start_voltage, stop_voltage, steps, step_delay=0.1, poll_interval=0.05, abort_when=None):
+        # Generator yielding (voltage, current) chunks while the sweep is still running, so analysis and
+        # live plots can start before it finishes. abort_when(voltage, current) is called with every chunk
+        # and stops the sweep when it returns True, e.g. StopAfterVoc(). Leaving the loop early also aborts.
+        with self.smu:
+            self.configure_instrument(start_voltage, stop_voltage, steps, step_delay, initiate=False)
+            self.start_sweep()
+            points_read = 0
+            finished = False
+            try:
+                while points_read < steps:
+                    # Check the state before the fill level so the last points are never missed
+                    running = self.sweep_running()
+                    available = self.buffer_point_count()
+                    if available > points_read:
+                        voltage, current = self.read_sweep_data(points_read + 1, available)
+                        points_read = available
+                        yield voltage, current
+                        if abort_when is not None and abort_when(voltage, current):
+                            self.abort_sweep()
+                            break
+                    elif not running:
+                        break
+                    else:
+                        time.sleep(poll_interval)
+                finished = True
+            finally:
+                if not finished:
+                    self.abort_sweep()
+
+    def reset_instrument(self):
+        self.config_cache.reset(self.smu)
+
+    def set_data_format(self, data_format):
+        self.config_cache.write(self.smu, f'FORM:DATA {data_format}')
+        if data_format != 'ASC':
+            self.config_cache.write(self.smu, 'FORM:BORD SWAP')  # Little-endian, so the block maps onto host memory
+
+    def buffer_point_count(self):
+        return int(float(self.smu.query('TRAC:ACT? "defbuffer1"')))
+
+    @TRACER.traced('transfer', 'smu')
+    def read_sweep_data(self, start_index=1, end_index=None):
+        # Size the readback from what the sweep actually stored rather than a fixed point count
+        if end_index is None:
+            end_index = self.buffer_point_count()
+            if self.expected_points is not None and end_index != self.expected_points:
+                print(f"Expected {self.expected_points} sweep points but the buffer holds {end_index}")
+        total_points = end_index - start_index + 1
+        if total_points <= 0:
+            return np.empty(0), np.empty(0)
+
+        if total_points <= self.chunk_points:
+            data = self.decode_sweep_chunk(self.query_sweep_chunk(start_index, end_index))
+            return data[0::2], data[1::2]
+
+        # Large buffers: this thread, which holds the session, keeps querying the next chunk while a
+        # decoder thread parses and copies the last one
+        voltage = np.empty(total_points)
+        current = np.empty(total_points)
+        chunks = queue.Queue(maxsize=2)
+        errors = []
+
+        def decode_chunks():
+            while True:
+                chunk_start, chunk = chunks.get()
+                if chunk_start is None:
+                    return
+                if errors:
+                    continue  # Keep draining so the querying thread never blocks on a full queue
+                try:
+                    data = self.decode_sweep_chunk(chunk)
+                    offset = chunk_start - start_index
+                    voltage[offset:offset + len(data) // 2] = data[0::2]
+                    current[offset:offset + len(data) // 2] = data[1::2]
+                except Exception as e:
+                    errors.append(e)
+
+        decoder = threading.Thread(target=decode_chunks, daemon=True)
+        decoder.start()
+        try:
+            for chunk_start in range(start_index, end_index + 1, self.chunk_points):
+                chunk_end = min(chunk_start + self.chunk_points - 1, end_index)
+                chunks.put((chunk_start, self.query_sweep_chunk(chunk_start, chunk_end)))
+        finally:
+            chunks.put((None, None))
+            decoder.join()
+        if errors:
+            raise errors[0]
+        return voltage, current
+
+    def sweep_data_query(self, start_index, end_index):
+        return f'TRAC:DATA? {start_index}, {end_index}, "defbuffer1", SOUR, READ'
+
+    def query_sweep_chunk(self, start_index, end_index):
+        # Returns the interleaved source, reading values as an array (binary) or as the raw response text (ASCII)
+        query = self.sweep_data_query(start_index, end_index)
+        if self.readback_format != 'ascii':
+            data_format, datatype = READBACK_FORMATS[self.readback_format]
+            from pyvisa.errors import VisaIOError  # Only here, so the module imports without pyvisa's cost
+            try:
+                self.set_data_format(data_format)
+                # container=np.ndarray makes pyvisa wrap the received block with np.frombuffer, so no copy is made
+                return self.smu.query_binary_values(query, datatype=datatype, is_big_endian=False,
+                                                    container=np.ndarray)
+            except (VisaIOError, ValueError) as e:
+                print(f"Binary readback failed ({e}), falling back to ASCII")
+                self.smu.clear()
+                self.readback_format = 'ascii'
+
+        self.set_data_format('ASC')
+        return self.smu.query(query)
+
+    def decode_sweep_chunk(self, chunk):
+        if isinstance(chunk, str):
+            return np.array(chunk.strip().split(','), dtype=float)
+        return chunk
 
     def fetch_and_process_data(self, input_power):
-        data = self.smu.query('TRAC:DATA? 1, 56, "defbuffer1", SOUR, READ')
-        data_points = data.strip().split(',')
-        voltage = np.array(data_points[0::2], dtype=float)
-        current = np.array(data_points[1::2], dtype=float)
-        power = voltage * current
-        max_power_index = np.argmax(power)
-        mpp_voltage = voltage[max_power_index]
-        max_power = power[max_power_index]
-        zero_voltage_index = np.argmin(np.abs(voltage))
-        isc = current[zero_voltage_index]
-        #isc = np.max(current)
-        voc_index = np.argmin(np.abs(current))
-        voc = voltage[voc_index]
-        #voc_index = np.where(current >= 0)[0][-1]
-        #voc = voltage[voc_index]
-        efficiency = (max_power / input_power) * 100 if input_power > 0 else 0
-        return voltage, current, power, mpp_voltage, max_power, isc, voc, efficiency
+        voltage, current = self.read_sweep_data()
+        if len(voltage) == 0:
+            raise RuntimeError("The SMU returned no sweep data")
+        power, figures = self.analyse_sweep(voltage, current, input_power)
+        return (voltage, current, power, figures['mpp_voltage'], figures['max_power'], figures['isc'], figures['voc'],
+                figures['efficiency'])
+
+    @TRACER.traced('analysis', 'host')
+    def analyse_sweep(self, voltage, current, input_power):
+        # Interpolated Isc/Voc, parabolic MPP, fill factor and Rs/Rsh, see iv_analysis.py
+        results = analyse_curves(voltage, current, input_power if input_power > 0 else None)
+        figures = {name: float(values[0]) for name, values in results.items()}
+        return voltage * current, figures
+
+    def fetch_summary(self, input_power):
+        # The SCPI command set cannot reduce the sweep on the instrument, so compute it here and drop the curve
+        voltage, current, power, mpp_voltage, max_power, isc, voc, efficiency = self.fetch_and_process_data(input_power)
+        return mpp_voltage, max_power, isc, voc, efficiency
 
+    @TRACER.traced('plot', 'save')
     def plot_and_save(self, voltage, current, power, mpp_voltage, max_power, isc, voc, efficiency, save_directory,
                       measurement_identifier=None):
         if not os.path.exists(save_directory):
@@ -72,31 +428,51 @@ class MeasurementSystem:
         suffix = f"_{measurement_identifier}" if measurement_identifier is not None else ""
         iv_plot_filename = os.path.join(save_directory, f'IV_Curve{suffix}.png')
         pv_plot_filename = os.path.join(save_directory, f'PV_Curve{suffix}.png')
-        values_filename = os.path.join(save_directory, f'Calculated_Values{suffix}.txt')
 
+        # Plotting I-V and P-V Curves into the reusable figures
+        if self.renderer is None:
+            self.renderer = CurvePlotRenderer()
+        self.renderer.render(voltage, current, power, mpp_voltage, max_power, iv_plot_filename, pv_plot_filename)
+        # Keep the curve for the combined multi-pixel figure of the run
+        self.run_overlay.add(measurement_identifier, voltage, current, power)
+
+        # With a run store the values are kept there, the text file is an optional export
+        if self.run_store is None:
+            self.save_values(max_power, isc, voc, efficiency, save_directory, measurement_identifier)
+
+    def start_run(self, run_store=None, baseline_policy=None):
+        # run_store is an optional RunStore that receives every raw sweep and figure of merit of the run,
+        # baseline_policy an optional BaselinePolicy whose cached baselines pixels are normalized against
+        self.run_overlay.clear()
+        self.run_store = run_store
+        self.baseline_policy = baseline_policy
+        if baseline_policy is not None:
+            baseline_policy.start_run()
+
+    def end_run(self):
+        # Measurements after this go to the save directory again instead of the run store, and are not
+        # normalized against the run's baselines
+        self.run_store = None
+        if self.baseline_policy is not None:
+            self.baseline_policy.end_run()
+        self.baseline_policy = None
+
+    def save_run_overlay(self, save_directory):
+        # One figure per run with the curves of every measurement plotted since start_run()
+        self.save(self.plot_run_overlay, save_directory)
+
+    def plot_run_overlay(self, save_directory):
+        if not os.path.exists(save_directory):
+            os.makedirs(save_directory)
+        self.run_overlay.render(os.path.join(save_directory, 'IV_Curve_Overlay.png'),
+                                os.path.join(save_directory, 'PV_Curve_Overlay.png'))
 
-        # Plotting I-V Curve
-        plt.figure()
-        plt.plot(voltage, current, label='I-V Curve')
-        plt.xlabel('Voltage (V)')
-        plt.ylabel('Current (A)')
-        plt.title('I-V Characteristics')
-        plt.legend()
-        plt.grid(True)
-        plt.savefig(iv_plot_filename)  # Use the correct filename with suffix
-        plt.close()
-
-        # Plotting P-V Curve
-        plt.figure()
-        plt.plot(voltage, power, label='P-V Curve')
-        plt.scatter(mpp_voltage, max_power, color='red', label='Max Power Point')  # Marking the MPP point
-        plt.xlabel('Voltage (V)')
-        plt.ylabel('Power (W)')
-        plt.title('P-V Characteristics')
-        plt.legend()
-        plt.grid(True)
-        plt.savefig(pv_plot_filename)  # Use the correct filename with suffix
-        plt.close()
+    @TRACER.traced('values', 'save')
+    def save_values(self, max_power, isc, voc, efficiency, save_directory, measurement_identifier=None):
+        if not os.path.exists(save_directory):
+            os.makedirs(save_directory)
+        suffix = f"_{measurement_identifier}" if measurement_identifier is not None else ""
+        values_filename = os.path.join(save_directory, f'Calculated_Values{suffix}.txt')
 
         # Saving Calculated Values
         with open(values_filename, 'w') as f:  # Use the correct filename with suffix
@@ -106,5 +482,11 @@ class MeasurementSystem:
             f.write(f'Efficiency: {efficiency:.2f}%\n')
 
     def close_connections(self):
-        self.ser.close()
-        self.smu.close()
+        # Make sure every queued plot and file is on disk before shutting down
+        if self.writer is not None:
+            for description, error in self.writer.close():
+                print(f"Failed to save {description}: {error}")
+            self.writer = None
+        # The SMU session is pooled and closed by visa_sessions at exit, only the serial port belongs to us
+        if self.ser is not None:
+            self.ser.close()
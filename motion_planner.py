@@ -0,0 +1,163 @@
+'''
+This file plans the order in which the robot visits pixels during a full-auto run.
+
+The route starts at the robot's current position and visits every pixel once without returning
+home in between. It is built with a nearest-neighbour pass and then shortened with 2-opt; the
+2-opt search is vectorized with NumPy so plates with thousands of pixels plan in seconds.
+
+Running this file prints a simulated travel-time report comparing the planned route with the
+original fixed order that went back home around every measurement:
+    python motion_planner.py [--grid 8x8 --pitch 2.5] [--speed 10]
+
+Authors: Jason Whitney, Amr Mohamed, Prachya Chowdhury
+'''
+
+import argparse
+import math
+import numpy as np
+from pixel_layout import HOME_POSITION, BASELINE_POSITION, PIXEL_POSITIONS, grid_pixels
+
+# Approximate AxiDraw motion limits, scaled by the speed_penup and accel percentages.
+# The maximum XY speed is the pyaxidraw high-resolution limit of 8.6979 in/s.
+AXIDRAW_MAX_SPEED = 8.6979 * 25.4  # mm/s
+AXIDRAW_MAX_ACCELERATION = 40.0 * 25.4  # mm/s^2
+AXIDRAW_DEFAULT_ACCEL = 75  # percent, pyaxidraw default
+
+
+def distance(a, b):
+    return math.hypot(b[0] - a[0], b[1] - a[1])
+
+
+def nearest_neighbour_route(positions, start=HOME_POSITION):
+    keys = list(positions)
+    coordinates = np.array([positions[key] for key in keys], dtype=float).reshape(-1, 2)
+    remaining = np.ones(len(keys), dtype=bool)
+    current = np.asarray(start, dtype=float)
+    route = []
+    for _ in range(len(keys)):
+        distances = np.hypot(*(coordinates - current).T)
+        distances[~remaining] = np.inf
+        index = int(np.argmin(distances))
+        route.append(keys[index])
+        remaining[index] = False
+        current = coordinates[index]
+    return route
+
+
+def two_opt(route, positions, start=HOME_POSITION, max_passes=50):
+    # Open-path 2-opt: the route starts at `start` and does not return, so reversing a tail of the
+    # route only replaces one edge.
+    route = list(route)
+    points = np.array([start] + [positions[key] for key in route], dtype=float)
+    count = len(points)
+    for _ in range(max_passes):
+        improved = False
+        for i in range(count - 2):
+            a, b = points[i], points[i + 1]
+            c = points[i + 2:]  # candidate segment ends j = i+2 .. count-1
+            following = np.vstack([points[i + 3:], np.full((1, 2), np.nan)])  # point after each j, none for the last
+            old = np.hypot(*(b - a)) + np.nan_to_num(np.hypot(*(following - c).T))
+            new = np.hypot(*(c - a).T) + np.nan_to_num(np.hypot(*(following - b).T))
+            gains = old - new
+            best = int(np.argmax(gains))
+            if gains[best] > 1e-9:
+                j = i + 2 + best
+                points[i + 1:j + 1] = points[i + 1:j + 1][::-1]
+                route[i:j] = route[i:j][::-1]  # route is offset by one from points (no start)
+                improved = True
+        if not improved:
+            break
+    return route
+
+
+def plan_route(positions, start=HOME_POSITION):
+    # Shortest visiting order found for the given pixels, as a list of pixel keys
+    if len(positions) < 3:
+        return nearest_neighbour_route(positions, start)
+    return two_opt(nearest_neighbour_route(positions, start), positions, start)
+
+
+def path_length(points):
+    return sum(distance(a, b) for a, b in zip(points, points[1:]))
+
+
+def move_time(length, speed_penup=10, accel=AXIDRAW_DEFAULT_ACCEL):
+    # Trapezoidal velocity profile; short hops never reach full speed
+    speed = AXIDRAW_MAX_SPEED * speed_penup / 100
+    acceleration = AXIDRAW_MAX_ACCELERATION * accel / 100
+    if length <= 0:
+        return 0.0
+    if length < speed ** 2 / acceleration:
+        return 2 * math.sqrt(length / acceleration)
+    return length / speed + speed / acceleration
+
+
+def simulate_travel(points, speed_penup=10, accel=AXIDRAW_DEFAULT_ACCEL, settle_times=None):
+    # Returns (distance in mm, motion time in s, settle time in s) for moving through points in order.
+    # settle_times gives the fixed wait after each move, if any.
+    moves = [distance(a, b) for a, b in zip(points, points[1:])]
+    motion = sum(move_time(length, speed_penup, accel) for length in moves)
+    settle = sum(settle_times) if settle_times is not None else 0.0
+    return sum(moves), motion, settle
+
+
+def original_full_auto_points(positions, baseline_position=BASELINE_POSITION, home=HOME_POSITION):
+    # Fixed order 1..N with a baseline at baseline_position and a return home around every measurement,
+    # waiting 2 s after each move to a measurement position and 1 s after each return home
+    points, settle = [home], []
+    for key in sorted(positions):
+        points += [baseline_position, home, positions[key], home]
+        settle += [2.0, 1.0, 2.0, 1.0]
+    return points, settle
+
+
+def planned_full_auto_points(positions, baseline_position=None, home=HOME_POSITION):
+    # Planned order without returns home; with a baseline_position a baseline is taken before every pixel
+    points = [home]
+    for key in plan_route(positions, home):
+        if baseline_position is not None:
+            points.append(baseline_position)
+        points.append(positions[key])
+    points.append(home)
+    return points
+
+
+def grid_positions(rows, columns, pitch, origin=(0.0, 5.0)):
+    # Serpentine-numbered rectangular grid, used for reports on larger plates
+    return grid_pixels(rows, columns, pitch, origin, serpentine=True)
+
+
+def travel_report(positions, speed_penup=10, accel=AXIDRAW_DEFAULT_ACCEL, baseline_position=BASELINE_POSITION):
+    rows = []
+    points, settle = original_full_auto_points(positions, baseline_position)
+    rows.append(('original order, returns home', *simulate_travel(points, speed_penup, accel, settle)))
+    points = planned_full_auto_points(positions, baseline_position)
+    rows.append(('planned, baseline per pixel', *simulate_travel(points, speed_penup, accel)))
+    points = planned_full_auto_points(positions)
+    rows.append(('planned, pixels only', *simulate_travel(points, speed_penup, accel)))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Simulated travel time of full-auto routes.')
+    parser.add_argument('--grid', help='Report for a ROWSxCOLUMNS grid instead of the 8-pixel substrate')
+    parser.add_argument('--pitch', type=float, default=2.5, help='Grid pitch in mm')
+    parser.add_argument('--speed', type=float, default=10, help='AxiDraw speed_penup in percent')
+    parser.add_argument('--accel', type=float, default=AXIDRAW_DEFAULT_ACCEL, help='AxiDraw accel in percent')
+    args = parser.parse_args()
+
+    positions = PIXEL_POSITIONS
+    if args.grid:
+        rows, columns = [int(value) for value in args.grid.lower().split('x')]
+        positions = grid_positions(rows, columns, args.pitch)
+
+    print(f"{len(positions)} pixels, speed_penup {args.speed}%, accel {args.accel}%")
+    print(f"{'route':<32}{'distance (mm)':>15}{'motion (s)':>12}{'fixed waits (s)':>17}")
+    for name, length, motion, settle in travel_report(positions, args.speed, args.accel):
+        print(f"{name:<32}{length:>15.1f}{motion:>12.1f}{settle:>17.1f}")
+    if len(positions) <= 20:
+        print(f"Planned pixel order: {plan_route(positions)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+'''
+This file replaces the fixed ad.delay(2000)/ad.delay(1000) waits after AxiDraw moves with a wait
+that matches the move.
+
+Two strategies are available:
+    'computed'  wait for the travel time of a trapezoidal profile computed from the move distance
+                and the configured speed_penup/accel, plus a settling margin
+    'query'     poll the EBB with the QG (query general) command until the motion queue is idle,
+                plus a settling margin; falls back to 'computed' if the query is not available
+
+Every move's wait is recorded and printed so the gain in throughput can be checked.
+
+Authors: Jason Whitney, Amr Mohamed, Prachya Chowdhury
+'''
+
+import math
+import time
+from motion_planner import move_time, AXIDRAW_DEFAULT_ACCEL
+from tracing import TRACER
+
+# QG status bits: FIFO not empty, motor 2 moving, motor 1 moving, command executing
+EBB_MOTION_BITS = 0b1111
+
+
+class MotionSettler:
+    def __init__(self, ad, strategy='computed', settle_margin_ms=150, poll_interval=0.01, query_timeout=30.0,
+                 position=(0, 0), verbose=True):
+        if strategy not in ('computed', 'query'):
+            raise ValueError(f"Unknown settle strategy '{strategy}', expected 'computed' or 'query'")
+        self.ad = ad
+        self.strategy = strategy
+        self.settle_margin_ms = settle_margin_ms
+        self.poll_interval = poll_interval
+        self.query_timeout = query_timeout
+        self.position = tuple(position)
+        self.verbose = verbose
+        self.move_log = []
+
+    def computed_wait_ms(self, length):
+        speed_penup = getattr(self.ad.options, 'speed_penup', 25)
+        accel = getattr(self.ad.options, 'accel', AXIDRAW_DEFAULT_ACCEL)
+        return move_time(length, speed_penup, accel) * 1000
+
+    def motion_idle(self):
+        status = self.ad.usb_query('QG\r')
+        return not (int(str(status).strip(), 16) & EBB_MOTION_BITS)
+
+    def wait_until_idle(self):
+        # Returns the time waited in ms
+        start = time.monotonic()
+        while not self.motion_idle():
+            if time.monotonic() - start > self.query_timeout:
+                raise TimeoutError(f"AxiDraw still moving after {self.query_timeout} s")
+            time.sleep(self.poll_interval)
+        return (time.monotonic() - start) * 1000
+
+    @TRACER.traced('move', 'robot')
+    def move_to(self, x, y):
+        start = time.monotonic()
+        length = math.hypot(x - self.position[0], y - self.position[1])
+        self.ad.moveto(x, y)
+
+        strategy = self.strategy
+        if strategy == 'query':
+            try:
+                self.wait_until_idle()
+                if self.settle_margin_ms > 0:
+                    self.ad.delay(self.settle_margin_ms)
+            except (AttributeError, ValueError) as e:
+                # Older pyaxidraw without usb_query, or an unexpected reply
+                print(f"Motion queue query unavailable ({e}), using computed waits")
+                self.strategy = strategy = 'computed'
+        if strategy == 'computed':
+            wait_ms = self.computed_wait_ms(length) + self.settle_margin_ms
+            self.ad.delay(int(math.ceil(wait_ms)))
+
+        waited_ms = (time.monotonic() - start) * 1000
+        self.move_log.append({'from': self.position, 'to': (x, y), 'distance': length, 'strategy': strategy,
+                              'wait_ms': waited_ms})
+        if self.verbose:
+            print(f"Moved {self.position} -> {(x, y)}: {length:.1f} mm, waited {waited_ms:.0f} ms ({strategy})")
+        self.position = (x, y)
+        return waited_ms
+
+    def summary(self):
+        waits = [move['wait_ms'] for move in self.move_log]
+        if not waits:
+            return {'moves': 0}
+        return {
+            'moves': len(waits),
+            'total_wait_ms': sum(waits),
+            'mean_wait_ms': sum(waits) / len(waits),
+            'max_wait_ms': max(waits),
+            'distance_mm': sum(move['distance'] for move in self.move_log),
+        }
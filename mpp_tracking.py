@@ -0,0 +1,78 @@
+'''
+This file contains the MPP tracking used for stability and soak tests, where the same pixels are
+measured over and over.
+
+The first measurement of a pixel is a full sweep and seeds the tracker with its MPP. After that
+each measurement only sources a handful of levels: 0 V for Isc and a few points spaced step apart
+around the last MPP. A parabola through them gives the new MPP (perturb and observe with a fit
+instead of single steps), which the tracker then follows. When the maximum is no longer inside the
+window, or Pmax moved by more than drift_threshold from the Pmax of the last full sweep, the caller
+is told to fall back to a full sweep; with max_age_s a full sweep is also taken when the last one is
+older than that.
+
+Voc is not measured while tracking; the value of the last full sweep is reported.
+
+Authors: Jason Whitney, Amr Mohamed, Prachya Chowdhury
+'''
+
+import time
+import numpy as np
+from iv_analysis import parabolic_peak
+
+
+class MppTracker:
+    def __init__(self, step=0.01, points=5, drift_threshold=0.05, step_delay=0.005, max_age_s=None):
+        self.step = step  # Spacing of the levels around the MPP in V
+        self.points = points
+        self.drift_threshold = drift_threshold  # Relative change of Pmax that forces a full sweep
+        self.step_delay = step_delay
+        self.max_age_s = max_age_s
+        self.pixels = {}  # Pixel -> figures of the last measurement plus when and at what Pmax it was last swept
+
+    def seed(self, pixel, figures):
+        self.pixels[pixel] = dict(figures, swept_at=time.time(), swept_power=figures['max_power'])
+
+    def forget(self, pixel=None):
+        if pixel is None:
+            self.pixels.clear()
+        else:
+            self.pixels.pop(pixel, None)
+
+    def levels(self, pixel):
+        # Source levels for tracking this pixel, None when it has to be swept first
+        state = self.pixels.get(pixel)
+        if state is None:
+            return None
+        if self.max_age_s is not None and time.time() - state['swept_at'] >= self.max_age_s:
+            return None
+        offsets = (np.arange(self.points) - (self.points - 1) / 2) * self.step
+        return np.concatenate([[0.0], state['mpp_voltage'] + offsets])
+
+    def update(self, pixel, voltage, current, input_power):
+        # Figures of merit from a tracking measurement, or None if the MPP drifted out of reach
+        state = self.pixels[pixel]
+        # The first level is 0 V (see levels()); located by position because with source readback on
+        # the returned voltage is only close to 0
+        isc = float(current[0])
+        orientation = -1.0 if isc < 0 else 1.0
+        voltage, current = voltage[1:], current[1:] * orientation
+        power = voltage * current
+
+        peak = int(np.argmax(power))
+        mpp_voltage, max_power = [float(value[0]) for value in parabolic_peak(voltage[None], power[None])]
+        # Against the last full sweep, so a slow decline over many tracked points is caught too
+        swept_power = state['swept_power']
+        drift = abs(max_power - swept_power) / abs(swept_power) if swept_power else np.inf
+        if peak in (0, len(power) - 1) or drift > self.drift_threshold:
+            return None
+
+        figures = {
+            'mpp_voltage': mpp_voltage,
+            'max_power': max_power,
+            'isc': abs(isc),
+            'voc': state['voc'],
+            'efficiency': max_power / input_power * 100 if input_power > 0 else 0,
+            'tracked': True,
+        }
+        state.update(figures)
+        return figures
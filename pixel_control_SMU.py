@@ -5,14 +5,21 @@ Authors: Jason Whitney, Amr Mohamed, Prachya Chowdhury
 '''
 
 import tkinter as tk
-import serial
-import pyvisa
 import numpy as np
-import matplotlib.pyplot as plt
 import os
-import time
-import threading
-import pandas as pd
+from instrument_config import SWEEP_SETTINGS, config_cache_for
+from visa_sessions import get_session
+from plot_renderer import CurvePlotRenderer
+from run_store import RunStore
+from iv_analysis import analyse_curves
+from device_layer import DeviceLayer, PixelSwitchDriver, SmuDriver
+from switch_protocol import open_pixel_switch
+from pixel_layout import PIXEL_COMMANDS
+from smu_pool import SmuPool
+
+SMU_ADDRESS = 'USB0::0x05E6::0x2450::04387860::INSTR'
+# With more than one SMU wired to the switch, this file maps each of them to its pixels (see smu_pool.py)
+SMU_POOL_CONFIG = 'smu_pool.json'
 
 
 class PixelControlSystem:
@@ -31,6 +38,9 @@ class PixelControlSystem:
         # Assign the save directory
         self.save_directory = save_directory
 
+        # Every sweep of this session is appended to one run store in the save directory
+        self.run_store = RunStore(save_directory)
+
         # Get the input power value from the user
         self.input_power = float(input("Enter the input power (in Watts): "))
         # Get voltage sweep parameters from user
@@ -40,20 +50,23 @@ class PixelControlSystem:
         self.step_delay = float(input("Enter the step delay (in seconds): "))
 
 
-        # Initialize serial connection
-        self.ser = serial.Serial('COM7', 9600)
+        # Initialize serial connection, with the framed protocol when the Arduino firmware has it
+        self.switch = open_pixel_switch('COM7')
+
+        # The GUI only submits jobs, the device layer owns the serial port and the SMU
+        self.devices = DeviceLayer(switch=PixelSwitchDriver(self.switch), smu=SmuDriver())
+
+        # Relay code of each pixel on the switch
+        self.pixel_commands = PIXEL_COMMANDS
 
-        # Define pixel commands
-        self.pixel_commands = {
-            1: ('o', 'r'),
-            2: ('o', 'g'),
-            3: ('o', 'b'),
-            4: ('o', 'f'),
-            5: ('o', 'y'),
-            6: ('o', 'u'),
-            7: ('o', 'i'),
-            8: ('o', 'k')
-        }
+        # I-V and P-V figures are built once and reused for every measurement
+        self.renderer = CurvePlotRenderer()
+
+        # Several SMUs measure the pixels of their groups at the same time
+        self.smu_pool = None
+        if os.path.exists(SMU_POOL_CONFIG):
+            self.smu_pool = SmuPool.from_config(SMU_POOL_CONFIG)
+            self.smu_pool.start_run(self.run_store)
 
         # Create the GUI
         self.create_gui()
@@ -75,6 +88,8 @@ class PixelControlSystem:
             "NEXT": (200, 370),
             "OFF": (125, 580)
           }
+        if self.smu_pool is not None:
+            buttons["ALL"] = (150, 470)
 
         for name, position in buttons.items():
             pixel_num = int(name[5:]) if name.startswith("Pixel") else name
@@ -82,110 +97,91 @@ class PixelControlSystem:
             button.place(x=position[0], y=position[1], width=50, height=50)
 
     def button_click(self, pixel_number):
-        commands = self.pixel_commands.get(pixel_number, ())
-        for cmd in commands:
-            self.ser.write(cmd.encode())
-        time.sleep(1)
-        # Start perform_measurement in a new thread
-        measurement_thread = threading.Thread(target=self.perform_measurement)
-        measurement_thread.start()
-
-    def perform_measurement(self):
-        # Establish communication with the instrument
-        rm = pyvisa.ResourceManager()
-        smu = rm.open_resource('USB0::0x05E6::0x2450::04387860::INSTR')
-
-        # Measurement code...
-        # Reset and configure the instrument
-        smu.write('*RST')  # resets SMU before each solar cell measurement
-        smu.write('*CLS')  # clears the error queue
-        smu.write('SENS:FUNC "CURR"')  # sets the test for current measurement
-        smu.write('SENS:CURR:RANG:AUTO ON')
-        smu.write('SENS:CURRent:RSENse OFF')  # changes test from default 4-wire to 2-wire
-        smu.write('SOUR:FUNC VOLT')  # sets the output function to voltage
-        smu.write('SOUR:VOLT:RANG 2')  # sets max allowable output voltage
-        smu.write('SOUR:VOLT:ILIM 1')  # Sets current limit to 1 amp
-        smu.write(f'SOUR:SWE:VOLT:LIN {self.start_voltage}, {self.stop_voltage}, {self.step_count}, {self.step_delay}')
-        smu.write(':INIT')  # initializes SMU with the above parameters
-        smu.write('*WAI')  # set SMU to wait for command
-
-        # Fetch the data
-        smu.timeout = 20000  # Timeout in milliseconds, adjust as needed
-
-        # Adjust the number of data points to be fetched based on the step count
-        data_points_to_fetch = self.step_count * 2  # Two data points (voltage, current) per step
-
-        # Construct the query command with the correct number of data points
-        data_query = f'TRAC:DATA? 1, {data_points_to_fetch}, "defbuffer1", SOUR, READ'
-        data = smu.query(data_query)
-        #data = smu.query('TRAC:DATA? 1, 56, "defbuffer1", SOUR, READ')
+        if pixel_number == "ALL":
+            self.devices.submit(self.pool_job, description="all pixels")
+            return
+        # Queue the pixel as a job; clicks during a measurement wait their turn instead of
+        # interleaving commands on the serial port or the SMU
+        self.devices.submit(self.pixel_job, pixel_number, description=f"pixel {pixel_number}")
+
+    async def pixel_job(self, devices, pixel_number):
+        # Returns once the relays have settled; buttons without a pixel open every relay
+        codes = [self.pixel_commands[pixel_number]] if pixel_number in self.pixel_commands else []
+        await devices.switch.select(*codes)
+        await devices.smu.call(self.perform_measurement, pixel_number)
+
+    async def pool_job(self, devices):
+        # Every pixel, one per SMU at a time; the pool's threads reach the switch through its queue
+        def select(round_pixels):
+            devices.call(devices.switch.select(*(self.pixel_commands[pixel] for pixel in round_pixels)))
+
+        pixels = [pixel for pixel in self.pixel_commands if pixel in self.smu_pool.pixel_addresses]
+        await devices.run_in_worker(self.smu_pool.measure, pixels, self.save_directory, self.input_power,
+                                    self.start_voltage, self.stop_voltage, self.step_count, self.step_delay, select)
+        await devices.run_in_worker(self.smu_pool.flush_saves)
+
+    def perform_measurement(self, pixel_number=None):
+        # Use the shared session for the instrument, it stays open between measurements
+        smu = get_session(SMU_ADDRESS)
+
+        # Hold the session for the whole sweep so another click cannot interleave commands
+        with smu:
+            # Measurement code...
+            # Configure the instrument, resetting it only before the first measurement of the session.
+            # After that only settings that changed since the last measurement are written.
+            config_cache = config_cache_for(SMU_ADDRESS)
+            if not config_cache.is_initialized():
+                config_cache.reset(smu)  # resets SMU and clears the error queue
+            config_cache.write_all(smu, SWEEP_SETTINGS)  # current measurement, 2-wire, 2 V range, 1 A limit
+            config_cache.write(smu, f'SOUR:SWE:VOLT:LIN {self.start_voltage}, {self.stop_voltage}, {self.step_count}, '
+                                    f'{self.step_delay}')
+            smu.write(':INIT')  # initializes SMU with the above parameters
+            smu.write('*WAI')  # set SMU to wait for command
+
+            # Fetch the data
+            smu.timeout = 20000  # Timeout in milliseconds, adjust as needed
+
+            config_cache.write(smu, 'FORM:DATA ASC')  # this program parses the text readback
+            # Fetch as many points as the sweep actually stored in the buffer
+            data_points_to_fetch = int(float(smu.query('TRAC:ACT? "defbuffer1"')))
+
+            # Construct the query command with the correct number of data points
+            data_query = f'TRAC:DATA? 1, {data_points_to_fetch}, "defbuffer1", SOUR, READ'
+            data = smu.query(data_query)
+            #data = smu.query('TRAC:DATA? 1, 56, "defbuffer1", SOUR, READ')
 
         # Process the data
         data_points = data.strip().split(',')
         voltage = np.array(data_points[0::2], dtype=float)
         current = np.array(data_points[1::2], dtype=float)
         power = voltage * current
-        max_power_index = np.argmax(power)
-        mpp_voltage = voltage[max_power_index]
-        max_power = power[max_power_index]
-
-        # Creating DataFrame from 'data_points'
-        data_points_df = pd.DataFrame({'Voltage (V)': voltage, 'Current (A)': current})
-        data_points_excel_filename = os.path.join(self.save_directory, 'Data_Points.xlsx')
-        data_points_df.to_excel(data_points_excel_filename, index=False)
-
-        # Find Isc and Voc
-        zero_voltage_index = np.argmin(np.abs(voltage))
-        isc = current[zero_voltage_index]
-        #isc = np.max(current)
-        voc_index = np.argmin(np.abs(current))
-        voc = voltage[voc_index]
-        #voc_index = np.where(current >= 0)[0][-1]
-        #voc = voltage[voc_index]
-
-        # Calculate efficiency
-        efficiency = (max_power / self.input_power) * 100 if self.input_power > 0 else 0
-
-        # Plotting and Saving
-        iv_plot_filename = os.path.join(self.save_directory, 'IV_Curve.png')
-        pv_plot_filename = os.path.join(self.save_directory, 'PV_Curve.png')
-        values_filename = os.path.join(self.save_directory, 'Calculated_Values.txt')
-
-        plt.figure()
-        plt.plot(voltage, current, label='I-V Curve')
-        plt.xlabel('Voltage (V)')
-        plt.ylabel('Current (A)')
-        plt.title('I-V Characteristics')
-        plt.legend()
-        plt.grid(True)
-        plt.savefig(iv_plot_filename)
-        plt.close()
-
-        plt.figure()
-        plt.plot(voltage, power, label='P-V Curve')
-        plt.scatter(mpp_voltage, max_power, color='red')  # MPP point
-        plt.xlabel('Voltage (V)')
-        plt.ylabel('Power (W)')
-        plt.title('P-V Characteristics')
-        plt.legend()
-        plt.grid(True)
-        plt.savefig(pv_plot_filename)
-        plt.close()
-
-        with open(values_filename, 'w') as f:
-            f.write(f'Maximum Power (Pmax): {max_power:.4f} W\n')
-            f.write(f'Short Circuit Current (Isc): {isc:.4f} A\n')
-            f.write(f'Open Circuit Voltage (Voc): {voc:.4f} V\n')
-            f.write(f'Efficiency: {efficiency:.2f}%\n')
-
-        smu.close()
+        # Interpolated Isc and Voc, parabolic MPP, fill factor and Rs/Rsh
+        figures = {name: float(values[0]) for name, values in
+                   analyse_curves(voltage, current, self.input_power if self.input_power > 0 else None).items()}
+        mpp_voltage, max_power = figures['mpp_voltage'], figures['max_power']
+
+        # Keep the raw sweep and the calculated values in the run store. Data_Points.xlsx and the
+        # Calculated_Values text files can be exported from it afterwards with run_store.py.
+        pixel = pixel_number if isinstance(pixel_number, int) else None
+        record = self.run_store.append(pixel, voltage, current, figures, label=pixel_number)
+
+        # Plotting and Saving, named after the pixel and the run store record so no plot is overwritten
+        suffix = f"_{pixel_number}_{self.run_store.run_id}_{record}"
+        iv_plot_filename = os.path.join(self.save_directory, f'IV_Curve{suffix}.png')
+        pv_plot_filename = os.path.join(self.save_directory, f'PV_Curve{suffix}.png')
+
+        self.renderer.render(voltage, current, power, mpp_voltage, max_power, iv_plot_filename, pv_plot_filename)
 
     def run(self):
         self.root.mainloop()  # Start the GUI event loop
 
     def close(self):
+        # Stop the device layer before closing the port it uses
+        self.devices.close()
+        if self.smu_pool is not None:
+            self.smu_pool.close()
         # Close serial connection
-        self.ser.close()
+        self.switch.close()
 
 if __name__ == "__main__":
     pixel_control_system = PixelControlSystem()
@@ -5,13 +5,13 @@ Authors: Jason Whitney, Amr Mohamed, Prachya Chowdhury
 '''
 
 import tkinter as tk
-import serial
-import pyvisa
-import numpy as np
-import matplotlib.pyplot as plt
 import os
-import time
-import threading
+from tsp_measurement_system import TspMeasurementSystem
+from device_layer import DeviceLayer, PixelSwitchDriver, SmuDriver
+from switch_protocol import open_pixel_switch
+from pixel_layout import PIXEL_COMMANDS
+
+SMU_ADDRESS = 'USB0::0x05E6::0x2450::04387860::INSTR'
 
 class PixelControlSystem:
     def __init__(self):
@@ -38,20 +38,17 @@ class PixelControlSystem:
         self.step_delay = float(input("Enter the step delay (in seconds): "))
 
 
-        # Initialize serial connection
-        self.ser = serial.Serial('COM7', 9600)
+        # Initialize serial connection, with the framed protocol when the Arduino firmware has it
+        self.switch = open_pixel_switch('COM7')
+
+        # TSP backend of the measurement system, the serial port above stays with this class
+        self.measurement_system = TspMeasurementSystem(SMU_ADDRESS, ser_port=None)
 
-        # Define pixel commands #
-        self.pixel_commands = {
-            1: ('o', 'r'),
-            2: ('o', 'g'),
-            3: ('o', 'b'),
-            4: ('o', 'f'),
-            5: ('o', 'y'),
-            6: ('o', 'u'),
-            7: ('o', 'i'),
-            8: ('o', 'k')
-        }
+        # The GUI only submits jobs, the device layer owns the serial port and the SMU
+        self.devices = DeviceLayer(switch=PixelSwitchDriver(self.switch), smu=SmuDriver(self.measurement_system))
+
+        # Relay code of each pixel on the switch
+        self.pixel_commands = PIXEL_COMMANDS
 
         # Create the GUI
         self.create_gui()
@@ -80,88 +77,25 @@ class PixelControlSystem:
             button.place(x=position[0], y=position[1], width=50, height=50)
 
     def button_click(self, pixel_number):
-        commands = self.pixel_commands.get(pixel_number, ())
-        for cmd in commands:
-            self.ser.write(cmd.encode())
-        time.sleep(1)
-        # Start perform_measurement in a new thread
-        measurement_thread = threading.Thread(target=self.perform_measurement)
-        measurement_thread.start()
+        # Queue the pixel as a job; clicks during a measurement wait their turn instead of
+        # interleaving commands on the serial port or the SMU
+        self.devices.submit(self.pixel_job, pixel_number, description=f"pixel {pixel_number}")
+
+    async def pixel_job(self, devices, pixel_number):
+        # Returns once the relays have settled; buttons without a pixel open every relay
+        codes = [self.pixel_commands[pixel_number]] if pixel_number in self.pixel_commands else []
+        await devices.switch.select(*codes)
+        await devices.smu.call(self.perform_measurement)
 
     def perform_measurement(self):
-        rm = pyvisa.ResourceManager()
-        try:
-            smu = rm.open_resource('USB0::0x05E6::0x2450::04387860::INSTR')
-            tsp_script = f"""
-                    -- Define the number of points in the sweep.
-                    num = {self.step_count}
-
-                    -- Reset the instrument and clear the buffer.
-                    reset()
-
-                    -- Set the source and measure functions.
-                    smu.measure.func = smu.FUNC_DC_CURRENT
-                    smu.source.func = smu.FUNC_DC_VOLTAGE
-
-                    -- Measurement settings.
-                    smu.terminals = smu.TERMINALS_FRONT
-                    smu.measure.sense = smu.SENSE_4WIRE
-                    smu.measure.autorange = smu.ON
-                    smu.measure.nplc = 1
-
-                    -- Source settings.
-                    smu.source.highc = smu.OFF
-                    smu.source.range = 2
-                    smu.source.readback = smu.ON
-                    smu.source.ilimit.level = 1
-                    smu.source.sweeplinear("SolarCell", {self.start_voltage}, {self.stop_voltage}, num, {self.step_delay})
-
-                    -- Start the trigger model and wait for it to complete.
-                    trigger.model.initiate()
-                    waitcomplete()
-
-                    -- Define initial values.
-                    voltage = defbuffer1.sourcevalues
-                    current = defbuffer1
-                    isc = current[1]
-                    mincurr = current[1]
-                    imax = current[1]
-                    voc = voltage[1]
-                    vmax = voltage[1]
-                    pmax = voltage[1] * current[1]
-
-                    -- Calculate values.
-                    for i = 1, num do
-                        print(voltage[i], current[i], voltage[i] * current[i])
-                        if (voltage[i] * current[i] < pmax) then
-                            pmax = voltage[i] * current[i]
-                            imax = current[i]
-                            vmax = voltage[i]
-                        end
-                        if math.abs(current[i]) < math.abs(mincurr) then
-                            voc = voltage[i]
-                        end
-                    end
-
-                    pmax = math.abs(pmax)
-                    imax = math.abs(imax)
-
-                    -- Print calculated maximum power, current, and voltage
-                    print("Pmax = ", pmax, ", Imax = ", imax, ", Vmax = ", vmax, ", Isc = ", isc, ", Voc = ", voc)
-
-                    -- Display values on the front panel.
-                    display.changescreen(display.SCREEN_USER_SWIPE)
-                    display.settext(display.TEXT1, string.format("Pmax = %.4fW", pmax))
-                    display.settext(display.TEXT2, string.format("Isc = %.4fA, Voc = %.2fV", isc, voc))
-                    """
-
-            # Send the TSP script to the instrument
-            smu.write(tsp_script)
-
-            # Read the response (if applicable)
-            response = smu.read()
-            print(response)
-
-        finally:
-            # Close the connection
-            smu.close()
\ No newline at end of file
+        # The sweep routine lives on the instrument as a named TSP function, so each click only
+        # sends the call with the sweep parameters. The shared session is held for the whole
+        # measurement so another click cannot interleave commands.
+        with self.measurement_system.smu:
+            self.measurement_system.configure_instrument(self.start_voltage, self.stop_voltage, self.step_count,
+                                                         self.step_delay)
+            # Only the figures of merit computed on the instrument are read back, not the curve
+            mpp_voltage, max_power, isc, voc, efficiency = self.measurement_system.fetch_summary(self.input_power)
+
+        # Print calculated maximum power, voltage, Isc and Voc
+        print(f"Pmax = {max_power}, Vmax = {mpp_voltage}, Isc = {isc}, Voc = {voc}, Efficiency = {efficiency:.2f}%")
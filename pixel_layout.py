@@ -0,0 +1,217 @@
+'''
+This file holds the substrate layout shared by the robot control programs.
+
+Positions are AxiDraw coordinates in millimetres (ad.options.units = 2).
+
+The constants below describe the original 8-pixel substrate. Plates with more devices are described
+by a layout file instead (LAYOUT_FILE, JSON) holding one entry per grid of pixels:
+    {"home": [0, 0], "baseline": [10, 20],
+     "substrates": [{"origin": [0, 5], "rows": 4, "columns": 2, "pitch": 5, "order": "columns",
+                     "serpentine": true, "commands": ["r", "g", "b", "f", "y", "u", "i", "k"]}],
+     "offsets": {"3": [0.2, -0.1]}}
+Rows run along y and columns along x. pitch is one value or [x, y]. Pixels are numbered from 1 (or
+"first") through the substrates in order, along "order" ("rows" or "columns"), and with serpentine
+every other row or column is numbered backwards. offsets moves single devices off their grid position,
+and "pixels": {"9": [x, y]} adds devices that are not on a grid. Every pixel's Arduino switch command
+is taken from "commands" and falls back to "default_command".
+
+Authors: Jason Whitney, Amr Mohamed, Prachya Chowdhury
+'''
+
+import json
+import math
+import os
+import numpy as np
+
+HOME_POSITION = (0, 0)
+
+# Alternative position used for the baseline (reference) measurement
+BASELINE_POSITION = (10, 20)
+
+PIXEL_POSITIONS = {
+    1: (0, 5),
+    2: (0, 10),
+    3: (0, 15),
+    4: (0, 20),
+    5: (5, 20),
+    6: (5, 15),
+    7: (5, 10),
+    8: (5, 5)
+}
+
+# Arduino pixel-select command for each pixel, 'o' for any other
+PIXEL_COMMANDS = {
+    1: 'r',
+    2: 'g',
+    3: 'b',
+    4: 'f',
+    5: 'y',
+    6: 'u',
+    7: 'i',
+    8: 'k'
+}
+DEFAULT_PIXEL_COMMAND = 'o'
+
+# Loaded instead of the constants above when it exists
+LAYOUT_FILE = 'pixel_layout.json'
+
+
+def grid_pixels(rows, columns, pitch, origin=(0.0, 0.0), order='rows', serpentine=False, first=1):
+    # {pixel: (x, y)} of one rectangular grid
+    pitch_x, pitch_y = (pitch, pitch) if np.isscalar(pitch) else pitch
+    outer, inner = (rows, columns) if order == 'rows' else (columns, rows)
+    positions = {}
+    for i in range(outer):
+        for j in range(inner):
+            k = inner - 1 - j if serpentine and i % 2 else j
+            row, column = (i, k) if order == 'rows' else (k, i)
+            positions[first + i * inner + j] = (origin[0] + column * pitch_x, origin[1] + row * pitch_y)
+    return positions
+
+
+class GridIndex:
+    # Spatial index of pixel positions in square buckets, for nearest-pixel and region queries on
+    # plates with thousands of devices
+    def __init__(self, positions, cell_size=None):
+        self.pixels = list(positions)
+        self.points = np.array([positions[pixel] for pixel in self.pixels], dtype=float).reshape(-1, 2)
+        if cell_size is None:
+            # About one pixel per bucket; a single row or column has no area, so there the buckets are
+            # as wide as the spacing of its pixels
+            span = np.ptp(self.points, axis=0) if len(self.points) else np.zeros(2)
+            if span.min() > 0:
+                cell_size = math.sqrt(span[0] * span[1] / len(self.points))
+            else:
+                cell_size = self.nearest_spacing()
+            if not math.isfinite(cell_size) or cell_size <= 0:
+                cell_size = 1.0
+        self.cell_size = cell_size
+        self.buckets = {}
+        for index, cell in enumerate(map(tuple, np.floor(self.points / cell_size).astype(int))):
+            self.buckets.setdefault(cell, []).append(index)
+        self.buckets = {cell: np.array(indices) for cell, indices in self.buckets.items()}
+        cells = np.array(list(self.buckets)) if self.buckets else np.zeros((1, 2), dtype=int)
+        self.cell_min, self.cell_max = cells.min(axis=0), cells.max(axis=0)
+
+    def cell(self, x, y):
+        return int(math.floor(x / self.cell_size)), int(math.floor(y / self.cell_size))
+
+    def candidates(self, first_cell, last_cell):
+        first_cell = np.maximum(first_cell, self.cell_min)
+        last_cell = np.minimum(last_cell, self.cell_max)
+        found = [self.buckets[(i, j)] for i in range(first_cell[0], last_cell[0] + 1)
+                 for j in range(first_cell[1], last_cell[1] + 1) if (i, j) in self.buckets]
+        return np.concatenate(found) if found else np.empty(0, dtype=int)
+
+    def nearest(self, x, y, max_distance=None):
+        # Pixel closest to (x, y), None if there is none within max_distance
+        if not self.pixels:
+            return None
+        query = np.array(self.cell(x, y))
+        # Rings of buckets around the query, starting with the first that overlaps the plate, until a
+        # ring's closest possible point is further away than the best candidate found so far
+        first_ring = int(np.max(np.maximum(self.cell_min - query, 0) + np.maximum(query - self.cell_max, 0)))
+        last_ring = int(np.max(np.abs(np.concatenate([self.cell_min - query, self.cell_max - query]))))
+        best, best_distance = None, math.inf
+        for ring in range(first_ring, last_ring + 1):
+            closest_possible = (ring - 1) * self.cell_size
+            if closest_possible > best_distance or (max_distance is not None and closest_possible > max_distance):
+                break
+            indices = self.candidates(query - ring, query + ring)
+            if len(indices):
+                distances = np.hypot(*(self.points[indices] - (x, y)).T)
+                closest = int(np.argmin(distances))
+                if distances[closest] < best_distance:
+                    best, best_distance = self.pixels[indices[closest]], float(distances[closest])
+        if max_distance is not None and best_distance > max_distance:
+            return None
+        return best
+
+    def nearest_spacing(self):
+        # Typical distance between neighbouring pixels, the median over a sample of up to 200 pixels
+        if len(self.points) < 2:
+            return 1.0
+        sample = self.points[::max(len(self.points) // 200, 1)]
+        distances = np.hypot(*(sample[:, None, :] - self.points[None, :, :]).transpose(2, 0, 1))
+        distances[distances == 0] = np.inf
+        return float(np.median(distances.min(axis=1)))
+
+    def region_indices(self, x_min, y_min, x_max, y_max):
+        indices = self.candidates(self.cell(x_min, y_min), self.cell(x_max, y_max))
+        points = self.points[indices]
+        inside = (points[:, 0] >= x_min) & (points[:, 0] <= x_max) & (points[:, 1] >= y_min) & (points[:, 1] <= y_max)
+        return np.sort(indices[inside])
+
+    def in_region(self, x_min, y_min, x_max, y_max):
+        # Pixels inside the rectangle, in the order of the layout
+        return [self.pixels[index] for index in self.region_indices(x_min, y_min, x_max, y_max)]
+
+    def within(self, x, y, radius):
+        # Pixels at most radius away from (x, y)
+        indices = self.region_indices(x - radius, y - radius, x + radius, y + radius)
+        distances = np.hypot(*(self.points[indices] - (x, y)).T)
+        return [self.pixels[index] for index in indices[distances <= radius]]
+
+
+class PixelLayout:
+    def __init__(self, positions, commands=None, home=HOME_POSITION, baseline=BASELINE_POSITION,
+                 default_command=DEFAULT_PIXEL_COMMAND):
+        self.positions = {pixel: tuple(position) for pixel, position in positions.items()}
+        self.commands = dict(commands or {})
+        self.home = tuple(home)
+        self.baseline = tuple(baseline)
+        self.default_command = default_command
+        self.index = GridIndex(self.positions)
+
+    @classmethod
+    def default(cls):
+        return cls(PIXEL_POSITIONS, PIXEL_COMMANDS)
+
+    @classmethod
+    def from_spec(cls, spec):
+        positions, commands = {}, {}
+        first = 1
+        for substrate in spec.get('substrates', []):
+            first = substrate.get('first', first)
+            grid = grid_pixels(substrate['rows'], substrate['columns'], substrate['pitch'],
+                               substrate.get('origin', (0.0, 0.0)), substrate.get('order', 'rows'),
+                               substrate.get('serpentine', False), first)
+            overlap = positions.keys() & grid.keys()
+            if overlap:
+                raise ValueError(f"Pixel numbers {sorted(overlap)[:5]} are used by more than one substrate")
+            positions.update(grid)
+            commands.update(zip(grid, substrate.get('commands', [])))
+            first += len(grid)
+        positions.update({int(pixel): tuple(position) for pixel, position in spec.get('pixels', {}).items()})
+        commands.update({int(pixel): command for pixel, command in spec.get('commands', {}).items()})
+        for pixel, (dx, dy) in spec.get('offsets', {}).items():
+            x, y = positions[int(pixel)]
+            positions[int(pixel)] = (x + dx, y + dy)
+        return cls(positions, commands, spec.get('home', HOME_POSITION), spec.get('baseline', BASELINE_POSITION),
+                   spec.get('default_command', DEFAULT_PIXEL_COMMAND))
+
+    @classmethod
+    def from_file(cls, filename):
+        with open(filename) as f:
+            return cls.from_spec(json.load(f))
+
+    def command(self, pixel):
+        return self.commands.get(pixel, self.default_command)
+
+    def nearest(self, x, y, max_distance=None):
+        return self.index.nearest(x, y, max_distance)
+
+    def in_region(self, x_min, y_min, x_max, y_max):
+        return self.index.in_region(x_min, y_min, x_max, y_max)
+
+    def within(self, x, y, radius):
+        return self.index.within(x, y, radius)
+
+    def __len__(self):
+        return len(self.positions)
+
+
+def load_layout(filename=None):
+    # The layout in filename, else LAYOUT_FILE when it exists, else the 8-pixel substrate
+    filename = filename or (LAYOUT_FILE if os.path.exists(LAYOUT_FILE) else None)
+    return PixelLayout.from_file(filename) if filename else PixelLayout.default()
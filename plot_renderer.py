@@ -0,0 +1,85 @@
+'''
+This file renders the I-V and P-V plots with matplotlib's object-oriented API.
+
+The figures and axes are built once and only the line data is replaced for each measurement,
+which avoids rebuilding a figure through the global pyplot state machine for every curve and
+is safe to use from worker threads. OverlayPlot collects the curves of a whole run and draws
+them into one multi-pixel figure.
+
+matplotlib is imported with the first figure, so programs that never plot do not pay for it.
+
+Authors: Jason Whitney, Amr Mohamed, Prachya Chowdhury
+'''
+
+import threading
+
+
+def make_axes(title, ylabel):
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+    figure = Figure()
+    FigureCanvasAgg(figure)
+    axes = figure.add_subplot()
+    axes.set_xlabel('Voltage (V)')
+    axes.set_ylabel(ylabel)
+    axes.set_title(title)
+    axes.grid(True)
+    return figure, axes
+
+
+class CurvePlotRenderer:
+    def __init__(self):
+        self.lock = threading.Lock()
+
+        self.iv_figure, self.iv_axes = make_axes('I-V Characteristics', 'Current (A)')
+        self.iv_line, = self.iv_axes.plot([], [], label='I-V Curve')
+        self.iv_axes.legend()
+
+        self.pv_figure, self.pv_axes = make_axes('P-V Characteristics', 'Power (W)')
+        self.pv_line, = self.pv_axes.plot([], [], label='P-V Curve')
+        self.mpp_marker, = self.pv_axes.plot([], [], 'o', color='red', label='Max Power Point')
+        self.pv_axes.legend()
+
+    def render(self, voltage, current, power, mpp_voltage, max_power, iv_plot_filename, pv_plot_filename):
+        with self.lock:
+            self.iv_line.set_data(voltage, current)
+            self.iv_axes.relim()
+            self.iv_axes.autoscale_view()
+            self.iv_figure.savefig(iv_plot_filename)
+
+            self.pv_line.set_data(voltage, power)
+            self.mpp_marker.set_data([mpp_voltage], [max_power])
+            self.pv_axes.relim()
+            self.pv_axes.autoscale_view()
+            self.pv_figure.savefig(pv_plot_filename)
+
+
+class OverlayPlot:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.curves = []  # (label, voltage, current, power)
+
+    def add(self, label, voltage, current, power):
+        with self.lock:
+            self.curves.append((str(label), voltage, current, power))
+
+    def clear(self):
+        with self.lock:
+            self.curves = []
+
+    def render(self, iv_plot_filename, pv_plot_filename):
+        with self.lock:
+            curves = list(self.curves)
+        if not curves:
+            return False
+        iv_figure, iv_axes = make_axes('I-V Characteristics', 'Current (A)')
+        pv_figure, pv_axes = make_axes('P-V Characteristics', 'Power (W)')
+        for label, voltage, current, power in curves:
+            iv_axes.plot(voltage, current, label=label)
+            pv_axes.plot(voltage, power, label=label)
+        iv_axes.legend(fontsize='small')
+        pv_axes.legend(fontsize='small')
+        iv_figure.savefig(iv_plot_filename)
+        pv_figure.savefig(pv_plot_filename)
+        return True
@@ -0,0 +1,251 @@
+'''
+Headless runner for measurement jobs, without the Tk GUIs and their prompts.
+
+A job file (YAML or JSON) names the hardware once and then lists the jobs, which run one after the
+other on the same connections. Settings under "defaults" apply to every job that does not set them:
+
+    smu: {address: "USB0::0x05E6::0x2450::04387860::INSTR", backend: scpi}   # or tsp
+    robot: true                 # AxiDraw moves to every pixel (full-auto run); false for switch-only setups
+    switch: {port: COM7}        # Arduino pixel switch, optional
+    layout: pixel_layout.json   # optional, see pixel_layout.py; the 8-pixel substrate otherwise
+    defaults:
+      input_power: 0.1
+      sweep: {start: 0.0, stop: 0.7, steps: 50}
+      baseline: {every_n_pixels: 1, max_age_s: 600, drift_threshold: 0.02}
+    jobs:
+      - name: plate_1
+        output: D:/data/plate_1
+        pixels: all             # or a list of pixel numbers
+      - name: plate_2
+        output: D:/data/plate_2
+        pixels: [1, 2, 3, 4]
+        adaptive: true
+        plots: false
+      - name: plate_2_soak      # repeated jobs of the same pixels only track their MPP, see mpp_tracking.py
+        output: D:/data/plate_2
+        pixels: [1, 2, 3, 4]
+        tracking: true
+      - name: plate_1_retry
+        resume: D:/data/plate_1/run_20240101_120000   # continue a full-auto run that stopped early
+
+Every job writes a run store (run_store.py), with its journal and trace for robot runs. A failed job
+is reported and the next one is started, unless --stop-on-error is given.
+
+    python run_jobs.py jobs.yaml [--simulate] [--time-scale 0.1] [--stop-on-error]
+
+--simulate runs the jobs against the simulated SMU, AxiDraw and Arduino, to check a job file.
+Only what a job needs is imported: tkinter never, matplotlib only when a job plots, PyYAML only
+for YAML files and pyaxidraw only for real robot runs.
+
+Authors: Jason Whitney, Amr Mohamed, Prachya Chowdhury
+'''
+
+import argparse
+import json
+import os
+import time
+import traceback
+from measurement_system import MeasurementSystem
+from device_layer import DeviceLayer, AxiDrawDriver, PixelSwitchDriver, SmuDriver
+from full_auto_run import FullAutoRun
+from baseline_policy import BaselinePolicy
+from run_store import RunStore
+from pixel_layout import load_layout
+from tracing import TRACER
+
+DEFAULT_SMU_ADDRESS = 'USB0::0x05E6::0x2450::04387860::INSTR'
+JOB_DEFAULTS = {
+    'input_power': 0.0,
+    'pixels': 'all',
+    'adaptive': False,
+    'tracking': False,
+    'plots': True,
+    'pipelined': True,
+    'baseline': {'every_n_pixels': 1, 'max_age_s': None, 'drift_threshold': None},
+}
+
+
+def load_job_file(filename):
+    with open(filename) as f:
+        if os.path.splitext(filename)[1].lower() in ('.yaml', '.yml'):
+            import yaml  # Only needed for YAML job files
+            return yaml.safe_load(f)
+        return json.load(f)
+
+
+def job_settings(job, defaults):
+    # The job's settings on top of the file's defaults on top of JOB_DEFAULTS
+    settings = dict(JOB_DEFAULTS)
+    for layer in (defaults, job):
+        settings.update(layer)
+    for required in ('output', 'sweep'):
+        if required not in settings and 'resume' not in settings:
+            raise ValueError(f"Job {settings.get('name', '?')} has no {required}")
+    return settings
+
+
+class JobRunner:
+    def __init__(self, config, simulate=False, time_scale=1.0):
+        self.config = config
+        self.simulate = simulate
+        self.time_scale = time_scale
+        self.layout = load_layout(config.get('layout'))
+        self.closers = []  # Called in reverse order by close()
+        self.measurement_system = self.open_smu(config.get('smu', {}))
+        self.robot = self.open_robot() if config.get('robot') else None
+        self.switch = self.open_switch(config['switch']) if config.get('switch') else None
+        self.devices = DeviceLayer(robot=self.robot and AxiDrawDriver(self.robot),
+                                   switch=self.switch and PixelSwitchDriver(self.switch),
+                                   smu=SmuDriver(self.measurement_system))
+        self.closers.append(self.devices.close)
+
+    def open_smu(self, smu_config):
+        system_class = MeasurementSystem
+        if smu_config.get('backend', 'scpi') == 'tsp':
+            from tsp_measurement_system import TspMeasurementSystem
+            system_class = TspMeasurementSystem
+        open_resource = None
+        if self.simulate:
+            from simulated_instrument import SimulatedSMU
+            smu = SimulatedSMU(realtime=True, time_scale=self.time_scale)
+            open_resource = lambda address: smu
+        measurement_system = system_class(smu_config.get('address', DEFAULT_SMU_ADDRESS), ser_port=None,
+                                          open_resource=open_resource)
+        self.closers.append(measurement_system.close_connections)
+        return measurement_system
+
+    def open_robot(self):
+        from motion_settle import MotionSettler
+        if self.simulate:
+            from simulated_hardware import SimulatedAxiDraw
+            ad = SimulatedAxiDraw(time_scale=self.time_scale)
+        else:
+            from pyaxidraw import axidraw
+            ad = axidraw.AxiDraw()
+            ad.interactive()
+            if not ad.connect():
+                raise RuntimeError("Failed to connect to AxiDraw")
+        ad.options.units = 2
+        ad.options.speed_pendown = 10
+        ad.options.speed_penup = 10
+        ad.update()
+        self.closers.append(ad.disconnect)
+        return MotionSettler(ad, strategy='computed', verbose=False)
+
+    def open_switch(self, switch_config):
+        if self.simulate:
+            import serial
+            from simulated_hardware import FakeArduino
+            from switch_protocol import PixelSwitch, PROTOCOL_BAUD
+            arduino = FakeArduino(time_scale=self.time_scale)
+            self.closers.append(arduino.close)
+            switch = PixelSwitch(serial.Serial(arduino.port, PROTOCOL_BAUD))
+        else:
+            from switch_protocol import open_pixel_switch
+            switch = open_pixel_switch(switch_config.get('port', 'COM7'))
+        self.closers.append(switch.close)
+        return switch
+
+    def pixels(self, settings):
+        if settings['pixels'] == 'all':
+            return list(self.layout.positions)
+        missing = [pixel for pixel in settings['pixels'] if pixel not in self.layout.positions]
+        if missing:
+            raise ValueError(f"Pixels {missing} are not in the layout")
+        return list(settings['pixels'])
+
+    def run_all(self, jobs, defaults=None, stop_on_error=False):
+        # Returns (name, status, seconds) per job
+        results = []
+        for number, job in enumerate(jobs, 1):
+            name = job.get('name', f'job {number}')
+            print(f"\n=== {name} ({number}/{len(jobs)}) ===")
+            start = time.monotonic()
+            try:
+                self.run(job_settings(job, defaults or {}))
+                status = 'done'
+            except Exception as e:
+                status = f'failed: {type(e).__name__}: {e}'
+                traceback.print_exc()
+            results.append((name, status, time.monotonic() - start))
+            if stop_on_error and status != 'done':
+                break
+        return results
+
+    def run(self, settings):
+        measurement_system = self.measurement_system
+        measurement_system.adaptive = settings['adaptive']
+        measurement_system.tracking = settings['tracking']
+        measurement_system.plots = settings['plots']
+        pixels = self.pixels(settings)
+
+        if self.robot is not None:
+            full_auto = FullAutoRun(measurement_system, {pixel: self.layout.positions[pixel] for pixel in pixels},
+                                    self.layout.baseline, self.layout.home, pipelined=settings['pipelined'],
+                                    pixel_commands=self.layout.commands if self.switch else None)
+            if 'resume' in settings:
+                return self.devices.submit(full_auto.resume, settings['resume'], description="resume").result()
+            sweep = settings['sweep']
+            policy = BaselinePolicy(**settings['baseline'])
+            return self.devices.submit(full_auto.job, settings['output'], settings['input_power'], sweep['start'],
+                                       sweep['stop'], sweep['steps'], policy, description=settings.get('name')).result()
+
+        if 'resume' in settings:
+            raise ValueError("Only robot runs keep a journal to resume from")
+        unrouted = [pixel for pixel in pixels if pixel not in self.layout.commands]
+        if self.switch is not None and unrouted:
+            raise ValueError(f"Pixels {unrouted} have no switch command in the layout")
+        return self.devices.submit(self.switch_job, settings, pixels, description=settings.get('name')).result()
+
+    async def switch_job(self, devices, settings, pixels):
+        # Switch-only setups: every pixel is routed to the SMU in turn, there is no baseline position
+        output, sweep = settings['output'], settings['sweep']
+        store = RunStore(output)
+        self.measurement_system.start_run(store)
+        TRACER.reset()
+        try:
+            for pixel in pixels:
+                if devices.switch is not None:
+                    await devices.switch.select(self.layout.commands[pixel])
+                await devices.smu.measure(output, settings['input_power'], pixel, sweep['start'], sweep['stop'],
+                                          sweep['steps'])
+        finally:
+            # The background writer checks the run store when it plots, so it is emptied first
+            await devices.run_in_worker(self.measurement_system.flush_saves)
+            self.measurement_system.end_run()
+        await devices.run_in_worker(self.measurement_system.save_run_overlay, output)
+        TRACER.print_summary(f"Timing of run {store.run_id}")
+        TRACER.write_run_trace(store.directory)
+
+    def close(self):
+        for close in reversed(self.closers):
+            try:
+                close()
+            except Exception as e:
+                print(f"Closing failed: {e}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('job_file', help='YAML or JSON file with the hardware and the jobs to run')
+    parser.add_argument('--simulate', action='store_true', help='Run against simulated hardware')
+    parser.add_argument('--time-scale', type=float, default=1.0, help='Factor applied to every simulated delay')
+    parser.add_argument('--stop-on-error', action='store_true', help='Skip the remaining jobs after a failure')
+    args = parser.parse_args()
+
+    config = load_job_file(args.job_file)
+    runner = JobRunner(config, args.simulate, args.time_scale)
+    try:
+        results = runner.run_all(config.get('jobs', []), config.get('defaults'), args.stop_on_error)
+    finally:
+        runner.close()
+
+    print(f"\n{'job':<24}{'time (s)':>10}  status")
+    for name, status, seconds in results:
+        print(f"{name:<24}{seconds:>10.1f}  {status}")
+    if any(status != 'done' for name, status, seconds in results):
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
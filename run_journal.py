@@ -0,0 +1,105 @@
+'''
+This file contains the journal that makes full-auto runs resumable.
+
+The journal is a JSON-lines file next to the run store's index (journal.jsonl in the run directory).
+Every line is one event and is flushed to disk before the run goes on:
+    start        the run's settings, so a resume measures the remaining pixels the same way
+    move         a robot position, so it is known where the robot was left
+    step         a finished (pixel or baseline) step with its figures of merit and the hardware state
+    homed        the robot is back at home
+    interrupted  the run stopped early, with the reason
+    finished     every step of the run is done
+
+A step is only journaled after its sweep has been analysed and appended to the run store, so a
+resume skips exactly the steps whose results are on disk. A line cut short by a crash is ignored.
+
+Authors: Jason Whitney, Amr Mohamed, Prachya Chowdhury
+'''
+
+import json
+import os
+import threading
+import time
+
+JOURNAL_FILENAME = 'journal.jsonl'
+
+
+class RunJournal:
+    def __init__(self, directory):
+        self.directory = directory
+        self.filename = os.path.join(directory, JOURNAL_FILENAME)
+        self.lock = threading.Lock()
+        self.entries = self.read()
+
+    def read(self):
+        if not os.path.exists(self.filename):
+            return []
+        entries = []
+        with open(self.filename) as f:
+            for line in f:
+                try:
+                    entries.append(json.loads(line))
+                except json.JSONDecodeError:
+                    break  # Last line of a run that crashed while writing it
+        return entries
+
+    def write(self, event, **fields):
+        entry = dict(event=event, time=time.time(), **fields)
+        line = json.dumps(entry, default=float)  # NumPy scalars in the figures of merit
+        with self.lock:
+            with open(self.filename, 'a') as f:
+                f.write(line + '\n')
+                f.flush()
+                os.fsync(f.fileno())
+            self.entries.append(entry)
+
+    def start(self, settings):
+        self.write('start', settings=settings)
+
+    def move(self, position):
+        self.write('move', position=list(position))
+
+    def step_done(self, step, figures, hardware=None):
+        self.write('step', identifier=step['identifier'], baseline=step['baseline'],
+                   position=list(step['position']), figures=figures, hardware=hardware or {})
+
+    def homed(self, position):
+        self.write('homed', position=list(position))
+
+    def interrupted(self, reason):
+        self.write('interrupted', reason=reason)
+
+    def finished(self):
+        self.write('finished')
+
+    def events(self, event):
+        return [entry for entry in self.entries if entry['event'] == event]
+
+    @property
+    def settings(self):
+        starts = self.events('start')
+        if not starts:
+            raise ValueError(f"{self.filename} has no start entry, the run cannot be resumed")
+        return starts[0]['settings']
+
+    def is_finished(self):
+        return bool(self.events('finished'))
+
+    def completed_pixels(self):
+        return {entry['identifier'] for entry in self.events('step') if not entry['baseline']}
+
+    def last_baseline(self):
+        # The last finished baseline step and the number of pixels finished after it, or None
+        pixels_after = 0
+        for entry in reversed(self.events('step')):
+            if entry['baseline']:
+                return entry, pixels_after
+            pixels_after += 1
+        return None
+
+    def robot_position(self):
+        # Where the robot was last sent, None if it never moved
+        for entry in reversed(self.entries):
+            if entry['event'] in ('move', 'homed'):
+                return tuple(entry['position'])
+        return None
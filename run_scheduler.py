@@ -0,0 +1,125 @@
+'''
+This file pipelines a full-auto run so robot motion, the SMU sweep and host-side processing overlap.
+
+Each step of a run goes through three stages:
+    motion      move the robot to the step's position
+    sweep       run the sweep and read the raw curve back from the SMU
+    processing  figures of merit, run store, plots and saved files
+
+Motion and sweep run one after the other in the calling thread, holding the interlock from the start
+of the move until the sweep has been read back. Manual robot moves outside the run take the same
+interlock, so they can neither happen during a sweep nor slip in between a step's move and its
+sweep. Processing runs
+in a worker thread behind a small queue: while pixel N is analysed and rendered the robot already
+heads to pixel N+1. When processing falls behind, the queue fills up and the next move waits.
+
+With pipelined=False processing runs in the calling thread right after each sweep, the way runs
+went before, which is useful as a baseline when benchmarking.
+
+Per-stage busy time, per-step latency and utilization are kept so the overlap can be checked after a run.
+
+Authors: Jason Whitney, Amr Mohamed, Prachya Chowdhury
+'''
+
+import queue
+import threading
+import time
+import traceback
+from tracing import TRACER
+
+STAGES = ('motion', 'sweep', 'processing')
+
+
+class RunScheduler:
+    def __init__(self, move, acquire, process, interlock=None, max_pending=2, on_error=None, pipelined=True):
+        # move(step), acquire(step) -> raw data, process(step, raw data) -> result
+        self.move = move
+        self.acquire = acquire
+        self.process = process
+        self.interlock = interlock or threading.Lock()
+        self.max_pending = max_pending
+        self.on_error = on_error
+        self.pipelined = pipelined
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.stats = {stage: {'count': 0, 'busy_s': 0.0} for stage in STAGES}
+        self.durations = {stage: [] for stage in STAGES}
+        self.queue_wait_s = 0.0  # Time the motion stage waited for processing to catch up
+        self.wall_s = 0.0
+        self.results = []
+        self.errors = []
+
+    def timed(self, stage, function, step, *args):
+        start = time.monotonic()
+        try:
+            return function(step, *args)
+        finally:
+            duration = time.monotonic() - start
+            self.stats[stage]['count'] += 1
+            self.stats[stage]['busy_s'] += duration
+            self.durations[stage].append(duration)
+            if isinstance(step, dict):
+                TRACER.add(stage, 'stage', start, duration, {'step': step.get('identifier'),
+                                                             'baseline': bool(step.get('baseline'))})
+            else:
+                TRACER.add(stage, 'stage', start, duration, {'step': step})
+
+    def run(self, steps):
+        # steps is any iterable and is consumed lazily, one step at a time as the robot gets to it.
+        # Returns the (step, result) pairs of the processed steps in order.
+        self.reset_stats()
+        pending = queue.Queue(maxsize=self.max_pending)
+        worker = threading.Thread(target=self.process_pending, args=(pending,), daemon=True)
+        start = time.monotonic()
+        worker.start()
+        try:
+            for step in steps:
+                # One hold for both, so nothing else moves the robot between its arrival and the sweep
+                with self.interlock:
+                    self.timed('motion', self.move, step)
+                    raw = self.timed('sweep', self.acquire, step)
+                if not self.pipelined:
+                    self.process_step(step, raw)
+                    continue
+                put_start = time.monotonic()
+                pending.put((step, raw))
+                self.queue_wait_s += time.monotonic() - put_start
+        finally:
+            pending.put(None)
+            worker.join()
+            self.wall_s = time.monotonic() - start
+        return self.results
+
+    def process_pending(self, pending):
+        while True:
+            item = pending.get()
+            if item is None:
+                return
+            self.process_step(*item)
+
+    def process_step(self, step, raw):
+        try:
+            self.results.append((step, self.timed('processing', self.process, step, raw)))
+        except Exception as e:
+            # Keep processing the rest of the run
+            self.errors.append((step, e))
+            if self.on_error is not None:
+                self.on_error(step, e)
+            else:
+                print(f"Processing failed for {step}: {e}")
+                traceback.print_exc()
+
+    def summary(self):
+        summary = {'wall_s': self.wall_s, 'queue_wait_s': self.queue_wait_s, 'errors': len(self.errors)}
+        for stage, stats in self.stats.items():
+            summary[stage] = dict(stats, utilization=stats['busy_s'] / self.wall_s if self.wall_s else 0.0)
+        return summary
+
+    def print_summary(self):
+        summary = self.summary()
+        print(f"Run took {summary['wall_s']:.1f} s, motion waited {summary['queue_wait_s']:.1f} s for processing")
+        for stage in STAGES:
+            stats = summary[stage]
+            print(f"  {stage:<11}{stats['count']:>4} steps {stats['busy_s']:>8.1f} s busy "
+                  f"{stats['utilization'] * 100:>6.1f}% utilization")
@@ -0,0 +1,182 @@
+'''
+This file contains an append-only store that keeps every raw sweep and every figure of merit of a run.
+
+Each run gets its own directory holding two files that are only ever appended to:
+    sweeps.f8   the raw sweeps as little-endian float64 voltage, current pairs, back to back
+    index.csv   one row per measurement with its run, pixel, label, baseline flag, timestamp,
+                position in sweeps.f8, figures of merit and the baseline it was normalized against
+
+Sweeps are read back through a memory map, so loading one curve does not read the whole run.
+Excel and text exports are post-processing steps, e.g.
+    python run_store.py <run_directory> --excel --text
+
+Authors: Jason Whitney, Amr Mohamed, Prachya Chowdhury
+'''
+
+import argparse
+import csv
+import os
+import threading
+import time
+import numpy as np
+from tracing import TRACER
+
+SWEEPS_FILENAME = 'sweeps.f8'
+INDEX_FILENAME = 'index.csv'
+SWEEP_DTYPE = np.dtype('<f8')
+
+INDEX_COLUMNS = ['record', 'run', 'pixel', 'label', 'baseline', 'timestamp', 'offset', 'points',
+                 'mpp_voltage', 'max_power', 'isc', 'voc', 'efficiency', 'fill_factor', 'series_resistance',
+                 'shunt_resistance', 'baseline_label', 'normalized_power']
+FIGURES_OF_MERIT = ['mpp_voltage', 'max_power', 'isc', 'voc', 'efficiency', 'fill_factor', 'series_resistance',
+                    'shunt_resistance', 'normalized_power']
+
+
+class RunStore:
+    def __init__(self, base_directory, run_id=None):
+        if run_id is None:
+            self.run_id = self.create_run_directory(base_directory)
+        else:
+            self.run_id = run_id
+            os.makedirs(os.path.join(base_directory, f'run_{run_id}'), exist_ok=True)
+        self.directory = os.path.join(base_directory, f'run_{self.run_id}')
+        self.sweeps_filename = os.path.join(self.directory, SWEEPS_FILENAME)
+        self.index_filename = os.path.join(self.directory, INDEX_FILENAME)
+        self.lock = threading.Lock()
+
+        # Continue an existing run where it left off
+        self.record_count = len(self.records())
+        self.sweep_offset = os.path.getsize(self.sweeps_filename) // SWEEP_DTYPE.itemsize \
+            if os.path.exists(self.sweeps_filename) else 0
+
+    @staticmethod
+    def create_run_directory(base_directory):
+        # A new run always gets a directory of its own; runs started within the same second get a suffix
+        run_id = time.strftime('%Y%m%d_%H%M%S')
+        for suffix in range(1, 1000):
+            candidate = run_id if suffix == 1 else f'{run_id}_{suffix}'
+            try:
+                os.makedirs(os.path.join(base_directory, f'run_{candidate}'))
+                return candidate
+            except FileExistsError:
+                continue
+        raise RuntimeError(f"No free run directory for {run_id} in {base_directory}")
+
+    @classmethod
+    def open(cls, run_directory):
+        run_directory = os.path.normpath(run_directory)
+        name = os.path.basename(run_directory)
+        return cls(os.path.dirname(run_directory), name[4:] if name.startswith('run_') else name)
+
+    @TRACER.traced('store', 'save')
+    def append(self, pixel, voltage, current, figures, label=None, baseline=False, timestamp=None):
+        # figures holds mpp_voltage, max_power, isc, voc, efficiency, when the curve was analysed on the
+        # host fill_factor, series_resistance and shunt_resistance, and for normalized pixels
+        # baseline_label and normalized_power; missing ones are left empty.
+        # voltage and current may be None when only the figures of merit were measured.
+        pairs = np.empty(0, dtype=SWEEP_DTYPE)
+        if voltage is not None:
+            pairs = np.empty(2 * len(voltage), dtype=SWEEP_DTYPE)
+            pairs[0::2] = voltage
+            pairs[1::2] = current
+
+        with self.lock:
+            record = self.record_count
+            offset = self.sweep_offset
+            with open(self.sweeps_filename, 'ab') as f:
+                f.write(pairs.tobytes())
+            row = {
+                'record': record,
+                'run': self.run_id,
+                'pixel': '' if pixel is None else pixel,
+                'label': '' if label is None else label,
+                'baseline': int(bool(baseline)),
+                'timestamp': f'{time.time() if timestamp is None else timestamp:.3f}',
+                'offset': offset,
+                'points': len(pairs) // 2,
+            }
+            for name in FIGURES_OF_MERIT:
+                value = figures.get(name)
+                row[name] = '' if value is None else repr(float(value))
+            row['baseline_label'] = figures.get('baseline_label', '')
+            new_index = not os.path.exists(self.index_filename)
+            with open(self.index_filename, 'a', newline='') as f:
+                writer = csv.DictWriter(f, fieldnames=INDEX_COLUMNS)
+                if new_index:
+                    writer.writeheader()
+                writer.writerow(row)
+            self.record_count += 1
+            self.sweep_offset += len(pairs)
+        return record
+
+    def records(self):
+        if not os.path.exists(self.index_filename):
+            return []
+        with open(self.index_filename, newline='') as f:
+            return list(csv.DictReader(f))
+
+    def load_sweep(self, record):
+        # record is a row from records() or a record number
+        if not isinstance(record, dict):
+            record = self.records()[int(record)]
+        offset, points = int(record['offset']), int(record['points'])
+        if points == 0:
+            return np.empty(0), np.empty(0)
+        data = np.memmap(self.sweeps_filename, dtype=SWEEP_DTYPE, mode='r', offset=offset * SWEEP_DTYPE.itemsize,
+                         shape=(2 * points,))
+        return data[0::2], data[1::2]
+
+    def export_text(self, directory=None):
+        # Writes the Calculated_Values_<label>.txt files MeasurementSystem used to write per measurement
+        directory = directory or self.directory
+        for record in self.records():
+            suffix = f"_{record['label']}" if record['label'] else f"_{record['record']}"
+            with open(os.path.join(directory, f'Calculated_Values{suffix}.txt'), 'w') as f:
+                if record['max_power']:
+                    f.write(f"Maximum Power (Pmax): {float(record['max_power']):.4f} W\n")
+                if record['isc']:
+                    f.write(f"Short Circuit Current (Isc): {float(record['isc']):.4f} A\n")
+                if record['voc']:
+                    f.write(f"Open Circuit Voltage (Voc): {float(record['voc']):.4f} V\n")
+                if record['efficiency']:
+                    f.write(f"Efficiency: {float(record['efficiency']):.2f}%\n")
+                if record.get('fill_factor'):
+                    f.write(f"Fill Factor (FF): {float(record['fill_factor']):.4f}\n")
+                if record.get('normalized_power'):
+                    f.write(f"Power relative to {record['baseline_label']}: {float(record['normalized_power']):.4f}\n")
+
+    def export_excel(self, filename=None):
+        # One summary sheet plus one sheet of data points per measurement
+        import pandas as pd
+
+        filename = filename or os.path.join(self.directory, 'Data_Points.xlsx')
+        records = self.records()
+        with pd.ExcelWriter(filename) as writer:
+            pd.DataFrame(records, columns=INDEX_COLUMNS).to_excel(writer, sheet_name='Summary', index=False)
+            for record in records:
+                voltage, current = self.load_sweep(record)
+                if len(voltage) == 0:
+                    continue
+                sheet_name = f"{record['record']}_{record['label']}"[:31]
+                pd.DataFrame({'Voltage (V)': voltage, 'Current (A)': current}).to_excel(
+                    writer, sheet_name=sheet_name, index=False)
+        return filename
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Export a run store to Excel and/or text files.')
+    parser.add_argument('run_directory', help='run_<id> directory created by RunStore')
+    parser.add_argument('--excel', action='store_true', help='Write Data_Points.xlsx')
+    parser.add_argument('--text', action='store_true', help='Write Calculated_Values_*.txt files')
+    args = parser.parse_args()
+
+    store = RunStore.open(args.run_directory)
+    if args.excel:
+        print(f"Wrote {store.export_excel()}")
+    if args.text:
+        store.export_text()
+        print(f"Wrote text files to {store.directory}")
+
+
+if __name__ == "__main__":
+    main()
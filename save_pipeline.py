@@ -0,0 +1,74 @@
+'''
+This file contains a bounded background writer used by MeasurementSystem to render plots and
+write result files while the next move and sweep are already running.
+
+Jobs are queued up to max_pending; submitting beyond that blocks the caller until a worker catches
+up, so a slow disk cannot make memory grow without bound. Failures are printed as they happen and
+collected so flush() can report them.
+
+Authors: Jason Whitney, Amr Mohamed, Prachya Chowdhury
+'''
+
+import queue
+import threading
+import traceback
+
+
+class BackgroundWriter:
+    def __init__(self, max_pending=4, workers=1, on_error=None):
+        self.jobs = queue.Queue(maxsize=max_pending)
+        self.on_error = on_error
+        self.errors = []
+        self.errors_lock = threading.Lock()
+        self.completed = 0
+        self.workers = []
+        for index in range(workers):
+            worker = threading.Thread(target=self.run, name=f'BackgroundWriter-{index}', daemon=True)
+            worker.start()
+            self.workers.append(worker)
+
+    def submit(self, function, *args, description=None, **kwargs):
+        if not self.workers:
+            raise RuntimeError("BackgroundWriter is closed")
+        # Blocks while max_pending jobs are waiting (backpressure)
+        self.jobs.put((function, args, kwargs, description or getattr(function, '__name__', 'job')))
+
+    def run(self):
+        while True:
+            job = self.jobs.get()
+            try:
+                if job is None:
+                    return
+                function, args, kwargs, description = job
+                try:
+                    function(*args, **kwargs)
+                    with self.errors_lock:
+                        self.completed += 1
+                except Exception as e:
+                    print(f"Background save '{description}' failed: {e}")
+                    traceback.print_exc()
+                    with self.errors_lock:
+                        self.errors.append((description, e))
+                    if self.on_error is not None:
+                        self.on_error(description, e)
+            finally:
+                self.jobs.task_done()
+
+    def pending(self):
+        return self.jobs.qsize()
+
+    def flush(self):
+        # Wait for every queued job and return (and clear) the errors collected so far
+        self.jobs.join()
+        with self.errors_lock:
+            errors, self.errors = self.errors, []
+        return errors
+
+    def close(self):
+        errors = self.flush()
+        for _ in self.workers:
+            self.jobs.put(None)
+        for worker in self.workers:
+            worker.join()
+        self.workers = []
+        return errors
@@ -0,0 +1,158 @@
+'''
+This file provides simulated stand-ins for the AxiDraw and the Arduino pixel switch, so full-auto
+runs can be exercised on any machine. The SMU is simulated by simulated_instrument.py.
+
+SimulatedAxiDraw has the parts of the pyaxidraw interactive API the programs use. moveto() returns
+right away and the motion runs in the background for the time the trapezoidal profile in
+motion_planner.py gives; delay() sleeps and usb_query('QG\\r') reports the motion bits, so both
+MotionSettler strategies work against it.
+
+FakeArduino runs the framed pixel-switch protocol of switch_protocol.py behind a pseudo-terminal,
+so the real pyserial code path is exercised: open FakeArduino().port with serial.Serial like a COM
+port. It answers after switch_time, and drop_answers / corrupt_answers make it lose or garble the
+next answers to exercise the retries. FakeArduino(legacy=True) runs the original character firmware
+instead, which never answers.
+
+time_scale shrinks every simulated delay, the same as on SimulatedSMU.
+
+Authors: Jason Whitney, Amr Mohamed, Prachya Chowdhury
+'''
+
+import math
+import os
+import select
+import threading
+import time
+import tty
+from types import SimpleNamespace
+from motion_planner import move_time, AXIDRAW_DEFAULT_ACCEL
+from switch_protocol import START_OF_FRAME, SELECT, ALL_OFF, PING, ACK, NAK, crc8, encode_frame
+
+
+class SimulatedAxiDraw:
+    def __init__(self, time_scale=1.0):
+        self.time_scale = time_scale
+        self.options = SimpleNamespace(units=2, speed_pendown=25, speed_penup=25, accel=AXIDRAW_DEFAULT_ACCEL)
+        self.connected = False
+        self.position = (0.0, 0.0)
+        self.busy_until = 0.0
+        self.moves = 0
+        self.distance = 0.0
+
+    def interactive(self):
+        pass
+
+    def connect(self):
+        self.connected = True
+        return True
+
+    def update(self):
+        pass
+
+    def moveto(self, x, y):
+        # Moves queue up behind each other like on the EBB
+        length = math.hypot(x - self.position[0], y - self.position[1])
+        duration = move_time(length, self.options.speed_penup, self.options.accel) * self.time_scale
+        self.busy_until = max(time.monotonic(), self.busy_until) + duration
+        self.position = (x, y)
+        self.moves += 1
+        self.distance += length
+
+    def delay(self, time_ms):
+        time.sleep(time_ms / 1000 * self.time_scale)
+
+    def moving(self):
+        return time.monotonic() < self.busy_until
+
+    def usb_query(self, query):
+        if query.strip() != 'QG':
+            raise ValueError(f"Unsupported query {query!r}")
+        # Bits 0-3: FIFO not empty, motor 2 moving, motor 1 moving, command executing
+        return f'{0b1111 if self.moving() else 0:02X}\r\n'
+
+    def disconnect(self):
+        self.connected = False
+
+
+class FakeArduino:
+    def __init__(self, switch_time=0.02, time_scale=1.0, legacy=False):
+        self.switch_time = switch_time
+        self.time_scale = time_scale
+        self.legacy = legacy  # Original firmware: single characters, never answers
+        self.selected = set()  # Relay codes currently closed
+        self.switch_count = 0
+        self.requests = 0
+        self.drop_answers = 0  # Number of upcoming answers to lose
+        self.corrupt_answers = 0  # Number of upcoming answers to send with a bad CRC
+        self.last_seq = None
+        self.last_answer = None
+        self.master, slave = os.openpty()
+        tty.setraw(slave)
+        self.port = os.ttyname(slave)
+        self.slave = slave  # Kept open so the pty survives the port being closed and reopened
+        self.running = True
+        self.thread = threading.Thread(target=self.serve, name='fake arduino', daemon=True)
+        self.thread.start()
+
+    def serve(self):
+        buffer = b''
+        while self.running:
+            try:
+                readable, _, _ = select.select([self.master], [], [], 0.05)
+                if readable:
+                    buffer += os.read(self.master, 256)
+            except OSError:
+                return
+            buffer = self.handle_legacy(buffer) if self.legacy else self.handle(buffer)
+
+    def handle_legacy(self, buffer):
+        for code in buffer.decode(errors='replace'):
+            if code == 'o':
+                self.selected = set()
+            else:
+                self.selected.add(code)
+            self.switch_count += 1
+        return b''
+
+    def handle(self, buffer):
+        # Consumes every complete frame in buffer and returns what is left
+        while True:
+            start = buffer.find(bytes([START_OF_FRAME]))
+            if start < 0:
+                return b''
+            buffer = buffer[start:]
+            if len(buffer) < 4 or len(buffer) < 5 + buffer[3]:
+                return buffer
+            frame, buffer = buffer[:5 + buffer[3]], buffer[5 + buffer[3]:]
+            body = frame[1:-1]
+            if crc8(body) != frame[-1]:
+                continue  # Garbled request, the host times out and sends it again
+            self.requests += 1
+            self.answer(body[0], body[1], body[3:])
+
+    def answer(self, seq, command, payload):
+        if seq == self.last_seq:
+            answer = self.last_answer  # Repeated request: answer again without switching again
+        elif command == PING:
+            answer = encode_frame(seq, ACK)
+        elif command in (SELECT, ALL_OFF):
+            self.selected = set(payload.decode()) if command == SELECT else set()
+            self.switch_count += 1
+            time.sleep(self.switch_time * self.time_scale)  # Relays settling
+            answer = encode_frame(seq, ACK)
+        else:
+            answer = encode_frame(seq, NAK, b'unknown command')
+        self.last_seq, self.last_answer = seq, answer
+        if self.drop_answers:
+            self.drop_answers -= 1
+        elif self.corrupt_answers:
+            self.corrupt_answers -= 1
+            os.write(self.master, answer[:-1] + bytes([answer[-1] ^ 0xFF]))
+        else:
+            os.write(self.master, answer)
+
+    def close(self):
+        self.running = False
+        self.thread.join()
+        os.close(self.master)
+        os.close(self.slave)
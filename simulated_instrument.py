@@ -0,0 +1,272 @@
+'''
+This file provides a simulated Keithley 2450 that can stand in for the pyvisa resource
+used by measurement_system.py, so the measurement code can be exercised without hardware.
+
+It understands the subset of SCPI that MeasurementSystem sends and the TSP calls made by
+TspMeasurementSystem, and models the solar cell as a single-diode I-V curve. TSP scripts are
+not interpreted; a call to an uploaded function with sweep arguments runs a linear sweep and waits
+for it (functions whose name ends in Setup only configure it), and a call without arguments prints
+a Pmax, Vmax, Imax, Isc, Voc record of the last sweep. Functions whose name ends in ListSweep take
+the step delay and source the levels of the last table assigned, like SOUR:LIST:VOLT does for SCPI.
+
+With realtime=True the buffer fills point by point at the sweep delay plus measure_time per point,
+so polling, *WAI and aborts behave like on the instrument. latency adds a fixed round-trip time to
+every read and bus_rate a transfer time per byte; time_scale shrinks all of these simulated delays
+so long runs can be benchmarked quickly.
+'''
+
+import re
+import time
+import numpy as np
+from pyvisa import util
+
+BOLTZMANN = 1.380649e-23
+ELECTRON_CHARGE = 1.602176634e-19
+
+
+class SimulatedSMU:
+    def __init__(self, isc=0.02, voc=0.6, ideality=1.5, temperature=300.0, bus_rate=None, realtime=False,
+                 measure_time=0.02, latency=0.0, time_scale=1.0):
+        # Cell model parameters
+        self.isc = isc
+        self.voc = voc
+        self.ideality = ideality
+        self.temperature = temperature
+
+        # Simulated link speed in bytes per second, None means transfers are instantaneous,
+        # and round-trip time per read in seconds (USBTMC is around 1 ms)
+        self.bus_rate = bus_rate
+        self.latency = latency
+        self.time_scale = time_scale
+
+        # Sweep timing, measure_time is roughly one power line cycle of integration per point
+        self.realtime = realtime
+        self.measure_time = measure_time
+
+        self.timeout = 2000
+        self.written = []  # Log of every command received, useful for counting bus transactions
+        self.bytes_transferred = 0
+
+        # TSP runtime state survives reset(), like on the instrument
+        self.scripts = {}
+        self.loading_script = None
+        self.functions = set()
+        self.variables = {}
+        self.reset()
+
+    def reset(self):
+        self.data_format = 'ASC'
+        self.byte_order = 'NORM'
+        self.sweep = None  # Source levels and step delay of the configured sweep
+        self.source_list = []
+        self.source_values = np.empty(0)
+        self.readings = np.empty(0)
+        self.sweep_started = 0.0
+        self.point_time = 0.0
+        self.response = b''
+        self.encoded_responses = {}  # Formatting is instrument-side work, so keep it out of host timings
+
+    def diode_current(self, voltage):
+        thermal_voltage = BOLTZMANN * self.temperature / ELECTRON_CHARGE
+        n_vt = self.ideality * thermal_voltage
+        saturation_current = self.isc / np.expm1(self.voc / n_vt)
+        return self.isc - saturation_current * np.expm1(np.asarray(voltage, dtype=float) / n_vt)
+
+    def write(self, command):
+        self.written.append(command)
+        command = command.strip()
+        if self.loading_script is not None or command.startswith('loadscript') or '(' in command or \
+                command.startswith('format.') or ' = {' in command:
+            self.write_tsp(command)
+            return
+
+        header, _, arguments = command.partition(' ')
+        header = header.upper().lstrip(':')
+
+        if header == '*RST':
+            self.reset()
+        elif header.startswith('FORM:BORD'):
+            self.byte_order = 'SWAP' if arguments.strip().upper().startswith('SWAP') else 'NORM'
+        elif header.startswith('FORM'):
+            value = arguments.strip().upper()
+            if value.startswith('SREA'):
+                self.data_format = 'SREAL'
+            elif value.startswith('REAL'):
+                self.data_format = 'REAL'
+            else:
+                self.data_format = 'ASC'
+        elif header == 'SOUR:SWE:VOLT:LIN':
+            start, stop, points, delay = [float(value) for value in arguments.split(',')[:4]]
+            self.sweep = (np.linspace(start, stop, int(points)), delay)
+        elif header == 'SOUR:LIST:VOLT':
+            self.source_list = [float(value) for value in arguments.split(',')]
+        elif header == 'SOUR:LIST:VOLT:APP':
+            self.source_list += [float(value) for value in arguments.split(',')]
+        elif header == 'SOUR:SWE:VOLT:LIST':
+            first, delay = [float(value) for value in arguments.split(',')[:2]]
+            self.sweep = (np.array(self.source_list[int(first) - 1:]), delay)
+        elif header == 'INIT':
+            self.run_sweep()
+        elif header == '*WAI':
+            self.wait_for_sweep()
+        elif header.startswith('ABOR'):
+            self.abort_sweep()
+        elif header.startswith('TRIG:STAT'):
+            state = 'RUNNING' if self.sweep_running() else 'IDLE'
+            self.response = f'{state};{state};1\n'.encode()
+        elif header.startswith('TRAC:ACT'):
+            self.response = f'{self.available_points()}\n'.encode()
+        elif header == 'TRAC:DATA?':
+            fields = arguments.split(',')
+            self.respond_with_buffer(int(fields[0]), int(fields[1]))
+
+    def write_tsp(self, command):
+        if self.loading_script is not None:
+            if command == 'endscript':
+                self.scripts[self.loading_script[0]] = self.loading_script[1]
+                self.loading_script = None
+            else:
+                self.loading_script[1].append(command)
+            return
+
+        call = re.match(r'(\w+)\((.*)\)$', command)
+        table = re.match(r'(\w+) = \{(.*)\}$', command)
+        if table:
+            self.source_list = [float(value) for value in table.group(2).split(',') if value.strip()]
+        elif command.startswith('loadscript'):
+            self.loading_script = (command.split()[1], [])
+        elif command == 'reset()':
+            self.reset()
+        elif command.startswith('format.data'):
+            value = command.split('=')[1].strip()
+            self.data_format = {'format.REAL64': 'REAL', 'format.REAL32': 'SREAL'}.get(value, 'ASC')
+        elif command.startswith('format.byteorder'):
+            self.byte_order = 'SWAP' if 'LITTLE' in command else 'NORM'
+        elif command == 'print(defbuffer1.n)':
+            self.response = f'{self.available_points()}\n'.encode()
+        elif command == 'trigger.model.initiate()':
+            self.run_sweep()
+        elif command == 'trigger.model.abort()':
+            self.abort_sweep()
+        elif command == 'waitcomplete()':
+            self.wait_for_sweep()
+        elif command == 'print(trigger.model.state())':
+            state = 'trigger.STATE_RUNNING' if self.sweep_running() else 'trigger.STATE_IDLE'
+            self.response = f'{state}\t{state}\t1\n'.encode()
+        elif command.startswith('print('):
+            self.response = f'{self.variables.get(command[6:-1], "nil")}\n'.encode()
+        elif command.startswith('printbuffer('):
+            fields = command[12:-1].split(',')
+            self.respond_with_buffer(int(fields[0]), int(fields[1]))
+        elif call and call.group(1) in self.scripts:
+            self.run_script(self.scripts[call.group(1)])
+        elif call and call.group(1) in self.functions and not call.group(2):
+            self.response = self.summary_record().encode()
+        elif call and call.group(1) in self.functions and call.group(1).endswith('ListSweep'):
+            self.sweep = (np.array(self.source_list), float(call.group(2).split(',')[0]))
+            self.run_sweep()
+            self.wait_for_sweep()
+        elif call and call.group(1) in self.functions:
+            start, stop, points, delay = [float(value) for value in call.group(2).split(',')[:4]]
+            self.sweep = (np.linspace(start, stop, int(points)), delay)
+            if not call.group(1).endswith('Setup'):
+                self.run_sweep()
+                self.wait_for_sweep()
+
+    def run_script(self, lines):
+        # Only records the global assignments and function definitions a script makes
+        for line in lines:
+            assignment = re.match(r'(\w+) = "(.*)"$', line)
+            definition = re.match(r'function (\w+)\(', line)
+            if assignment:
+                self.variables[assignment.group(1)] = assignment.group(2)
+            elif definition:
+                self.functions.add(definition.group(1))
+
+    def summary_record(self):
+        # Oriented by the sample nearest 0 V and zero crossings interpolated, like SolarCellSweep does
+        sign = -1.0 if self.readings[np.argmin(np.abs(self.source_values))] < 0 else 1.0
+        power = sign * self.source_values * self.readings
+        index = np.argmax(power)
+        isc = sign * np.interp(0.0, self.source_values, self.readings)
+        voc = np.interp(0.0, sign * self.readings[::-1], self.source_values[::-1])
+        values = (power[index], self.source_values[index], abs(self.readings[index]), isc, voc)
+        return ','.join(f'{value:.9e}' for value in values) + '\n'
+
+    def respond_with_buffer(self, start, end):
+        end = min(end, self.available_points())
+        key = (start, end, self.data_format, self.byte_order)
+        if key not in self.encoded_responses:
+            self.encoded_responses[key] = self.trace_data(start, end)
+        self.response = self.encoded_responses[key]
+
+    def run_sweep(self):
+        if self.sweep is None:
+            return
+        levels, delay = self.sweep
+        self.source_values = np.asarray(levels, dtype=float)
+        self.readings = self.diode_current(self.source_values)
+        self.encoded_responses = {}
+        self.sweep_started = time.monotonic()
+        self.point_time = (delay + self.measure_time) * self.time_scale
+
+    def available_points(self):
+        if not self.realtime or self.point_time <= 0:
+            return len(self.readings)
+        elapsed = time.monotonic() - self.sweep_started
+        return min(len(self.readings), int(elapsed / self.point_time))
+
+    def sweep_running(self):
+        return self.available_points() < len(self.readings)
+
+    def wait_for_sweep(self):
+        if self.realtime:
+            remaining = self.sweep_started + len(self.readings) * self.point_time - time.monotonic()
+            if remaining > 0:
+                time.sleep(remaining)
+
+    def abort_sweep(self):
+        # The buffer keeps what was measured before the abort
+        available = self.available_points()
+        self.source_values = self.source_values[:available]
+        self.readings = self.readings[:available]
+        self.encoded_responses = {}
+
+    def trace_data(self, start, end):
+        values = np.empty(2 * (end - start + 1))
+        values[0::2] = self.source_values[start - 1:end]
+        values[1::2] = self.readings[start - 1:end]
+
+        if self.data_format == 'ASC':
+            return (','.join(f'{value:.6e}' for value in values) + '\n').encode()
+
+        dtype = '>' if self.byte_order == 'NORM' else '<'
+        dtype += 'f8' if self.data_format == 'REAL' else 'f4'
+        payload = values.astype(dtype).tobytes()
+        length = str(len(payload))
+        return f'#{len(length)}{length}'.encode() + payload + b'\n'
+
+    def read_raw(self):
+        response, self.response = self.response, b''
+        self.bytes_transferred += len(response)
+        transfer_time = self.latency + (len(response) / self.bus_rate if self.bus_rate else 0.0)
+        if transfer_time > 0:
+            time.sleep(transfer_time * self.time_scale)
+        return response
+
+    def read(self):
+        return self.read_raw().decode()
+
+    def query(self, command):
+        self.write(command)
+        return self.read()
+
+    def query_binary_values(self, command, datatype='f', is_big_endian=False, container=list, **kwargs):
+        self.write(command)
+        return util.from_ieee_block(self.read_raw(), datatype, is_big_endian, container)
+
+    def clear(self):
+        self.response = b''
+
+    def close(self):
+        pass
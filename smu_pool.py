@@ -0,0 +1,142 @@
+'''
+This file contains the pool of SMUs used when more than one Keithley 2450 is wired to the pixel
+switch. Each SMU serves its own group of pixels, so pixels of different groups are independent and
+are swept at the same time, one per SMU, instead of one after another.
+
+The pool is configured from a list of addresses or from a JSON file:
+    {"smus": [{"address": "USB0::0x05E6::0x2450::04387860::INSTR", "pixels": [1, 2, 3, 4]},
+              {"address": "USB0::0x05E6::0x2450::04387861::INSTR", "pixels": [5, 6, 7, 8]}]}
+
+A measurement of several pixels is split into rounds with at most one pixel per SMU. Every SMU of a
+round is configured first, then all of them wait on a software barrier and start their sweeps
+together, so the pixels are illuminated under the same conditions. The starts line up to within one
+bus round trip, which is well below the step delay of a sweep; the 2450's digital I/O trigger lines
+would do better but need a trigger model and wiring between the instruments that this setup does not
+have. Each SMU keeps its own MeasurementSystem (session, config cache, renderer and save thread), so
+the throughput grows with the number of SMUs until the host-side processing becomes the limit.
+
+Authors: Jason Whitney, Amr Mohamed, Prachya Chowdhury
+'''
+
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from measurement_system import MeasurementSystem
+from tracing import TRACER
+
+# How long an SMU waits for the others of its round before the round is given up
+BARRIER_TIMEOUT_S = 30
+
+
+def split_pixels(pixels, count):
+    # Contiguous groups of pixels, one per SMU, as even in size as possible
+    pixels = list(pixels)
+    size, extra = divmod(len(pixels), count)
+    groups, start = [], 0
+    for index in range(count):
+        end = start + size + (1 if index < extra else 0)
+        groups.append(pixels[start:end])
+        start = end
+    return groups
+
+
+class SmuPool:
+    def __init__(self, groups, measurement_system_class=MeasurementSystem, **system_options):
+        # groups maps each SMU address to the pixels wired to it through the switch. system_options are
+        # passed on to every MeasurementSystem, e.g. open_resource for simulated instruments.
+        self.groups = {address: list(pixels) for address, pixels in groups.items()}
+        self.pixel_addresses = {}
+        for address, pixels in self.groups.items():
+            for pixel in pixels:
+                if pixel in self.pixel_addresses:
+                    raise ValueError(f"Pixel {pixel} is mapped to both {self.pixel_addresses[pixel]} and {address}")
+                self.pixel_addresses[pixel] = address
+        system_options.setdefault('ser_port', None)  # The pixel switch belongs to the control program
+        self.systems = {address: measurement_system_class(address, **system_options) for address in self.groups}
+        # One thread per SMU, a sweep never waits for a free worker
+        self.executor = ThreadPoolExecutor(max_workers=max(len(self.systems), 1), thread_name_prefix='smu-pool')
+        self.round_times = []  # Wall time of every round of measure() in s
+        self.errors = {}  # Pixel -> exception of the last measure()
+
+    @classmethod
+    def from_addresses(cls, addresses, pixels, **kwargs):
+        return cls(dict(zip(addresses, split_pixels(pixels, len(addresses)))), **kwargs)
+
+    @classmethod
+    def from_config(cls, filename, **kwargs):
+        with open(filename) as f:
+            config = json.load(f)
+        return cls({smu['address']: smu['pixels'] for smu in config['smus']}, **kwargs)
+
+    def address_for(self, pixel):
+        if pixel not in self.pixel_addresses:
+            raise ValueError(f"Pixel {pixel} is not mapped to any SMU of the pool")
+        return self.pixel_addresses[pixel]
+
+    def system_for(self, pixel):
+        return self.systems[self.address_for(pixel)]
+
+    def start_run(self, run_store=None, baseline_policy=None):
+        # Every SMU appends to the same run store, RunStore.append is thread safe
+        for system in self.systems.values():
+            system.start_run(run_store, baseline_policy)
+
+    def rounds(self, pixels):
+        # Pixels in groups that can be measured together, at most one per SMU, keeping their order per SMU
+        queues = {address: [] for address in self.systems}
+        for pixel in pixels:
+            queues[self.address_for(pixel)].append(pixel)
+        while any(queues.values()):
+            yield [queue.pop(0) for queue in queues.values() if queue]
+
+    def measure(self, pixels, save_directory, input_power, start_voltage, stop_voltage, steps, step_delay=0.1,
+                select=None):
+        # Measures the pixels round by round and returns {pixel: figures}. select(round_pixels) is called
+        # before every round to route the pixels of the round through the switch.
+        results, errors = {}, {}
+        for round_pixels in self.rounds(pixels):
+            if select is not None:
+                select(round_pixels)
+            round_start = time.monotonic()
+            barrier = threading.Barrier(len(round_pixels), timeout=BARRIER_TIMEOUT_S)
+            futures = {pixel: self.executor.submit(self.measure_pixel, pixel, barrier, save_directory, input_power,
+                                                   start_voltage, stop_voltage, steps, step_delay)
+                       for pixel in round_pixels}
+            for pixel, future in futures.items():
+                try:
+                    results[pixel] = future.result()
+                except Exception as e:
+                    errors[pixel] = e
+                    print(f"Pixel {pixel} failed on {self.pixel_addresses[pixel]}: {e}")
+            self.round_times.append(time.monotonic() - round_start)
+        self.errors = errors
+        return results
+
+    def measure_pixel(self, pixel, barrier, save_directory, input_power, start_voltage, stop_voltage, steps,
+                      step_delay=0.1):
+        # Runs in the SMU's worker thread
+        system = self.system_for(pixel)
+        with TRACER.span('sweep', 'stage', step=pixel, smu=system.instrument_address), system.smu:
+            try:
+                system.configure_instrument(start_voltage, stop_voltage, steps, step_delay, initiate=False)
+            except Exception:
+                barrier.abort()  # Release the other SMUs of the round instead of letting them time out
+                raise
+            barrier.wait()
+            system.start_sweep()
+            system.wait_for_sweep()
+            voltage, current = system.read_sweep_data()
+        if len(voltage) == 0:
+            raise RuntimeError(f"No data in the buffer of {system.instrument_address}")
+        with TRACER.span('processing', 'stage', step=pixel):
+            return system.process_sweep(voltage, current, save_directory, input_power, pixel)
+
+    def flush_saves(self):
+        for system in self.systems.values():
+            system.flush_saves()
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+        for system in self.systems.values():
+            system.close_connections()
@@ -0,0 +1,193 @@
+'''
+This file contains the serial protocol of the Arduino pixel switch.
+
+The original firmware takes single characters: 'o' opens every relay and a letter per pixel ('r',
+'g', ...) closes that pixel's relay. Nothing comes back, so the programs waited a fixed second after
+every selection. The framed protocol replaces that with one packet per selection and an answer once
+the relays have settled:
+
+    request   0x7E  seq  command  length  payload[length]  crc
+    response  0x7E  seq  status   length  payload[length]  crc
+
+    command   'S'  select: open every relay, then close the relays named in the payload (the same
+                   letters as the original firmware), so several pixels are selected in one packet
+              'O'  open every relay
+              'P'  ping, answered straight away
+    status    'A'  done, sent after the relays have settled
+              'N'  rejected, the payload holds the reason as text
+    crc       CRC-8 (polynomial 0x07) over seq, command/status, length and payload
+
+A request without an answer within the timeout is sent again with the same sequence number, up to
+retries times. The firmware answers a repeated sequence number without switching again, so a lost
+answer never switches twice.
+
+open_pixel_switch() pings the port at PROTOCOL_BAUD and falls back to the character protocol at
+LEGACY_BAUD when nothing answers, so both firmware versions keep working.
+
+Authors: Jason Whitney, Amr Mohamed, Prachya Chowdhury
+'''
+
+import time
+import serial
+from tracing import TRACER
+
+START_OF_FRAME = 0x7E
+SELECT = ord('S')
+ALL_OFF = ord('O')
+PING = ord('P')
+ACK = ord('A')
+NAK = ord('N')
+
+PROTOCOL_BAUD = 115200
+LEGACY_BAUD = 9600
+# Answer timeout per attempt; the relays settle in a few ms, the rest is headroom for USB latency
+ACK_TIMEOUT_S = 0.5
+RETRIES = 3
+# Settling time assumed for the original firmware, which never answers
+LEGACY_SETTLE_S = 1.0
+# Opening the port resets the Arduino, its bootloader runs for about this long
+ARDUINO_RESET_S = 2.0
+LEGACY_ALL_OFF = 'o'
+
+
+class SwitchError(Exception):
+    pass
+
+
+def crc8(data):
+    crc = 0
+    for byte in data:
+        crc ^= byte
+        for _ in range(8):
+            crc = ((crc << 1) ^ 0x07) & 0xFF if crc & 0x80 else (crc << 1) & 0xFF
+    return crc
+
+
+def encode_frame(seq, command, payload=b''):
+    if len(payload) > 255:
+        raise ValueError("A frame carries at most 255 payload bytes")
+    body = bytes([seq, command, len(payload)]) + payload
+    return bytes([START_OF_FRAME]) + body + bytes([crc8(body)])
+
+
+def read_frame(ser, timeout):
+    # Next valid frame as (seq, command or status, payload), None when nothing arrives within timeout.
+    # Bytes before a start of frame and frames with a bad CRC are skipped.
+    deadline = time.monotonic() + timeout
+
+    def read(size):
+        data = b''
+        while len(data) < size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return None
+            ser.timeout = remaining
+            data += ser.read(size - len(data))
+        return data
+
+    while True:
+        byte = read(1)
+        if byte is None:
+            return None
+        if byte[0] != START_OF_FRAME:
+            continue
+        header = read(3)
+        if header is None:
+            return None
+        rest = read(header[2] + 1)
+        if rest is None:
+            return None
+        body = header + rest[:-1]
+        if crc8(body) == rest[-1]:
+            return header[0], header[1], body[3:]
+
+
+class PixelSwitch:
+    def __init__(self, ser, timeout=ACK_TIMEOUT_S, retries=RETRIES):
+        self.ser = ser
+        self.timeout = timeout
+        self.retries = retries
+        self.seq = 0
+        self.retry_count = 0  # Requests sent again over the life of the switch
+        self.round_trip_times = []
+
+    def select(self, *codes):
+        # Closes the relays of the given pixel codes and opens every other one, in one packet
+        if not codes:
+            return self.off()
+        return self.transact(SELECT, ''.join(codes).encode())
+
+    def off(self):
+        return self.transact(ALL_OFF)
+
+    def ping(self):
+        return self.transact(PING)
+
+    def transact(self, command, payload=b''):
+        with TRACER.span('switch', 'switch', command=chr(command), payload=payload.decode()):
+            return self.send(command, payload)
+
+    def send(self, command, payload):
+        self.seq = (self.seq + 1) % 256
+        frame = encode_frame(self.seq, command, payload)
+        start = time.perf_counter()
+        for attempt in range(self.retries + 1):
+            if attempt:
+                self.retry_count += 1
+            self.ser.reset_input_buffer()  # Drop late answers to earlier attempts
+            self.ser.write(frame)
+            while True:
+                response = read_frame(self.ser, self.timeout)
+                if response is None or response[0] == self.seq:
+                    break
+                # An answer to an older request arriving late, keep waiting for ours
+            if response is None:
+                continue
+            seq, status, reply = response
+            if status == NAK:
+                raise SwitchError(f"Pixel switch rejected {chr(command)} {payload!r}: {reply.decode(errors='replace')}")
+            self.round_trip_times.append(time.perf_counter() - start)
+            return reply
+        raise SwitchError(f"No answer from the pixel switch to {chr(command)} {payload!r} "
+                          f"after {self.retries + 1} attempts")
+
+    def close(self):
+        self.ser.close()
+
+
+class LegacyPixelSwitch:
+    # Original character protocol, for Arduinos that still run the old firmware
+    def __init__(self, ser, settle_time=LEGACY_SETTLE_S):
+        self.ser = ser
+        self.settle_time = settle_time
+
+    def select(self, *codes):
+        with TRACER.span('switch', 'switch', command='legacy', payload=''.join(codes)):
+            for code in (LEGACY_ALL_OFF,) + codes:
+                self.ser.write(code.encode())
+            # No answer comes back, so wait for the relays as long as they could take
+            time.sleep(self.settle_time)
+
+    def off(self):
+        self.ser.write(LEGACY_ALL_OFF.encode())
+
+    def close(self):
+        self.ser.close()
+
+
+def open_pixel_switch(port, baud=PROTOCOL_BAUD, legacy_baud=LEGACY_BAUD, timeout=ACK_TIMEOUT_S, retries=RETRIES,
+                      reset_time=ARDUINO_RESET_S):
+    # PixelSwitch when the firmware answers a ping, LegacyPixelSwitch otherwise
+    ser = serial.Serial(port, baud)
+    time.sleep(reset_time)
+    switch = PixelSwitch(ser, timeout, retries)
+    try:
+        switch.ping()
+        return switch
+    except SwitchError:
+        ser.close()
+    print(f"No answer to the framed protocol on {port}, using the character protocol at {legacy_baud} baud")
+    ser = serial.Serial(port, legacy_baud)
+    # Reopening resets the Arduino again, a selection sent before its bootloader is done would be lost
+    time.sleep(reset_time)
+    return LegacyPixelSwitch(ser)
@@ -1,16 +1,24 @@
 import sys
 import tkinter as tk
-from tkinter import simpledialog
+from tkinter import simpledialog, filedialog, messagebox
 import threading
 from pyaxidraw import axidraw
-import serial
 import os
 from measurement_system import MeasurementSystem
+from visa_sessions import session_metrics
+from pixel_layout import load_layout
+from layout_gui import PixelMap
+from motion_settle import MotionSettler
+from baseline_policy import BaselinePolicy
+from full_auto_run import FullAutoRun
+from run_journal import RunJournal
+from device_layer import DeviceLayer, AxiDrawDriver, PixelSwitchDriver, SmuDriver
+from switch_protocol import open_pixel_switch
 
 class PixelControlSystem:
     def __init__(self):
-        # Initialize MeasurementSystem instance
-        self.measurement_system = MeasurementSystem('USB0::0x05E6::0x2450::04387860::INSTR')
+        # Initialize MeasurementSystem instance, the Arduino port below is opened by this class
+        self.measurement_system = MeasurementSystem('USB0::0x05E6::0x2450::04387860::INSTR', ser_port=None)
         self.ad = axidraw.AxiDraw()  # Initialize AxiDraw
         self.ad.interactive()
         if not self.ad.connect():
@@ -22,26 +30,35 @@ class PixelControlSystem:
         self.ad.options.speed_penup = 10
         self.ad.update()
 
-        # Define the alternative measurement position
+        # Guards robot moves against sweeps, see run_scheduler.py
+        self.interlock = threading.Lock()
+
+        # Waits after each move are sized to the move instead of a fixed 2 s
+        self.motion = MotionSettler(self.ad, strategy='computed')
 
-        self.position_y = [10, 20]
-        # Define pixel positions#hello
-        self.pixel_positions = {
-            1: [0, 5],
-            2: [0, 10],
-            3: [0, 15],
-            4: [0, 20],
-            5: [5, 20],
-            6: [5, 15],
-            7: [5, 10],
-            8: [5, 5]
-        }
-
-        # Initialize serial connection to Arduino
-        self.ser = serial.Serial('COM7', 9600)
-
-        # Initialize MeasurementSystem reference
-        self.measurement_system = None
+        # Pixel positions, switch commands and the baseline position come from pixel_layout.json when it
+        # exists, otherwise the 8-pixel substrate is used
+        self.layout = load_layout()
+        # Define the alternative measurement position
+        self.position_y = list(self.layout.baseline)
+        # Define pixel positions
+        self.pixel_positions = {pixel: list(position) for pixel, position in self.layout.positions.items()}
+
+        # Besides the every-N-pixels cadence asked for at the start of a full-auto run, a baseline is
+        # also taken when the cached one is older than this, or every pixel while the lamp drifts (Isc fraction)
+        self.baseline_max_age_s = 600
+        self.baseline_drift_threshold = 0.02
+
+        # Initialize serial connection to Arduino, with the framed protocol when its firmware has it
+        self.switch = open_pixel_switch('COM7')
+
+        # The GUI submits jobs to the device layer instead of using the devices directly; each device
+        # has its own command queue and jobs run one at a time in the order they were submitted
+        self.devices = DeviceLayer(robot=AxiDrawDriver(self.motion), switch=PixelSwitchDriver(self.switch),
+                                   smu=SmuDriver(self.measurement_system))
+        self.full_auto = FullAutoRun(self.measurement_system, self.pixel_positions, self.position_y,
+                                     home=self.layout.home, interlock=self.interlock,
+                                     pixel_commands=self.layout.commands)
 
         # Create the GUI
         self.root = tk.Tk()
@@ -49,22 +66,9 @@ class PixelControlSystem:
         self.create_gui()
 
     def create_gui(self):
-        button_positions = {
-            "Pixel1": (60, 67),
-            "Pixel2": (60, 134),
-            "Pixel3": (60, 201),
-            "Pixel4": (60, 268),
-            "Pixel5": (240, 67),
-            "Pixel6": (240, 134),
-            "Pixel7": (240, 201),
-            "Pixel8": (240, 268)
-        }
-
-        # Create pixel buttons based on the defined positions
-        for name, position in button_positions.items():
-            pixel_num = int(name[5:])  # Extract pixel number from the button name
-            button = tk.Button(self.root, text=name, command=lambda n=pixel_num: self.pixel_button_click(n))
-            button.place(x=position[0], y=position[1], width=50, height=50)
+        # One button per pixel of the layout, drawn at the pixel's position on the plate
+        pixel_map = PixelMap(self.root, self.layout, self.pixel_button_click, width=360, height=290)
+        pixel_map.place(x=10, y=10, width=380, height=310)
 
         # Position for the Abort button
         # Placed beneath the other buttons, with a uniform size
@@ -81,13 +85,38 @@ class PixelControlSystem:
         full_auto_button = tk.Button(self.root, text="Full-Auto", command=self.full_auto_measurement)
         full_auto_button.place(x=full_auto_button_x, y=full_auto_button_y, width=50, height=50)
 
+        # Continues a full-auto run that stopped early, next to the Full-Auto button
+        resume_button = tk.Button(self.root, text="Resume", command=self.resume)
+        resume_button.place(x=full_auto_button_x + 60, y=full_auto_button_y, width=50, height=50)
+
+        # Adaptive sweeps measure a coarse pass plus dense points around the MPP and Voc instead of
+        # the uniform step count, for about the same accuracy in a fraction of the points
+        self.adaptive_sweep = tk.BooleanVar(value=self.measurement_system.adaptive)
+        adaptive_button = tk.Checkbutton(self.root, text="Adaptive sweep", variable=self.adaptive_sweep,
+                                         command=self.toggle_adaptive_sweep)
+        adaptive_button.place(x=120, y=455)
+
+        # Repeated measurements of a pixel only track its MPP with a few points, for soak tests
+        self.mpp_tracking = tk.BooleanVar(value=self.measurement_system.tracking)
+        tracking_button = tk.Checkbutton(self.root, text="Track MPP", variable=self.mpp_tracking,
+                                         command=self.toggle_mpp_tracking)
+        tracking_button.place(x=120, y=480)
+
+    def toggle_adaptive_sweep(self):
+        self.measurement_system.adaptive = self.adaptive_sweep.get()
+
+    def toggle_mpp_tracking(self):
+        self.measurement_system.tracking = self.mpp_tracking.get()
+        if not self.measurement_system.tracking:
+            self.measurement_system.mpp_tracker.forget()
+
     def pixel_button_click(self, pixel_number):
         results = self.get_measurement_inputs()
         if all(result is not None for result in results):
             save_directory, input_power, start_voltage, stop_voltage, steps = results
-            threading.Thread(target=self.robot_move_to_pixel, args=(
-                pixel_number, save_directory, input_power, start_voltage, stop_voltage, steps)).start()
-            #self.robot_move_to_pixel(pixel_number, save_directory, input_power)
+            # Queued behind any job that is still running, so clicks can line up several pixels
+            self.devices.submit(self.robot_move_to_pixel, pixel_number, save_directory, input_power, start_voltage,
+                                stop_voltage, steps, description=f"pixel {pixel_number}")
 
     def full_auto_measurement(self):
         save_directory = self.get_save_directory()
@@ -98,31 +127,29 @@ class PixelControlSystem:
         if any(setting is None for setting in [input_power, start_voltage, stop_voltage, steps]):
             return  # Incomplete measurement settings
 
-        for pixel_number in range(1, 9):
-            # Step 1: Perform the baseline measurement at position_y
-            self.perform_measurement_at_position(self.position_y, save_directory, input_power, start_voltage,
-                                                 stop_voltage, steps, "baseline")
-
-            # Step 2: Move to pixel position and perform the measurement
-            self.perform_measurement_for_pixel(pixel_number, save_directory, input_power, start_voltage, stop_voltage,
-                                               steps)
-
-    def perform_measurement_at_position(self, position, save_directory, input_power, start_voltage, stop_voltage, steps,
-                                        measurement_type):
-        # Similar logic as in `perform_measurement_for_pixel` but for a generic position
-        self.ad.moveto(position[0], position[1])
-        self.ad.delay(2000)  # Wait a bit for the movement to complete
-
-        if not self.measurement_system:
-            print("Measurement system not initialized")
+        every_n_pixels = simpledialog.askinteger("Baseline Cadence",
+                                                 "Take a baseline every N pixels (0 = once per run):",
+                                                 parent=self.root, initialvalue=1, minvalue=0)
+        if every_n_pixels is None:
             return
-
-        # Assuming perform_measurement can accept a 'suffix' or 'measurement_type' to customize saving
-        suffix = f"{measurement_type}_before_pixel"
-        self.measurement_system.perform_measurement(save_directory, input_power, suffix=suffix)
-
-        self.ad.moveto(0, 0)  # Optionally return to "home" position
-        self.ad.delay(1000)
+        policy = BaselinePolicy(every_n_pixels, self.baseline_max_age_s, self.baseline_drift_threshold)
+        self.devices.submit(self.full_auto.job, save_directory, input_power, start_voltage, stop_voltage, steps,
+                            policy, description="full auto")
+
+    def resume(self, run_directory=None):
+        # Measures the pixels a stopped full-auto run is missing, with the settings it was started with
+        run_directory = run_directory or filedialog.askdirectory(title="Run directory (run_...) to resume",
+                                                                 parent=self.root)
+        if not run_directory:
+            return
+        robot_position = RunJournal(run_directory).robot_position()
+        if robot_position is not None and tuple(robot_position) != tuple(self.full_auto.home) \
+                and not self.motion.move_log:
+            # The AxiDraw takes wherever it was connected as its origin, so it has to be home by now
+            if not messagebox.askokcancel("Resume", f"The robot was left at {robot_position} mm. Make sure it "
+                                                    f"is back at its home position before resuming."):
+                return
+        self.devices.submit(self.full_auto.resume, run_directory, description="resume full auto")
 
     def get_save_directory(self):
         final_directory_name = simpledialog.askstring("Save Directory",
@@ -144,69 +171,44 @@ class PixelControlSystem:
         steps = simpledialog.askinteger("Steps", "Enter the number of steps:", parent=self.root)
         return input_power, start_voltage, stop_voltage, steps
 
-    def perform_measurement_for_pixel(self, pixel_number, save_directory, input_power, start_voltage, stop_voltage,
-                                      steps):
-        # Assuming self.pixel_positions is a dictionary mapping pixel numbers to (x, y) positions
-        position = self.pixel_positions[pixel_number]
-
-        # Move the AxiDraw to the specified pixel position
-        self.ad.moveto(position[0], position[1])
-        self.ad.delay(2000)  # Wait a bit for the movement to complete
-
-        # Now perform the measurement with the MeasurementSystem instance
-        # Ensure your MeasurementSystem instance is correctly initialized and ready to use
-        if not self.measurement_system:
-            print("Measurement system not initialized")
-            return
-
-        # Execute the measurement, passing the pixel_number to include in the filename
-        self.measurement_system.perform_measurement(save_directory, input_power, pixel_number=pixel_number)
-
-        # After the measurement, optionally return the AxiDraw to a "home" position
-        self.ad.moveto(0, 0)
-        self.ad.delay(1000)
+    def get_measurement_inputs(self):
+        # Save directory followed by the measurement settings, all None when the user cancels the directory
+        save_directory = self.get_save_directory()
+        if not save_directory:
+            return None, None, None, None, None
+        return (save_directory,) + self.get_measurement_settings()
 
-    def robot_move_to_pixel(self, pixel_number, save_directory, input_power):
+    async def robot_move_to_pixel(self, devices, pixel_number, save_directory, input_power, start_voltage,
+                                  stop_voltage, steps):
         x_coord, y_coord = self.pixel_positions[pixel_number]
 
         # Move the AxiDraw to the specified coordinates
-        self.ad.moveto(x_coord, y_coord)
-        self.ad.delay(2000)  # Delay 2 seconds
+        await devices.robot.move_to(x_coord, y_coord)
 
         # Send command to Arduino for the selected pixel
-        command = self.get_arduino_command(pixel_number)
-        self.ser.write(command.encode())
+        await devices.switch.select(*self.get_switch_codes(pixel_number))
 
         # Perform measurement at the current pixel position
-        if self.measurement_system:
-            self.measurement_system.perform_measurement(save_directory, input_power)
-        else:
-            print("Measurement system not initialized")
+        await devices.smu.measure(save_directory, input_power, pixel_number, start_voltage, stop_voltage, steps)
 
         # Return to starting position
-        self.ad.moveto(0, 0)
+        await devices.robot.home()
 
-    def get_arduino_command(self, pixel_number):
-        # Map each pixel number to a specific Arduino command
-        pixel_commands = {
-            1: 'r',  # Command for Pixel 1
-            2: 'g',  # Command for Pixel 2
-            3: 'b',  # Command for Pixel 3
-            4: 'f',  # Command for Pixel 4
-            5: 'y',  # Command for Pixel 5
-            6: 'u',  # Command for Pixel 6
-            7: 'i',  # Command for Pixel 7
-            8: 'k'  # Command for Pixel 8
-
-        }
-
-        # Get the command for the given pixel number, default to 'o' if not found
-        return pixel_commands.get(pixel_number, 'o')
+    def get_switch_codes(self, pixel_number):
+        # Relay code of the pixel; pixels the switch does not route get none, which opens every relay
+        command = self.layout.commands.get(pixel_number)
+        if command is None:
+            print(f"Pixel {pixel_number} has no switch command, opening every relay")
+            return ()
+        return (command,)
 
     def abort_program(self):
         # Optionally, confirm with the user before aborting
         if tk.messagebox.askokcancel("Abort", "Are you sure you want to abort and exit?"):
-            # Move the robot to its origin position
+            # Stop a running full-auto run after its current step, drop queued jobs and move the robot
+            # to its origin position
+            self.full_auto.abort()
+            self.devices.cancel_pending()
             self.move_robot_to_origin()
 
             # Close all resources
@@ -217,26 +219,35 @@ class PixelControlSystem:
 
     def move_robot_to_origin(self):
         # Assuming (0, 0) is the origin position for the robot
-        self.ad.moveto(0, 0)
-        self.ad.delay(1000)  # Optional delay to allow the robot to reach the origin
+        with self.interlock:  # Never while a full-auto sweep is running
+            self.devices.call(self.devices.robot.home())  # Waits for the robot to reach the origin
 
     def run(self):
         self.root.mainloop()
 
     def close(self):
+        # Stop the device layer first so no queued command uses a closed port
+        self.devices.close()
+        for metrics in self.devices.metrics():
+            print(f"{metrics['device']}: {metrics['commands']} commands, {metrics['busy_s']:.1f} s busy")
+
         # Close the serial connection to Arduino
-        if self.ser and self.ser.is_open:
-            self.ser.close()
+        if self.switch:
+            self.switch.close()
             print("Serial connection to Arduino closed.")
 
         # Disconnect from AxiDraw
         if self.ad:
+            print(f"AxiDraw moves: {self.motion.summary()}")
             self.ad.disconnect()
             print("Disconnected from AxiDraw.")
 
         # Close the connection to the SMU if it's open
         if self.measurement_system:
             self.measurement_system.close_connections()
+            for metrics in session_metrics():
+                print(f"VISA session {metrics['address']}: connect {metrics['connect']}, "
+                      f"reconnect {metrics['reconnect']}")
             print("Connection to SMU closed.")
 
 if __name__ == "__main__":
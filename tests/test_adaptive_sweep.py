@@ -0,0 +1,57 @@
+'''
+Tests of adaptive sweep planning and of adaptive sweeps on the simulated SMU.
+
+Authors: Jason Whitney, Amr Mohamed, Prachya Chowdhury
+'''
+
+import itertools
+import numpy as np
+import pytest
+from adaptive_sweep import refinement_levels, merge_sweeps, ADAPTIVE_COARSE_POINTS
+from measurement_system import MeasurementSystem
+from simulated_instrument import SimulatedSMU
+from iv_analysis import analyse_curves
+
+addresses = itertools.count()
+
+
+def test_levels_surround_the_mpp_and_voc():
+    coarse = np.linspace(0, 0.7, 12)
+    levels = refinement_levels(coarse, {'mpp_voltage': 0.5, 'voc': 0.6}, dense_points=7)
+    step = 0.7 / 11
+    assert np.all(np.diff(levels) > 0)
+    assert not np.isclose(levels[:, None], coarse[None, :]).any()  # Nothing measured twice
+    near_mpp = np.abs(levels - 0.5) <= step / 2 + 1e-9
+    near_voc = np.abs(levels - 0.6) <= step / 2 + 1e-9
+    assert near_mpp.sum() >= 6 and near_voc.sum() >= 6
+    assert np.all(near_mpp | near_voc)
+
+
+def test_levels_follow_the_sweep_direction_and_range():
+    coarse = np.linspace(0.7, -0.1, 12)
+    levels = refinement_levels(coarse, {'mpp_voltage': 0.68, 'voc': float('nan')})
+    assert np.all(np.diff(levels) < 0)
+    assert levels.max() <= 0.7 and levels.min() >= -0.1
+    assert 0.0 in levels  # Isc is measured at 0 V when the range includes it
+    assert len(refinement_levels(np.linspace(0.1, 0.7, 12), {})) == 0
+
+
+def test_merge_prefers_the_dense_pass():
+    voltage, current = merge_sweeps(np.array([0.0, 0.2, 0.4]), np.array([1.0, 2.0, 3.0]),
+                                    np.array([0.3, 0.2]), np.array([9.0, 8.0]))
+    np.testing.assert_array_equal(voltage, [0.0, 0.2, 0.3, 0.4])
+    np.testing.assert_array_equal(current, [1.0, 8.0, 9.0, 3.0])
+
+
+def test_adaptive_sweep_matches_a_dense_sweep_with_fewer_points():
+    smu = SimulatedSMU()
+    system = MeasurementSystem(f'SIMULATED::adaptive{next(addresses)}', ser_port=None,
+                               open_resource=lambda address: smu, background_save=False)
+    dense = analyse_curves(*system.acquire_sweep(0.0, 0.7, 400))
+    system.adaptive = True
+    voltage, current = system.acquire_sweep(0.0, 0.7, 400)
+    adaptive = analyse_curves(voltage, current)
+    assert len(voltage) < 3 * ADAPTIVE_COARSE_POINTS
+    assert adaptive['max_power'][0] == pytest.approx(dense['max_power'][0], rel=1e-3)
+    assert adaptive['voc'][0] == pytest.approx(dense['voc'][0], abs=1e-3)
+    assert adaptive['isc'][0] == pytest.approx(dense['isc'][0], rel=1e-6)
@@ -0,0 +1,67 @@
+'''
+Tests of the baseline cadence and normalization of full-auto runs.
+
+Authors: Jason Whitney, Amr Mohamed, Prachya Chowdhury
+'''
+
+import pytest
+from baseline_policy import BaselinePolicy
+
+
+def scheduled_baselines(policy, pixels, seconds_per_pixel=1.0):
+    # Pixels before which the policy takes a baseline, with a clock advancing per pixel
+    taken = []
+    for pixel in range(pixels):
+        now = pixel * seconds_per_pixel
+        if policy.needs_baseline(now):
+            policy.baseline_scheduled(now)
+            taken.append(pixel)
+        policy.pixel_scheduled()
+    return taken
+
+
+@pytest.mark.parametrize('every_n_pixels, expected', [(1, list(range(8))), (3, [0, 3, 6]), (0, [0])])
+def test_every_n_pixels(every_n_pixels, expected):
+    assert scheduled_baselines(BaselinePolicy(every_n_pixels), 8) == expected
+
+
+def test_max_age():
+    policy = BaselinePolicy(every_n_pixels=0, max_age_s=2.5)
+    assert scheduled_baselines(policy, 8) == [0, 3, 6]
+
+
+def test_drift_takes_a_baseline_before_every_pixel_until_stable():
+    policy = BaselinePolicy(every_n_pixels=0, drift_threshold=0.02)
+    policy.record_baseline('b0', {'isc': 0.020, 'max_power': 0.010})
+    policy.baseline_scheduled(0)
+    assert not policy.needs_baseline(1)
+    policy.record_baseline('b1', {'isc': 0.021, 'max_power': 0.010})  # 5% drift
+    assert policy.drifting and policy.needs_baseline(1)
+    policy.record_baseline('b2', {'isc': 0.0211, 'max_power': 0.010})
+    assert not policy.drifting
+
+
+def test_normalize_against_the_cached_baseline():
+    policy = BaselinePolicy()
+    assert policy.normalize({'max_power': 0.008}) == {'max_power': 0.008}
+    policy.record_baseline('baseline_before_pixel_1', {'isc': 0.02, 'max_power': 0.010})
+    figures = policy.normalize({'max_power': 0.008})
+    assert figures['baseline_label'] == 'baseline_before_pixel_1'
+    assert figures['normalized_power'] == pytest.approx(0.8)
+
+
+def test_nothing_is_normalized_after_the_run():
+    policy = BaselinePolicy()
+    policy.record_baseline('baseline', {'isc': 0.02, 'max_power': 0.010})
+    policy.end_run()
+    assert 'normalized_power' not in policy.normalize({'max_power': 0.008})
+
+
+def test_restore_continues_a_resumed_run():
+    policy = BaselinePolicy(every_n_pixels=3)
+    policy.restore('baseline_before_pixel_4', {'isc': 0.02, 'max_power': 0.01}, timestamp=100.0,
+                   pixels_since_baseline=2)
+    assert not policy.needs_baseline(101.0)
+    policy.pixel_scheduled()
+    assert policy.needs_baseline(102.0)
+    assert policy.normalize({'max_power': 0.005})['normalized_power'] == pytest.approx(0.5)
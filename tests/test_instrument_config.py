@@ -0,0 +1,51 @@
+'''
+Tests of the SMU configuration cache.
+
+Authors: Jason Whitney, Amr Mohamed, Prachya Chowdhury
+'''
+
+from instrument_config import InstrumentConfigCache, SWEEP_SETTINGS, config_cache_for
+
+
+class RecordingSmu:
+    def __init__(self):
+        self.written = []
+
+    def write(self, command):
+        self.written.append(command)
+
+
+def test_only_changed_settings_are_written():
+    cache, smu = InstrumentConfigCache(), RecordingSmu()
+    cache.reset(smu)
+    assert cache.write_all(smu, SWEEP_SETTINGS) == len(SWEEP_SETTINGS)
+    assert cache.write_all(smu, SWEEP_SETTINGS) == 0
+    assert cache.write(smu, 'SOUR:SWE:VOLT:LIN 0, 0.7, 50, 0.1')
+    assert not cache.write(smu, 'SOUR:SWE:VOLT:LIN 0, 0.7, 50, 0.1')
+    assert cache.write(smu, 'SOUR:SWE:VOLT:LIN 0, 0.6, 50, 0.1')
+    assert smu.written == ['*RST', '*CLS'] + SWEEP_SETTINGS + ['SOUR:SWE:VOLT:LIN 0, 0.7, 50, 0.1',
+                                                               'SOUR:SWE:VOLT:LIN 0, 0.6, 50, 0.1']
+    assert cache.writes_skipped == len(SWEEP_SETTINGS) + 1
+
+
+def test_settings_are_keyed_by_header_case_insensitively():
+    cache, smu = InstrumentConfigCache(), RecordingSmu()
+    cache.write(smu, 'form:data ASC')
+    assert cache.write(smu, 'FORM:DATA REAL')
+    assert not cache.write(smu, 'FORM:DATA REAL')
+
+
+def test_invalidate_and_forget():
+    cache, smu = InstrumentConfigCache(), RecordingSmu()
+    cache.reset(smu)
+    cache.write_all(smu, SWEEP_SETTINGS)
+    cache.forget('SOUR:FUNC')
+    assert cache.write_all(smu, SWEEP_SETTINGS) == 1
+    cache.invalidate()
+    assert not cache.is_initialized()
+    assert cache.write_all(smu, SWEEP_SETTINGS) == len(SWEEP_SETTINGS)
+
+
+def test_one_cache_per_address():
+    assert config_cache_for('SIMULATED::cache-a') is config_cache_for('SIMULATED::cache-a')
+    assert config_cache_for('SIMULATED::cache-a') is not config_cache_for('SIMULATED::cache-b')
@@ -0,0 +1,93 @@
+'''
+Tests of the batch I-V analysis against the single-diode model, whose Isc, Voc and MPP are known.
+
+Authors: Jason Whitney, Amr Mohamed, Prachya Chowdhury
+'''
+
+import numpy as np
+import pytest
+from iv_analysis import analyse_curves, stack_curves, zero_crossing, parabolic_peak
+
+ISC = 0.02
+VOC = 0.6
+N_VT = 1.5 * 0.025852  # Ideality times the thermal voltage at 300 K
+SATURATION_CURRENT = ISC / np.expm1(VOC / N_VT)
+
+
+def diode_current(voltage):
+    return ISC - SATURATION_CURRENT * np.expm1(np.asarray(voltage) / N_VT)
+
+
+def true_mpp():
+    voltage = np.linspace(0, VOC, 1_000_001)
+    power = voltage * diode_current(voltage)
+    peak = np.argmax(power)
+    return voltage[peak], power[peak]
+
+
+def test_figures_of_merit_match_the_diode_model():
+    voltage = np.linspace(0, 0.7, 71)
+    results = analyse_curves(voltage, diode_current(voltage), input_power=0.1)
+    mpp_voltage, max_power = true_mpp()
+    assert results['isc'][0] == pytest.approx(ISC, rel=1e-9)
+    assert results['voc'][0] == pytest.approx(VOC, abs=2e-3)
+    assert results['max_power'][0] == pytest.approx(max_power, rel=2e-3)
+    assert results['mpp_voltage'][0] == pytest.approx(mpp_voltage, abs=5e-3)
+    assert results['fill_factor'][0] == pytest.approx(max_power / (ISC * VOC), rel=5e-3)
+    assert results['efficiency'][0] == pytest.approx(results['max_power'][0] / 0.1 * 100)
+    # Rsh = -dV/dI at 0 V is N_VT / I0 for the ideal diode, far above any realistic value
+    assert results['shunt_resistance'][0] > 1e5
+
+
+def test_parabolic_mpp_is_closer_than_the_nearest_sample_on_average():
+    mpp_voltage, max_power = true_mpp()
+    vertex_errors, sample_errors = [], []
+    for points in range(25, 61):
+        voltage = np.linspace(0, 0.7, points)
+        power = voltage * diode_current(voltage)
+        vertex_voltage, vertex_power = parabolic_peak(voltage[None], power[None])
+        vertex_errors.append(abs(vertex_power[0] - max_power) / max_power)
+        sample_errors.append(abs(power.max() - max_power) / max_power)
+    assert max(vertex_errors) < 2e-3
+    assert np.mean(vertex_errors) < np.mean(sample_errors)
+
+
+def test_result_does_not_depend_on_the_sign_convention():
+    voltage = np.linspace(0, 0.7, 50)
+    positive = analyse_curves(voltage, diode_current(voltage))
+    negative = analyse_curves(voltage, -diode_current(voltage))
+    for name in ('isc', 'voc', 'max_power', 'mpp_voltage', 'fill_factor'):
+        assert negative[name][0] == pytest.approx(positive[name][0])
+
+
+def test_sweep_that_does_not_reach_zero_volts():
+    # No Isc, but the curve is still oriented by the sample nearest 0 V
+    voltage = np.linspace(0.05, 0.7, 100)
+    mpp_voltage, max_power = true_mpp()
+    for sign in (1, -1):
+        results = analyse_curves(voltage, sign * diode_current(voltage))
+        assert np.isnan(results['isc'][0])
+        assert results['max_power'][0] == pytest.approx(max_power, rel=2e-3)
+        assert results['voc'][0] == pytest.approx(VOC, abs=2e-3)
+
+
+def test_stacked_sweeps_of_different_lengths():
+    curves = [(v, diode_current(v)) for v in (np.linspace(0, 0.7, 30), np.linspace(0, 0.7, 80),
+                                               np.linspace(0, 0.65, 55))]
+    voltage, current = stack_curves(curves)
+    assert voltage.shape == (3, 80)
+    assert np.isnan(voltage[0, 30:]).all()
+    batch = analyse_curves(voltage, current)
+    for row, (v, i) in enumerate(curves):
+        single = analyse_curves(v, i)
+        for name in ('isc', 'voc', 'max_power', 'mpp_voltage'):
+            assert batch[name][row] == pytest.approx(single[name][0])
+
+
+def test_zero_crossing_interpolates_and_reports_missing_crossings():
+    x = np.array([[0.0, 1.0, 2.0], [0.0, 1.0, 2.0]])
+    y = np.array([[1.0, -1.0, -3.0], [1.0, 2.0, 3.0]])
+    crossing, slope = zero_crossing(x, y)
+    assert crossing[0] == pytest.approx(0.5)
+    assert slope[0] == pytest.approx(-2.0)
+    assert np.isnan(crossing[1]) and np.isnan(slope[1])
@@ -0,0 +1,86 @@
+'''
+Tests of MeasurementSystem against the simulated SMU.
+
+Authors: Jason Whitney, Amr Mohamed, Prachya Chowdhury
+'''
+
+import itertools
+import os
+import threading
+import numpy as np
+import pytest
+from measurement_system import MeasurementSystem, READBACK_FORMATS
+from simulated_instrument import SimulatedSMU
+from run_store import RunStore
+from baseline_policy import BaselinePolicy
+
+addresses = itertools.count()
+
+
+def simulated_system(smu=None, **options):
+    smu = smu or SimulatedSMU()
+    options.setdefault('background_save', False)
+    system = MeasurementSystem(f'SIMULATED::system{next(addresses)}', ser_port=None,
+                               open_resource=lambda address: smu, **options)
+    return system, smu
+
+
+def call_with_timeout(function, *args, timeout=10):
+    # A deadlock fails the test instead of hanging the suite
+    result, errors = [], []
+
+    def run():
+        try:
+            result.append(function(*args))
+        except Exception as e:
+            errors.append(e)
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    thread.join(timeout)
+    assert not thread.is_alive(), f"{function.__name__} did not return within {timeout} s"
+    if errors:
+        raise errors[0]
+    return result[0]
+
+
+@pytest.mark.parametrize('readback_format', list(READBACK_FORMATS))
+def test_chunked_readback_while_holding_the_session(readback_format):
+    system, smu = simulated_system(readback_format=readback_format, chunk_points=1000)
+    voltage, current = call_with_timeout(system.acquire_sweep, 0.0, 0.7, 2500)
+    np.testing.assert_allclose(voltage, np.linspace(0, 0.7, 2500), atol=1e-6)
+    np.testing.assert_allclose(current, smu.diode_current(voltage), rtol=1e-5, atol=1e-6)
+
+
+def test_readback_in_one_chunk_matches_chunked():
+    system, smu = simulated_system(chunk_points=100_000)
+    single = system.acquire_sweep(0.0, 0.7, 2500)
+    system.chunk_points = 300
+    chunked = call_with_timeout(system.acquire_sweep, 0.0, 0.7, 2500)
+    for a, b in zip(single, chunked):
+        np.testing.assert_array_equal(a, b)
+
+
+def test_summary_mode_matches_the_full_curve(tmp_path):
+    system, smu = simulated_system()
+    system.plots = False
+    full = system.process_sweep(*system.acquire_sweep(0.0, 0.7, 60), str(tmp_path), 0.1, 1)
+    summary = system.perform_measurement(str(tmp_path), 0.1, 2, 0.0, 0.7, 60, plots=False)
+    for name in ('isc', 'voc', 'max_power'):
+        assert summary[name] == pytest.approx(full[name], rel=1e-2)
+
+
+def test_measurements_after_a_run_leave_its_store_alone(tmp_path):
+    system, smu = simulated_system()
+    system.plots = False
+    store = RunStore(str(tmp_path / 'runs'))
+    system.start_run(store, BaselinePolicy())
+    system.perform_measurement(str(tmp_path), 0.1, 'baseline_before_pixel_1', 0.0, 0.7, 20, baseline=True)
+    in_run = system.perform_measurement(str(tmp_path), 0.1, 1, 0.0, 0.7, 20)
+    system.end_run()
+    after_run = system.perform_measurement(str(tmp_path), 0.1, 2, 0.0, 0.7, 20)
+
+    assert in_run['baseline_label'] == 'baseline_before_pixel_1'
+    assert 'baseline_label' not in after_run
+    assert [record['label'] for record in store.records()] == ['baseline_before_pixel_1', '1']
+    assert os.path.exists(tmp_path / 'Calculated_Values_2.txt')
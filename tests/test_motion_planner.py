@@ -0,0 +1,70 @@
+'''
+Tests of the full-auto route planner and the motion time model.
+
+Authors: Jason Whitney, Amr Mohamed, Prachya Chowdhury
+'''
+
+import itertools
+import numpy as np
+import pytest
+from motion_planner import (plan_route, nearest_neighbour_route, two_opt, path_length, move_time, grid_positions,
+                            AXIDRAW_MAX_SPEED, AXIDRAW_MAX_ACCELERATION, AXIDRAW_DEFAULT_ACCEL)
+from pixel_layout import HOME_POSITION, PIXEL_POSITIONS
+
+
+def route_length(route, positions, start=HOME_POSITION):
+    return path_length([start] + [positions[key] for key in route])
+
+
+def random_positions(count, seed):
+    rng = np.random.default_rng(seed)
+    return {pixel: tuple(position) for pixel, position in enumerate(rng.uniform(0, 50, (count, 2)), 1)}
+
+
+@pytest.mark.parametrize('positions', [PIXEL_POSITIONS, random_positions(40, 0), grid_positions(6, 6, 2.5), {},
+                                       {1: (3.0, 4.0)}])
+def test_route_visits_every_pixel_once(positions):
+    assert sorted(plan_route(positions)) == sorted(positions)
+
+
+def test_two_opt_never_lengthens_the_route():
+    for seed in range(10):
+        positions = random_positions(30, seed)
+        greedy = nearest_neighbour_route(positions)
+        assert route_length(two_opt(greedy, positions), positions) <= route_length(greedy, positions) + 1e-9
+
+
+def test_two_opt_leaves_no_improving_reversal():
+    positions = random_positions(25, 3)
+    route = plan_route(positions)
+    length = route_length(route, positions)
+    for i, j in itertools.combinations(range(len(route) + 1), 2):
+        reversed_route = route[:i] + route[i:j][::-1] + route[j:]
+        assert route_length(reversed_route, positions) >= length - 1e-9
+
+
+def test_small_plates_are_planned_optimally():
+    for seed in range(5):
+        positions = random_positions(7, seed)
+        best = min(route_length(order, positions) for order in itertools.permutations(positions))
+        assert route_length(plan_route(positions), positions) == pytest.approx(best, rel=0.05)
+
+
+def test_grid_route_is_close_to_the_lower_bound():
+    positions = grid_positions(8, 8, 2.5)
+    # Every pixel but the first is at least one pitch away from the one before it
+    lower_bound = min(np.hypot(x - HOME_POSITION[0], y - HOME_POSITION[1]) for x, y in positions.values()) + 63 * 2.5
+    assert route_length(plan_route(positions), positions) <= 1.1 * lower_bound
+
+
+def test_move_time_profile():
+    speed = AXIDRAW_MAX_SPEED * 10 / 100
+    acceleration = AXIDRAW_MAX_ACCELERATION * AXIDRAW_DEFAULT_ACCEL / 100
+    assert move_time(0) == 0.0
+    # Triangular and trapezoidal profiles meet where the robot just reaches full speed
+    switch_length = speed ** 2 / acceleration
+    assert move_time(switch_length * (1 - 1e-9)) == pytest.approx(move_time(switch_length))
+    lengths = np.linspace(0.1, 500, 200)
+    times = [move_time(length) for length in lengths]
+    assert all(b > a for a, b in zip(times, times[1:]))
+    assert move_time(1000) == pytest.approx(1000 / speed + speed / acceleration)
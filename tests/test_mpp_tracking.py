@@ -0,0 +1,75 @@
+'''
+Tests of MPP tracking against the simulated cell.
+
+Authors: Jason Whitney, Amr Mohamed, Prachya Chowdhury
+'''
+
+import itertools
+import numpy as np
+import pytest
+from mpp_tracking import MppTracker
+from measurement_system import MeasurementSystem
+from simulated_instrument import SimulatedSMU
+from iv_analysis import analyse_curves
+
+addresses = itertools.count()
+
+
+def seeded_tracker(smu, **options):
+    tracker = MppTracker(**options)
+    voltage = np.linspace(0, 0.7, 200)
+    figures = {name: float(values[0]) for name, values in analyse_curves(voltage, smu.diode_current(voltage)).items()}
+    tracker.seed(1, figures)
+    return tracker, figures
+
+
+def test_levels_start_at_zero_and_surround_the_mpp():
+    tracker, figures = seeded_tracker(SimulatedSMU(), step=0.01, points=5)
+    levels = tracker.levels(1)
+    assert levels[0] == 0.0
+    np.testing.assert_allclose(levels[1:] - figures['mpp_voltage'], [-0.02, -0.01, 0.0, 0.01, 0.02])
+    assert tracker.levels(2) is None
+
+
+def test_update_with_source_readback_offset():
+    # With source readback on, 0 V comes back as a few µV
+    smu = SimulatedSMU()
+    tracker, figures = seeded_tracker(smu)
+    for sign in (1, -1):
+        voltage = tracker.levels(1) + 2e-6
+        tracked = tracker.update(1, voltage, sign * smu.diode_current(voltage), 0.1)
+        assert tracked is not None
+        assert tracked['isc'] == pytest.approx(figures['isc'], rel=1e-3)
+        assert tracked['max_power'] == pytest.approx(figures['max_power'], rel=1e-3)
+
+
+def test_slow_decline_falls_back_to_a_full_sweep():
+    smu = SimulatedSMU()
+    tracker, figures = seeded_tracker(smu, drift_threshold=0.05)
+    results = []
+    for decline in range(1, 6):
+        voltage = tracker.levels(1)
+        results.append(tracker.update(1, voltage, smu.diode_current(voltage) * (1 - 0.02 * decline), 0.1))
+    # Each step is 2% below the last, the third is 6% below the full sweep
+    assert results[0] is not None and results[1] is not None
+    assert results[2] is None
+
+
+def test_mpp_outside_the_window_falls_back():
+    smu = SimulatedSMU()
+    tracker, figures = seeded_tracker(smu)
+    tracker.pixels[1]['mpp_voltage'] -= 0.1
+    voltage = tracker.levels(1)
+    assert tracker.update(1, voltage, smu.diode_current(voltage), 0.1) is None
+
+
+def test_tracking_measures_a_few_points_after_the_first_sweep(tmp_path):
+    smu = SimulatedSMU()
+    system = MeasurementSystem(f'SIMULATED::tracking{next(addresses)}', ser_port=None,
+                               open_resource=lambda address: smu, background_save=False)
+    system.tracking = True
+    system.plots = False
+    first = system.perform_measurement(str(tmp_path), 0.1, 1, 0.0, 0.7, 100)
+    second = system.perform_measurement(str(tmp_path), 0.1, 1, 0.0, 0.7, 100)
+    assert 'tracked' not in first and second['tracked']
+    assert second['max_power'] == pytest.approx(first['max_power'], rel=1e-3)
@@ -0,0 +1,94 @@
+'''
+Tests of the pixel layouts and of GridIndex against brute-force search.
+
+Authors: Jason Whitney, Amr Mohamed, Prachya Chowdhury
+'''
+
+import time
+import numpy as np
+import pytest
+from pixel_layout import GridIndex, PixelLayout, grid_pixels, PIXEL_POSITIONS
+
+
+def brute_force_distance(positions, x, y):
+    return min(np.hypot(px - x, py - y) for px, py in positions.values())
+
+
+def random_layout(count, seed=0):
+    rng = np.random.default_rng(seed)
+    return {pixel: tuple(position) for pixel, position in enumerate(rng.uniform(0, 100, (count, 2)), 1)}
+
+
+@pytest.mark.parametrize('positions', [
+    grid_pixels(20, 30, 2.5),
+    grid_pixels(1, 100, 2.5),
+    grid_pixels(100, 1, 2.5),
+    random_layout(500),
+    PIXEL_POSITIONS,
+], ids=['grid', 'row', 'column', 'random', 'substrate'])
+def test_nearest_matches_brute_force(positions):
+    index = GridIndex(positions)
+    rng = np.random.default_rng(1)
+    for x, y in rng.uniform(-50, 300, (200, 2)):
+        nearest = index.nearest(x, y)
+        distance = np.hypot(positions[nearest][0] - x, positions[nearest][1] - y)
+        assert distance == pytest.approx(brute_force_distance(positions, x, y))
+
+
+def test_nearest_respects_max_distance():
+    index = GridIndex(grid_pixels(3, 3, 10.0))
+    assert index.nearest(1.0, 1.0, max_distance=2.0) == 1
+    assert index.nearest(5.0, 5.0, max_distance=2.0) is None
+    assert GridIndex({}).nearest(0.0, 0.0) is None
+
+
+def test_single_row_is_fast_far_from_the_row():
+    # A collinear layout used to get microscopic buckets, so a far click searched millions of rings
+    index = GridIndex(grid_pixels(1, 100, 2.5))
+    start = time.perf_counter()
+    assert index.nearest(10.0, 10.0) == 5
+    assert time.perf_counter() - start < 0.05
+    assert len(index.buckets) <= 100
+
+
+def test_region_queries_match_brute_force():
+    positions = random_layout(800, seed=2)
+    index = GridIndex(positions)
+    inside = [pixel for pixel, (x, y) in positions.items() if 20 <= x <= 45 and 30 <= y <= 70]
+    assert index.in_region(20, 30, 45, 70) == inside
+    near = {pixel for pixel, (x, y) in positions.items() if np.hypot(x - 50, y - 50) <= 12}
+    assert set(index.within(50, 50, 12)) == near
+
+
+def test_grid_numbering():
+    rows = grid_pixels(2, 3, 1.0)
+    assert [rows[pixel] for pixel in (1, 2, 3, 4)] == [(0.0, 0.0), (1.0, 0.0), (2.0, 0.0), (0.0, 1.0)]
+    serpentine = grid_pixels(2, 3, 1.0, serpentine=True)
+    assert [serpentine[pixel] for pixel in (3, 4, 6)] == [(2.0, 0.0), (2.0, 1.0), (0.0, 1.0)]
+    columns = grid_pixels(2, 3, (1.0, 2.0), origin=(5.0, 5.0), order='columns', first=10)
+    assert columns[10] == (5.0, 5.0) and columns[11] == (5.0, 7.0) and columns[12] == (6.0, 5.0)
+
+
+def test_layout_from_spec():
+    layout = PixelLayout.from_spec({
+        'substrates': [
+            {'rows': 2, 'columns': 2, 'pitch': 5.0, 'commands': ['r', 'g', 'b', 'f']},
+            {'rows': 1, 'columns': 2, 'pitch': 5.0, 'origin': [20.0, 0.0]},
+        ],
+        'pixels': {'100': [50.0, 50.0]},
+        'offsets': {'2': [0.5, 0.0]},
+        'home': [1.0, 1.0],
+    })
+    assert len(layout) == 7
+    assert layout.positions[2] == (5.5, 0.0)
+    assert layout.positions[5] == (20.0, 0.0)
+    assert layout.command(3) == 'b'
+    assert layout.command(5) == layout.default_command
+    assert layout.home == (1.0, 1.0)
+    assert layout.nearest(49.0, 49.0) == 100
+
+
+def test_overlapping_substrates_are_rejected():
+    with pytest.raises(ValueError):
+        PixelLayout.from_spec({'substrates': [{'rows': 1, 'columns': 2, 'pitch': 1.0},
+                                              {'rows': 1, 'columns': 2, 'pitch': 1.0, 'first': 2}]})
@@ -0,0 +1,92 @@
+'''
+Tests of the run journal and of resuming a full-auto run on simulated hardware.
+
+Authors: Jason Whitney, Amr Mohamed, Prachya Chowdhury
+'''
+
+import itertools
+import os
+import pytest
+from run_journal import RunJournal
+from run_jobs import JobRunner, job_settings
+from run_store import RunStore
+from pixel_layout import PIXEL_POSITIONS
+
+addresses = itertools.count()
+
+
+def step(identifier, baseline=False):
+    return {'identifier': identifier, 'baseline': baseline, 'position': (1.0, 2.0)}
+
+
+def test_journal_replays_a_partial_run(tmp_path):
+    journal = RunJournal(str(tmp_path))
+    journal.start({'pixels': [1, 2, 3]})
+    journal.move((1.0, 2.0))
+    journal.step_done(step('baseline_before_pixel_1', baseline=True), {'isc': 0.02})
+    journal.step_done(step(1), {'isc': 0.019})
+    journal.step_done(step(2), {'isc': 0.018})
+    journal.move((5.0, 6.0))
+    journal.interrupted('SMU timeout')
+
+    replayed = RunJournal(str(tmp_path))
+    assert replayed.settings == {'pixels': [1, 2, 3]}
+    assert replayed.completed_pixels() == {1, 2}
+    entry, pixels_after = replayed.last_baseline()
+    assert entry['identifier'] == 'baseline_before_pixel_1' and pixels_after == 2
+    assert replayed.robot_position() == (5.0, 6.0)
+    assert not replayed.is_finished()
+
+
+def test_journal_ignores_a_line_cut_short(tmp_path):
+    journal = RunJournal(str(tmp_path))
+    journal.start({'pixels': [1]})
+    journal.step_done(step(1), {'isc': 0.02})
+    with open(journal.filename, 'a') as f:
+        f.write('{"event": "step", "identif')
+    assert RunJournal(str(tmp_path)).completed_pixels() == {1}
+
+
+def test_journal_without_start_cannot_be_resumed(tmp_path):
+    with pytest.raises(ValueError):
+        RunJournal(str(tmp_path)).settings
+
+
+def test_resume_measures_only_the_missing_pixels(tmp_path):
+    runner = JobRunner({'robot': True, 'smu': {'address': f'SIMULATED::journal{next(addresses)}'}}, simulate=True,
+                       time_scale=0.001)
+    measurement_system = runner.measurement_system
+    acquire_sweep = measurement_system.acquire_sweep
+    sweeps = itertools.count(1)
+
+    def failing_acquire_sweep(*args):
+        if next(sweeps) == 6:
+            raise RuntimeError("SMU stopped answering")
+        return acquire_sweep(*args)
+
+    settings = job_settings({'output': str(tmp_path), 'plots': False, 'baseline': {'every_n_pixels': 0},
+                             'sweep': {'start': 0.0, 'stop': 0.7, 'steps': 10}}, {})
+    try:
+        measurement_system.acquire_sweep = failing_acquire_sweep
+        with pytest.raises(RuntimeError):
+            runner.run(settings)
+        measurement_system.acquire_sweep = acquire_sweep
+        run_directory = os.path.join(str(tmp_path), os.listdir(str(tmp_path))[0])
+        journal = RunJournal(run_directory)
+        measured = journal.completed_pixels()
+        assert 0 < len(measured) < len(PIXEL_POSITIONS)
+        assert journal.events('interrupted')
+
+        runner.run(job_settings({'resume': run_directory}, {}))
+    finally:
+        runner.close()
+
+    journal = RunJournal(run_directory)
+    assert journal.is_finished()
+    assert journal.completed_pixels() == set(PIXEL_POSITIONS)
+    pixels = [int(record['pixel']) for record in RunStore.open(run_directory).records() if record['pixel']]
+    assert sorted(pixels) == sorted(PIXEL_POSITIONS)  # Every pixel stored exactly once
+    # The resume ran with the journaled settings and kept the run's cached baseline
+    baselines = [record for record in RunStore.open(run_directory).records() if record['baseline'] == '1']
+    assert len(baselines) == 1
+
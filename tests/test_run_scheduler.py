@@ -0,0 +1,69 @@
+'''
+Tests of the pipelined full-auto scheduler.
+
+Authors: Jason Whitney, Amr Mohamed, Prachya Chowdhury
+'''
+
+import threading
+from run_scheduler import RunScheduler
+
+
+class CountingLock:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.acquisitions = 0
+
+    def __enter__(self):
+        self.lock.acquire()
+        self.acquisitions += 1
+
+    def __exit__(self, *exc_info):
+        self.lock.release()
+
+    def locked(self):
+        return self.lock.locked()
+
+
+def run_steps(pipelined):
+    interlock = CountingLock()
+    events = []
+
+    def move(step):
+        assert interlock.locked()
+        events.append(('move', step))
+
+    def acquire(step):
+        assert interlock.locked()
+        events.append(('sweep', step))
+        return step * 10
+
+    def process(step, raw):
+        return raw + 1
+
+    scheduler = RunScheduler(move, acquire, process, interlock=interlock, pipelined=pipelined)
+    results = scheduler.run(range(5))
+    return scheduler, interlock, events, results
+
+
+def test_move_and_sweep_share_one_interlock_hold():
+    for pipelined in (True, False):
+        scheduler, interlock, events, results = run_steps(pipelined)
+        assert interlock.acquisitions == 5
+        assert events == [(stage, step) for step in range(5) for stage in ('move', 'sweep')]
+        assert results == [(step, step * 10 + 1) for step in range(5)]
+        assert scheduler.stats['processing']['count'] == 5
+
+
+def test_processing_errors_do_not_stop_the_run():
+    def process(step, raw):
+        if step == 2:
+            raise ValueError("bad curve")
+        return raw
+
+    failed = []
+    scheduler = RunScheduler(lambda step: None, lambda step: step, process,
+                             on_error=lambda step, error: failed.append(step))
+    results = scheduler.run(range(4))
+    assert [step for step, result in results] == [0, 1, 3]
+    assert failed == [2]
+    assert len(scheduler.errors) == 1
@@ -0,0 +1,64 @@
+'''
+Tests of the append-only run store.
+
+Authors: Jason Whitney, Amr Mohamed, Prachya Chowdhury
+'''
+
+import os
+import numpy as np
+import pytest
+from run_store import RunStore
+
+
+def test_sweeps_round_trip(tmp_path):
+    store = RunStore(str(tmp_path))
+    curves = [(np.linspace(0, 0.7, points), np.random.default_rng(points).normal(size=points))
+              for points in (5, 56, 1000)]
+    for pixel, (voltage, current) in enumerate(curves, 1):
+        assert store.append(pixel, voltage, current, {'max_power': 0.01 * pixel, 'isc': 0.02}) == pixel - 1
+    records = store.records()
+    assert [int(record['pixel']) for record in records] == [1, 2, 3]
+    for record, (voltage, current) in zip(records, curves):
+        loaded_voltage, loaded_current = store.load_sweep(record)
+        np.testing.assert_array_equal(loaded_voltage, voltage)
+        np.testing.assert_array_equal(loaded_current, current)
+    assert float(records[2]['max_power']) == pytest.approx(0.03)
+    assert records[0]['voc'] == ''
+
+
+def test_figures_only_and_baselines(tmp_path):
+    store = RunStore(str(tmp_path))
+    store.append(None, None, None, {'max_power': 0.01}, label='baseline_before_pixel_1', baseline=True)
+    store.append(1, None, None, {'max_power': 0.009, 'baseline_label': 'baseline_before_pixel_1',
+                                 'normalized_power': 0.9})
+    baseline, pixel = store.records()
+    assert baseline['baseline'] == '1' and baseline['pixel'] == '' and baseline['points'] == '0'
+    assert pixel['baseline_label'] == 'baseline_before_pixel_1'
+    assert len(store.load_sweep(0)[0]) == 0
+
+
+def test_reopened_store_continues_the_run(tmp_path):
+    store = RunStore(str(tmp_path))
+    store.append(1, np.arange(3.0), np.arange(3.0), {})
+    reopened = RunStore.open(store.directory)
+    assert reopened.run_id == store.run_id
+    reopened.append(2, np.arange(4.0), -np.arange(4.0), {})
+    records = reopened.records()
+    assert [record['record'] for record in records] == ['0', '1']
+    np.testing.assert_array_equal(reopened.load_sweep(records[1])[1], -np.arange(4.0))
+
+
+def test_runs_started_together_get_separate_directories(tmp_path):
+    stores = [RunStore(str(tmp_path)) for _ in range(3)]
+    assert len({store.directory for store in stores}) == 3
+    assert all(os.path.isdir(store.directory) for store in stores)
+
+
+def test_text_export(tmp_path):
+    store = RunStore(str(tmp_path))
+    store.append(4, None, None, {'max_power': 0.0092, 'isc': 0.02, 'voc': 0.6, 'efficiency': 9.2}, label=4)
+    store.export_text()
+    with open(os.path.join(store.directory, 'Calculated_Values_4.txt')) as f:
+        text = f.read()
+    assert 'Maximum Power (Pmax): 0.0092 W' in text
+    assert 'Efficiency: 9.20%' in text
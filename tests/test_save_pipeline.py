@@ -0,0 +1,59 @@
+'''
+Tests of the bounded background writer.
+
+Authors: Jason Whitney, Amr Mohamed, Prachya Chowdhury
+'''
+
+import threading
+import pytest
+from save_pipeline import BackgroundWriter
+
+
+def test_flush_waits_for_every_job():
+    writer = BackgroundWriter(max_pending=2, workers=2)
+    written = []
+    for index in range(10):
+        writer.submit(written.append, index)
+    assert writer.flush() == []
+    assert sorted(written) == list(range(10))
+    assert writer.completed == 10
+    writer.close()
+
+
+def test_errors_are_collected_and_reported_once():
+    reported = []
+    writer = BackgroundWriter(on_error=lambda description, error: reported.append(description))
+
+    def fail():
+        raise OSError("disk full")
+
+    writer.submit(fail, description='plot 1')
+    writer.submit(lambda: None)
+    errors = writer.flush()
+    assert [(description, str(error)) for description, error in errors] == [('plot 1', 'disk full')]
+    assert reported == ['plot 1']
+    assert writer.flush() == []
+    assert writer.close() == []
+
+
+def test_submit_blocks_while_max_pending_jobs_wait():
+    release = threading.Event()
+    writer = BackgroundWriter(max_pending=1)
+    writer.submit(release.wait)   # Taken by the worker
+    writer.submit(lambda: None)   # Fills the queue
+    blocked = threading.Thread(target=writer.submit, args=(lambda: None,), daemon=True)
+    blocked.start()
+    blocked.join(0.2)
+    assert blocked.is_alive()
+    release.set()
+    blocked.join(5)
+    assert not blocked.is_alive()
+    writer.close()
+    assert writer.completed == 3
+
+
+def test_closed_writer_refuses_jobs():
+    writer = BackgroundWriter()
+    writer.close()
+    with pytest.raises(RuntimeError):
+        writer.submit(lambda: None)
@@ -0,0 +1,133 @@
+'''
+Tests of the framed pixel-switch protocol against FakeArduino.
+
+Authors: Jason Whitney, Amr Mohamed, Prachya Chowdhury
+'''
+
+import io
+import time
+import types
+import pytest
+import serial
+import switch_protocol
+from simulated_hardware import FakeArduino
+from switch_protocol import (PixelSwitch, LegacyPixelSwitch, SwitchError, PROTOCOL_BAUD, SELECT, ACK, crc8,
+                             encode_frame, read_frame, open_pixel_switch)
+
+
+class FakePort(io.BytesIO):
+    # Just enough of serial.Serial for read_frame
+    timeout = None
+
+
+@pytest.fixture
+def arduino():
+    arduino = FakeArduino(switch_time=0.001)
+    yield arduino
+    arduino.close()
+
+
+@pytest.fixture
+def switch(arduino):
+    switch = PixelSwitch(serial.Serial(arduino.port, PROTOCOL_BAUD), timeout=0.2, retries=2)
+    yield switch
+    switch.close()
+
+
+def test_crc8_known_vectors():
+    # CRC-8 with polynomial 0x07, initial value 0 and no reflection (CRC-8/SMBUS)
+    assert crc8(b'') == 0x00
+    assert crc8(b'123456789') == 0xF4
+    assert crc8(b'\x01') == 0x07
+
+
+def test_frame_round_trip():
+    frame = encode_frame(42, SELECT, b'rg')
+    assert frame[0] == 0x7E and frame[2] == SELECT and frame[3] == 2
+    assert read_frame(FakePort(frame), 0.1) == (42, SELECT, b'rg')
+
+
+def test_read_frame_skips_noise_and_bad_crc():
+    garbled = bytearray(encode_frame(1, ACK))
+    garbled[-1] ^= 0xFF
+    port = FakePort(b'\x00\x55' + bytes(garbled) + encode_frame(2, ACK))
+    assert read_frame(port, 0.1) == (2, ACK, b'')
+
+
+def test_read_frame_times_out():
+    assert read_frame(FakePort(encode_frame(1, ACK)[:3]), 0.05) is None
+
+
+def test_encode_frame_rejects_long_payload():
+    with pytest.raises(ValueError):
+        encode_frame(1, SELECT, bytes(256))
+
+
+def test_select_and_off(arduino, switch):
+    switch.ping()
+    switch.select('r', 'g')
+    assert arduino.selected == {'r', 'g'}
+    switch.select('b')
+    assert arduino.selected == {'b'}
+    switch.off()
+    assert arduino.selected == set()
+    assert switch.retry_count == 0
+
+
+def test_lost_answer_is_retried_without_switching_twice(arduino, switch):
+    arduino.drop_answers = 1
+    switch.select('r')
+    assert switch.retry_count == 1
+    assert arduino.switch_count == 1
+    assert arduino.selected == {'r'}
+
+
+def test_corrupt_answer_is_retried(arduino, switch):
+    arduino.corrupt_answers = 2
+    switch.select('k')
+    assert switch.retry_count == 2
+    assert arduino.selected == {'k'}
+
+
+def test_no_answer_raises(arduino, switch):
+    arduino.drop_answers = 3  # Every attempt of the request
+    with pytest.raises(SwitchError):
+        switch.select('r')
+
+
+def test_open_pixel_switch_uses_framed_protocol(arduino):
+    switch = open_pixel_switch(arduino.port, timeout=0.2, reset_time=0)
+    try:
+        assert isinstance(switch, PixelSwitch)
+        switch.select('y')
+        assert arduino.selected == {'y'}
+    finally:
+        switch.close()
+
+
+def test_open_pixel_switch_falls_back_to_legacy_firmware():
+    arduino = FakeArduino(legacy=True)
+    try:
+        switch = open_pixel_switch(arduino.port, timeout=0.05, retries=0, reset_time=0)
+        assert isinstance(switch, LegacyPixelSwitch)
+        switch.settle_time = 0.05
+        switch.select('r')
+        assert arduino.selected == {'r'}
+        switch.select('g')
+        assert arduino.selected == {'g'}
+        switch.close()
+    finally:
+        arduino.close()
+
+
+def test_legacy_fallback_waits_for_the_reset(monkeypatch):
+    # Reopening the port at the legacy baud rate resets the Arduino again
+    sleeps = []
+    monkeypatch.setattr(switch_protocol, 'time', types.SimpleNamespace(
+        sleep=sleeps.append, monotonic=time.monotonic, perf_counter=time.perf_counter))
+    arduino = FakeArduino(legacy=True)
+    try:
+        open_pixel_switch(arduino.port, timeout=0.05, retries=0, reset_time=1.5).close()
+    finally:
+        arduino.close()
+    assert sleeps == [1.5, 1.5]
@@ -0,0 +1,64 @@
+'''
+Tests of the timing instrumentation.
+
+Authors: Jason Whitney, Amr Mohamed, Prachya Chowdhury
+'''
+
+import json
+import time
+import pytest
+from tracing import Tracer, HISTOGRAM_EDGES_MS
+
+
+def test_summary_statistics_and_histogram():
+    tracer = Tracer()
+    start = time.monotonic()
+    for duration in (0.0005, 0.002, 0.002, 0.05, 20.0):
+        tracer.add('sweep', 'smu', start, duration)
+    stats = tracer.summary()['spans']['sweep']
+    assert stats['count'] == 5
+    assert stats['total_s'] == pytest.approx(20.0545)
+    assert stats['p50_ms'] == pytest.approx(2.0)
+    assert stats['max_ms'] == pytest.approx(20000.0)
+    # <=1 ms, <=3 ms twice, <=100 ms, and the overflow bucket
+    assert stats['histogram'] == [1, 2, 0, 0, 1, 0, 0, 0, 0, 1]
+    assert len(stats['histogram']) == len(HISTOGRAM_EDGES_MS) + 1
+
+
+def test_per_pixel_shares_baselines_over_the_pixels():
+    tracer = Tracer()
+    start = time.monotonic()
+    tracer.add('move', 'robot', start, 1.0, {'step': 'baseline_0', 'baseline': True})
+    for step in (1, 2):
+        tracer.add('move', 'robot', start, 1.0, {'step': step})
+        tracer.add('sweep', 'smu', start, 0.5, {'step': step})
+    tracer.add('transfer', 'smu', start, 9.0)  # No step, not a stage
+    per_pixel, pixels = tracer.per_pixel()
+    assert pixels == 2
+    assert per_pixel == {'move': pytest.approx(1.5), 'sweep': pytest.approx(0.5)}
+
+
+def test_disabled_tracer_records_nothing():
+    tracer = Tracer(enabled=False)
+    with tracer.span('sweep'):
+        pass
+    assert tracer.snapshot() == []
+    assert tracer.summary()['spans'] == {}
+
+
+def test_traces_written_for_a_run(tmp_path):
+    tracer = Tracer(max_spans=3)
+
+    @tracer.traced('save', 'processing')
+    def save():
+        pass
+
+    for _ in range(5):
+        save()
+    assert len(tracer.snapshot()) == 3  # Only the latest max_spans are kept
+    tracer.write_run_trace(str(tmp_path))
+    lines = (tmp_path / 'trace.jsonl').read_text().splitlines()
+    assert [json.loads(line)['name'] for line in lines] == ['save'] * 3
+    events = json.loads((tmp_path / 'trace.json').read_text())['traceEvents']
+    assert {event['ph'] for event in events} == {'X', 'M'}
+    assert json.loads((tmp_path / 'trace_summary.json').read_text())['spans']['save']['count'] == 3
@@ -0,0 +1,36 @@
+'''
+Tests of the TSP backend against the simulated SMU.
+
+Authors: Jason Whitney, Amr Mohamed, Prachya Chowdhury
+'''
+
+import itertools
+import pytest
+from measurement_system import MeasurementSystem
+from tsp_measurement_system import TspMeasurementSystem
+from simulated_instrument import SimulatedSMU
+
+addresses = itertools.count()
+
+
+def summary(system_class, polarity):
+    smu = SimulatedSMU()
+    diode_current = smu.diode_current
+    smu.diode_current = lambda voltage: polarity * diode_current(voltage)
+    system = system_class(f'SIMULATED::{next(addresses)}', ser_port=None, open_resource=lambda address: smu,
+                          background_save=False)
+    with system.smu:
+        system.configure_sweep(0.0, 0.7, 50)
+        return system.fetch_summary(0.1)
+
+
+@pytest.mark.parametrize('polarity', [1, -1])
+def test_summary_isc_is_positive_on_both_backends(polarity):
+    scpi = summary(MeasurementSystem, polarity)
+    tsp = summary(TspMeasurementSystem, polarity)
+    for mpp_voltage, max_power, isc, voc, efficiency in (scpi, tsp):
+        assert isc == pytest.approx(0.02, rel=1e-3)
+        assert max_power > 0
+    assert tsp[1] == pytest.approx(scpi[1], rel=1e-2)
+    assert tsp[3] == pytest.approx(scpi[3], abs=0.01)
+
@@ -0,0 +1,167 @@
+'''
+This file contains the timing instrumentation of the measurement programs.
+
+Code on the hot path wraps its work in a span:
+    with TRACER.span('transfer', 'smu', points=len(voltage)):
+        ...
+A span records its monotonic start and duration, the thread it ran on and its arguments. Spans are
+cheap (a few microseconds) and kept in memory, up to MAX_SPANS of them, until they are written out:
+    write_jsonl(filename)          one JSON object per span
+    write_chrome_trace(filename)   trace-event format, open it in chrome://tracing or Perfetto to see
+                                   robot, switch, SMU and processing threads on one timeline
+    summary() / print_summary()    count, total, mean, p50, p95 and max per span name, a histogram
+                                   of the durations, and the seconds per pixel spent in each stage
+
+Spans that carry a step argument (the stages of a full-auto run, the sweeps of an SMU pool) are
+added up per stage and divided by the number of pixels, baselines included, so the summary shows
+where each pixel's seconds go.
+
+Authors: Jason Whitney, Amr Mohamed, Prachya Chowdhury
+'''
+
+import collections
+import contextlib
+import functools
+import json
+import os
+import threading
+import time
+import numpy as np
+
+MAX_SPANS = 1_000_000
+# Upper edges of the duration histogram buckets in ms, the last bucket takes everything longer
+HISTOGRAM_EDGES_MS = [1, 3, 10, 30, 100, 300, 1000, 3000, 10000]
+
+
+class Tracer:
+    def __init__(self, enabled=True, max_spans=MAX_SPANS):
+        self.enabled = enabled
+        self.lock = threading.Lock()
+        self.spans = collections.deque(maxlen=max_spans)
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.spans.clear()
+            # Monotonic and wall clock at the same moment, to date the monotonic timestamps
+            self.origin = time.monotonic()
+            self.wall_origin = time.time()
+
+    @contextlib.contextmanager
+    def span(self, name, category='', **args):
+        if not self.enabled:
+            yield
+            return
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.add(name, category, start, time.monotonic() - start, args)
+
+    def add(self, name, category, start, duration, args=None):
+        # For timings measured elsewhere, start is a time.monotonic() value
+        thread = threading.current_thread()
+        with self.lock:
+            self.spans.append({'name': name, 'category': category, 'start': start - self.origin,
+                               'duration': duration, 'thread': thread.name, 'tid': thread.ident,
+                               'args': args or {}})
+
+    def traced(self, name, category=''):
+        # Decorator form of span()
+        def decorate(function):
+            @functools.wraps(function)
+            def wrapper(*args, **kwargs):
+                with self.span(name, category):
+                    return function(*args, **kwargs)
+            return wrapper
+        return decorate
+
+    def snapshot(self):
+        with self.lock:
+            return list(self.spans)
+
+    def durations(self):
+        durations = collections.defaultdict(list)
+        for span in self.snapshot():
+            durations[span['name']].append(span['duration'])
+        return {name: np.array(values) for name, values in durations.items()}
+
+    def histogram(self, durations):
+        # Counts per HISTOGRAM_EDGES_MS bucket plus one for longer spans
+        return np.bincount(np.searchsorted(HISTOGRAM_EDGES_MS, np.asarray(durations) * 1e3),
+                           minlength=len(HISTOGRAM_EDGES_MS) + 1).tolist()
+
+    def per_pixel(self):
+        # ({stage: seconds per pixel}, pixel count) over the spans with a step argument; the time of
+        # baseline steps is shared out over the pixels
+        totals = collections.defaultdict(float)
+        pixels = set()
+        for span in self.snapshot():
+            if 'step' in span['args']:
+                totals[span['name']] += span['duration']
+                if not span['args'].get('baseline'):
+                    pixels.add(span['args']['step'])
+        if not pixels:
+            return {}, 0
+        return {name: total / len(pixels) for name, total in totals.items()}, len(pixels)
+
+    def summary(self):
+        spans = {}
+        for name, durations in self.durations().items():
+            spans[name] = {
+                'count': len(durations),
+                'total_s': float(durations.sum()),
+                'mean_ms': float(durations.mean() * 1e3),
+                'p50_ms': float(np.percentile(durations, 50) * 1e3),
+                'p95_ms': float(np.percentile(durations, 95) * 1e3),
+                'max_ms': float(durations.max() * 1e3),
+                'histogram': self.histogram(durations),
+            }
+        per_pixel, pixel_count = self.per_pixel()
+        return {'spans': spans, 'per_pixel_s': per_pixel, 'pixels': pixel_count,
+                'histogram_edges_ms': HISTOGRAM_EDGES_MS}
+
+    def print_summary(self, title='Timing'):
+        summary = self.summary()
+        if not summary['spans']:
+            return
+        print(f"\n{title}")
+        print(f"  {'span':<16}{'count':>7}{'total (s)':>11}{'mean (ms)':>11}{'p50 (ms)':>10}{'p95 (ms)':>10}"
+              f"{'max (ms)':>10}")
+        for name, stats in sorted(summary['spans'].items(), key=lambda item: -item[1]['total_s']):
+            print(f"  {name:<16}{stats['count']:>7}{stats['total_s']:>11.2f}{stats['mean_ms']:>11.1f}"
+                  f"{stats['p50_ms']:>10.1f}{stats['p95_ms']:>10.1f}{stats['max_ms']:>10.1f}")
+        if summary['pixels']:
+            stages = ', '.join(f"{name} {seconds:.2f} s" for name, seconds in summary['per_pixel_s'].items())
+            print(f"  per pixel ({summary['pixels']} pixels): {stages}")
+
+    def write_jsonl(self, filename):
+        with open(filename, 'w') as f:
+            for span in self.snapshot():
+                f.write(json.dumps(dict(span, start=self.wall_origin + span['start']), default=str) + '\n')
+        return filename
+
+    def write_chrome_trace(self, filename):
+        pid = os.getpid()
+        events, threads = [], {}
+        for span in self.snapshot():
+            threads[span['tid']] = span['thread']
+            events.append({'name': span['name'], 'cat': span['category'], 'ph': 'X', 'pid': pid,
+                           'tid': span['tid'], 'ts': span['start'] * 1e6, 'dur': span['duration'] * 1e6,
+                           'args': span['args']})
+        events += [{'name': 'thread_name', 'ph': 'M', 'pid': pid, 'tid': tid, 'args': {'name': name}}
+                   for tid, name in threads.items()]
+        with open(filename, 'w') as f:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f, default=str)
+        return filename
+
+    def write_run_trace(self, directory):
+        # trace.jsonl, trace.json (Chrome) and trace_summary.json in directory
+        self.write_jsonl(os.path.join(directory, 'trace.jsonl'))
+        self.write_chrome_trace(os.path.join(directory, 'trace.json'))
+        with open(os.path.join(directory, 'trace_summary.json'), 'w') as f:
+            json.dump(self.summary(), f, indent=2, default=str)
+
+
+# Shared by every module of the process
+TRACER = Tracer()
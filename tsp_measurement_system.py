@@ -0,0 +1,225 @@
+'''
+This file contains the TSP backend of MeasurementSystem, for a Keithley 2450 running the TSP command set.
+
+The sweep and analysis routine is uploaded to the instrument once as a named script that defines
+the SolarCellSweep() function. Each measurement then only sends the function call with the sweep
+parameters. The script carries a hash of its source, so it is uploaded again only when it changes.
+
+For screening, fetch_summary() reads back only the figures of merit computed on the instrument
+as one compact record instead of the whole curve.
+
+Authors: Jason Whitney, Amr Mohamed, Prachya Chowdhury
+'''
+
+import hashlib
+from measurement_system import MeasurementSystem
+
+SWEEP_SCRIPT_NAME = 'SolarCellScript'
+SWEEP_FUNCTION_NAME = 'SolarCellSweep'
+SETUP_FUNCTION_NAME = 'SolarCellSetup'
+SUMMARY_FUNCTION_NAME = 'SolarCellSummary'
+LIST_SWEEP_FUNCTION_NAME = 'SolarCellListSweep'
+LIST_LEVELS_NAME = 'SolarCellLevels'
+
+SWEEP_FUNCTION_SOURCE = '''
+function SolarCellConfigure()
+    -- Set the source and measure functions.
+    smu.measure.func = smu.FUNC_DC_CURRENT
+    smu.source.func = smu.FUNC_DC_VOLTAGE
+
+    -- Measurement settings.
+    smu.terminals = smu.TERMINALS_FRONT
+    smu.measure.sense = smu.SENSE_4WIRE
+    smu.measure.autorange = smu.ON
+    smu.measure.nplc = 1
+
+    -- Source settings.
+    smu.source.highc = smu.OFF
+    smu.source.range = 2
+    smu.source.readback = smu.ON
+    smu.source.ilimit.level = 1
+end
+
+function SolarCellSetup(vstart, vstop, num, delay)
+    SolarCellConfigure()
+    smu.source.sweeplinear("SolarCell", vstart, vstop, num, delay)
+end
+
+function SolarCellListSweep(delay)
+    -- Sources the levels in SolarCellLevels in order, for the dense pass of an adaptive sweep.
+    SolarCellConfigure()
+    pcall(smu.source.configlist.delete, "SolarCellList")
+    smu.source.configlist.create("SolarCellList")
+    for i = 1, table.getn(SolarCellLevels) do
+        smu.source.level = SolarCellLevels[i]
+        smu.source.configlist.store("SolarCellList")
+    end
+    smu.source.sweeplist("SolarCellList", 1, delay)
+    trigger.model.initiate()
+    waitcomplete()
+end
+
+function crosseszero(y0, y1)
+    return (y0 <= 0 and y1 >= 0) or (y0 >= 0 and y1 <= 0)
+end
+
+function interpolatezero(x0, x1, y0, y1)
+    -- x where the line through (x0, y0) and (x1, y1) crosses y = 0
+    if y1 == y0 then
+        return x0
+    end
+    return x0 - y0 * (x1 - x0) / (y1 - y0)
+end
+
+function SolarCellSweep(vstart, vstop, num, delay)
+    SolarCellSetup(vstart, vstop, num, delay)
+
+    -- Start the trigger model and wait for it to complete.
+    trigger.model.initiate()
+    waitcomplete()
+
+    local voltage = defbuffer1.sourcevalues
+    local current = defbuffer1
+
+    -- The sign of the photocurrent depends on the wiring, so search the power-generating quadrant.
+    -- It is taken at the sample nearest 0 V, like iv_analysis.py does, and Isc is reported positive.
+    local nearest = 1
+    for i = 2, defbuffer1.n do
+        if math.abs(voltage[i]) < math.abs(voltage[nearest]) then
+            nearest = i
+        end
+    end
+    local sign = 1
+    if current[nearest] < 0 then
+        sign = -1
+    end
+    -- Isc and Voc are interpolated at the first zero crossing of voltage and current, falling back
+    -- to the nearest sample when the sweep does not cross zero.
+    local isc = current[1]
+    local voc = voltage[1]
+    local iscfound = false
+    local vocfound = false
+    local mincurr = math.abs(current[1])
+    local pmax = sign * voltage[1] * current[1]
+    local imax = current[1]
+    local vmax = voltage[1]
+
+    for i = 1, defbuffer1.n do
+        local power = sign * voltage[i] * current[i]
+        if power > pmax then
+            pmax = power
+            imax = current[i]
+            vmax = voltage[i]
+        end
+        if i > 1 then
+            if not iscfound and crosseszero(voltage[i - 1], voltage[i]) then
+                isc = interpolatezero(current[i - 1], current[i], voltage[i - 1], voltage[i])
+                iscfound = true
+            end
+            if not vocfound and crosseszero(current[i - 1], current[i]) then
+                voc = interpolatezero(voltage[i - 1], voltage[i], current[i - 1], current[i])
+                vocfound = true
+            end
+        end
+        if not vocfound and math.abs(current[i]) < mincurr then
+            mincurr = math.abs(current[i])
+            voc = voltage[i]
+        end
+    end
+
+    isc = sign * isc
+    SolarCellResult = {pmax = pmax, imax = math.abs(imax), vmax = vmax, isc = isc, voc = voc}
+
+    -- Display values on the front panel.
+    display.changescreen(display.SCREEN_USER_SWIPE)
+    display.settext(display.TEXT1, string.format("Pmax = %.4fW", pmax))
+    display.settext(display.TEXT2, string.format("Isc = %.4fA, Voc = %.2fV", isc, voc))
+end
+
+function SolarCellSummary()
+    -- One record: Pmax, Vmax, Imax, Isc, Voc of the last sweep
+    local r = SolarCellResult
+    print(string.format("%.9e,%.9e,%.9e,%.9e,%.9e", r.pmax, r.vmax, r.imax, r.isc, r.voc))
+end
+'''
+
+# TSP equivalents of the FORM:DATA settings used by MeasurementSystem
+TSP_DATA_FORMATS = {
+    'ASC': 'format.ASCII',
+    'REAL': 'format.REAL64',
+    'SREAL': 'format.REAL32',
+}
+
+
+def script_hash(source):
+    return hashlib.sha1(source.encode()).hexdigest()[:16]
+
+
+class TspMeasurementSystem(MeasurementSystem):
+    def __init__(self, *args, **kwargs):
+        self.script_hash = script_hash(SWEEP_FUNCTION_SOURCE)
+        super().__init__(*args, **kwargs)
+
+    def configure_instrument(self, start_voltage, stop_voltage, steps, step_delay=0.1, full_reset=False,
+                             initiate=True):
+        self.sweep = (start_voltage, stop_voltage, steps, step_delay)
+        self.expected_points = steps
+        if full_reset or not self.config_cache.is_initialized():
+            self.reset_instrument()
+        self.load_sweep_script()
+        # The whole sweep is a single call; the function waits for the trigger model to complete
+        function_name = SWEEP_FUNCTION_NAME if initiate else SETUP_FUNCTION_NAME
+        self.smu.write(f'{function_name}({start_voltage}, {stop_voltage}, {steps}, {step_delay})')
+
+    def configure_list_sweep(self, levels, step_delay=0.1, initiate=True):
+        self.expected_points = len(levels)
+        if not self.config_cache.is_initialized():
+            self.reset_instrument()
+        self.load_sweep_script()
+        # The levels go over as a Lua table, the uploaded function builds the config list from it
+        self.smu.write(f"{LIST_LEVELS_NAME} = {{{', '.join(f'{level:.6g}' for level in levels)}}}")
+        if initiate:
+            self.smu.write(f'{LIST_SWEEP_FUNCTION_NAME}({step_delay})')
+
+    def start_sweep(self):
+        self.smu.write('trigger.model.initiate()')
+
+    def abort_sweep(self):
+        self.smu.write('trigger.model.abort()')
+
+    def sweep_running(self):
+        state = self.smu.query('print(trigger.model.state())').split()[0]
+        return state in ('trigger.STATE_RUNNING', 'trigger.STATE_WAITING', 'trigger.STATE_BUILDING')
+
+    def load_sweep_script(self, force=False):
+        # Upload only when the instrument does not already hold this version of the script
+        if not force and self.config_cache.remembered(SWEEP_SCRIPT_NAME) == self.script_hash:
+            return False
+        loaded_hash = self.smu.query(f'print({SWEEP_SCRIPT_NAME}Hash)').strip()
+        if force or loaded_hash != self.script_hash:
+            self.smu.write(f'loadscript {SWEEP_SCRIPT_NAME}')
+            self.smu.write(f'{SWEEP_SCRIPT_NAME}Hash = "{self.script_hash}"')
+            for line in SWEEP_FUNCTION_SOURCE.strip().splitlines():
+                self.smu.write(line)
+            self.smu.write('endscript')
+            self.smu.write(f'{SWEEP_SCRIPT_NAME}()')  # Running the script defines the function
+            print(f"Uploaded TSP script {SWEEP_SCRIPT_NAME} ({self.script_hash})")
+        self.config_cache.remember(SWEEP_SCRIPT_NAME, self.script_hash)
+        return True
+
+    def fetch_summary(self, input_power):
+        record = self.smu.query(f'{SUMMARY_FUNCTION_NAME}()')
+        max_power, mpp_voltage, mpp_current, isc, voc = [float(value) for value in record.strip().split(',')]
+        efficiency = (max_power / input_power) * 100 if input_power > 0 else 0
+        return mpp_voltage, max_power, isc, voc, efficiency
+
+    def set_data_format(self, data_format):
+        self.config_cache.write(self.smu, f'format.data = {TSP_DATA_FORMATS[data_format]}')
+        if data_format != 'ASC':
+            self.config_cache.write(self.smu, 'format.byteorder = format.LITTLEENDIAN')
+
+    def buffer_point_count(self):
+        return int(float(self.smu.query('print(defbuffer1.n)')))
+
+    def sweep_data_query(self, start_index, end_index):
+        return f'printbuffer({start_index}, {end_index}, defbuffer1.sourcevalues, defbuffer1.readings)'
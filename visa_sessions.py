@@ -0,0 +1,178 @@
+'''
+This file keeps one VISA session open per instrument address for the life of the process.
+
+Opening a ResourceManager and a USB-TMC resource costs hundreds of milliseconds, so the
+measurement code asks get_session() for a shared session instead of opening its own. A session
+serializes access from worker threads (use it as a context manager to hold it for a whole
+measurement) and transparently reopens the resource when the link drops.
+
+Authors: Jason Whitney, Amr Mohamed, Prachya Chowdhury
+'''
+
+import atexit
+import threading
+import time
+from instrument_config import config_cache_for
+
+# VISA errors that mean the session itself is gone and has to be reopened, as pyvisa StatusCode names.
+# pyvisa is only imported once a real resource is opened or fails, it is slow to import.
+LINK_ERRORS = {
+    'error_connection_lost',
+    'error_invalid_object',
+    'error_io',
+    'error_resource_not_found',
+}
+
+
+def is_link_error(error):
+    import pyvisa
+    return isinstance(error, pyvisa.errors.VisaIOError) and \
+        any(error.error_code == getattr(pyvisa.constants.StatusCode, name) for name in LINK_ERRORS)
+
+
+class VisaSession:
+    def __init__(self, address, resource_manager, open_resource=None):
+        self.address = address
+        self.resource_manager = resource_manager
+        # Allows a simulated instrument to be plugged in instead of a real resource
+        self.open_resource = open_resource or resource_manager.open_resource
+        self.lock = threading.RLock()
+        self.resource = None
+        self.resource_timeout = None
+        self.connect_times = []
+        self.reconnect_times = []
+
+    def __enter__(self):
+        self.lock.acquire()
+        try:
+            self.ensure_connected()
+        except Exception:
+            self.lock.release()
+            raise
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.lock.release()
+
+    def ensure_connected(self):
+        with self.lock:
+            if self.resource is None:
+                self.connect_times.append(self._open())
+
+    def reconnect(self):
+        with self.lock:
+            self._discard()
+            duration = self._open()
+            self.reconnect_times.append(duration)
+            # The instrument may have been power cycled, so nothing is known about its settings anymore
+            config_cache_for(self.address).invalidate()
+            print(f"Reconnected to {self.address} in {duration * 1e3:.1f} ms")
+
+    def _open(self):
+        start = time.perf_counter()
+        self.resource = self.open_resource(self.address)
+        if self.resource_timeout is not None:
+            self.resource.timeout = self.resource_timeout
+        return time.perf_counter() - start
+
+    def _discard(self):
+        if self.resource is not None:
+            try:
+                self.resource.close()
+            except Exception:
+                pass  # The link is already broken
+            self.resource = None
+
+    def _call(self, method, *args, retry=True, **kwargs):
+        with self.lock:
+            self.ensure_connected()
+            try:
+                return getattr(self.resource, method)(*args, **kwargs)
+            except Exception as e:
+                if not is_link_error(e):
+                    raise
+                self.reconnect()
+                if not retry:
+                    raise
+                return getattr(self.resource, method)(*args, **kwargs)
+
+    # The methods below mirror the pyvisa resource API used by the measurement code.
+    # A read is not retried because the response it waited for was lost with the old session.
+    def write(self, command):
+        return self._call('write', command)
+
+    def query(self, command):
+        return self._call('query', command)
+
+    def query_binary_values(self, command, **kwargs):
+        return self._call('query_binary_values', command, **kwargs)
+
+    def read(self):
+        return self._call('read', retry=False)
+
+    def clear(self):
+        return self._call('clear')
+
+    def close(self):
+        # Sessions are shared for the life of the process, see close_all_sessions()
+        pass
+
+    @property
+    def timeout(self):
+        return self.resource_timeout
+
+    @timeout.setter
+    def timeout(self, value):
+        with self.lock:
+            self.resource_timeout = value
+            if self.resource is not None:
+                self.resource.timeout = value
+
+    def metrics(self):
+        def summarize(durations):
+            if not durations:
+                return {'count': 0}
+            return {
+                'count': len(durations),
+                'last_ms': durations[-1] * 1e3,
+                'mean_ms': sum(durations) / len(durations) * 1e3,
+                'max_ms': max(durations) * 1e3,
+            }
+        return {'address': self.address, 'connect': summarize(self.connect_times),
+                'reconnect': summarize(self.reconnect_times)}
+
+
+_resource_manager = None
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+
+def get_session(address, open_resource=None):
+    global _resource_manager
+    with _sessions_lock:
+        if address not in _sessions:
+            if open_resource is None and _resource_manager is None:
+                import pyvisa
+                _resource_manager = pyvisa.ResourceManager()
+            _sessions[address] = VisaSession(address, _resource_manager, open_resource)
+        return _sessions[address]
+
+
+def session_metrics():
+    with _sessions_lock:
+        return [session.metrics() for session in _sessions.values()]
+
+
+def close_all_sessions():
+    global _resource_manager
+    with _sessions_lock:
+        for session in _sessions.values():
+            with session.lock:
+                session._discard()
+        _sessions.clear()
+        if _resource_manager is not None:
+            _resource_manager.close()
+            _resource_manager = None
+
+
+atexit.register(close_all_sessions)